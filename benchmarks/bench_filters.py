@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Measures how much time the filters (see src/filters.py) add to every read,
+for typical log output and for binary data full of control characters,
+at small and large read sizes.
+
+For every filter and case, it reports the throughput (in MB/s) and the
+time taken per chunk (in microseconds), as counted by the filter chain.
+
+    python3 benchmarks/bench_filters.py [--duration S] [--json]
+"""
+
+import argparse
+import random
+import time
+
+from common import load_package, print_results
+
+load_package()
+from serialconsole.filters import (  # noqa: E402
+    ControlCharFilter,
+    FilterChain,
+    NewlineFilter,
+    TimestampFilter,
+)
+
+CHUNK_SIZES = (64, 4096)
+FILTERS = {
+    "timestamps": TimestampFilter,
+    "newlines": NewlineFilter,
+    "control-chars": ControlCharFilter,
+    "all": lambda: [ControlCharFilter(), NewlineFilter(), TimestampFilter()],
+}
+
+
+def make_data(kind: str, size: int) -> bytes:
+    rng = random.Random(0)
+    if kind == "binary":
+        return bytes(rng.randrange(256) for _ in range(size))
+    lines = []
+    length = 0
+    while length < size:
+        line = b"[%12.6f] usb 1-%d: new high-speed USB device number %d\n" % (
+            rng.random() * 1000,
+            rng.randrange(8),
+            rng.randrange(128),
+        )
+        lines.append(line)
+        length += len(line)
+    return b"".join(lines)[:size]
+
+
+def run(name: str, kind: str, chunk_size: int, duration: float) -> dict:
+    stages = FILTERS[name]()
+    chain = FilterChain(stages if isinstance(stages, list) else [stages])
+    data = make_data(kind, 1024 * 1024)
+    chunks = [data[i : i + chunk_size] for i in range(0, len(data), chunk_size)]
+
+    processed = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < duration:
+        for chunk in chunks:
+            chain.process(chunk)
+        processed += len(data)
+
+    elapsed = sum(stats.time for stats in chain.stats) / 1e9
+    chunk_count = chain.stats[0].chunks
+    return {
+        "filter": name,
+        "data": kind,
+        "chunk_size": chunk_size,
+        "mb_per_s": processed / 1e6 / elapsed,
+        "us_per_chunk": elapsed * 1e6 / chunk_count,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--duration", type=float, default=1, help="seconds per case (default: 1)"
+    )
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    results = [
+        run(name, kind, chunk_size, args.duration)
+        for name in FILTERS
+        for kind in ("text", "binary")
+        for chunk_size in CHUNK_SIZES
+    ]
+    print_results(results, args.json)
+
+
+if __name__ == "__main__":
+    main()
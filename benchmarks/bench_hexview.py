@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Measures the cost of keeping received data for the hex view, and of
+showing it: storing reads, bringing the row model up to date once per
+frame, and creating the rows of a screenful at the end of the data.
+
+    python3 benchmarks/bench_hexview.py [--size MB] [--json]
+"""
+
+import argparse
+import os
+import time
+
+from common import load_package, print_results, use_source_schema
+
+# Reads per simulated frame, and rows on screen.
+READS_PER_FRAME = 16
+SCREEN_ROWS = 60
+
+
+def run(size: int, read_size: int) -> dict:
+    from serialconsole.hexview import ByteStore, HexRowModel
+
+    store = ByteStore()
+    model = HexRowModel(store)
+    data = os.urandom(read_size)
+
+    append_time = 0.0
+    frame_time = 0.0
+    frames = 0
+    written = 0
+    while written < size:
+        start = time.perf_counter()
+        for _i in range(READS_PER_FRAME):
+            store.append(data)
+        append_time += time.perf_counter() - start
+        written += READS_PER_FRAME * read_size
+
+        start = time.perf_counter()
+        model.update()
+        count = model.get_n_items()
+        for position in range(max(0, count - SCREEN_ROWS), count):
+            row = model.get_item(position)
+            row.hex + row.text
+        frame_time += time.perf_counter() - start
+        frames += 1
+
+    return {
+        "size_mb": written / 1e6,
+        "read_size": read_size,
+        "kept_mb": (store.end - store.start) / 1e6,
+        "rows": model.get_n_items(),
+        "append_mb_per_s": written / 1e6 / append_time,
+        "frame_us": frame_time * 1e6 / frames,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size", type=int, default=100, help="MB of received data")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    use_source_schema()
+    load_package()
+
+    results = [run(args.size * 1000 * 1000, read_size) for read_size in (64, 4096)]
+    print_results(results, args.json)
+
+
+if __name__ == "__main__":
+    main()
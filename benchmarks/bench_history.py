@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Measures how fast the session history takes in data and searches it, as
+done when searching the whole session from the search bar.
+
+The history is filled with generated log lines, then searched for plain
+text (case-sensitive and not) and for a regular expression. For every
+search, it reports the time taken and the search speed (in MB/s of
+uncompressed history), along with how much the blocks were compressed.
+
+    python3 benchmarks/bench_history.py [--size MB] [--json]
+"""
+
+import argparse
+import random
+import tempfile
+import time
+
+from common import load_package, print_results
+
+load_package()
+from serialconsole.history import HistorySearch, HistoryStore  # noqa: E402
+
+CHUNK_SIZE = 4096
+
+# (name, query, regex, case sensitive)
+SEARCHES = (
+    ("plain", "sensor 7: value=1", False, True),
+    ("plain-caseless", "SENSOR 7: VALUE=1", False, False),
+    ("regex", r"value=9\d{5}\b", True, True),
+)
+
+
+def make_chunk(rng: random.Random) -> bytes:
+    lines = []
+    size = 0
+    while size < CHUNK_SIZE:
+        line = b"[%10.6f] sensor %d: value=%d\r\n" % (
+            rng.random() * 1000,
+            rng.randrange(16),
+            rng.randrange(1 << 20),
+        )
+        lines.append(line)
+        size += len(line)
+    return b"".join(lines)[:CHUNK_SIZE]
+
+
+def fill(history: HistoryStore, size: int) -> float:
+    rng = random.Random(0)
+    chunks = [make_chunk(rng) for _ in range(64)]
+    start = time.perf_counter()
+    written = 0
+    while written < size:
+        for chunk in chunks:
+            history.write(chunk)
+        written += len(chunks) * CHUNK_SIZE
+    return time.perf_counter() - start
+
+
+def search(history: HistoryStore, query: str, regex: bool, case_sensitive: bool):
+    from gi.repository import GLib
+
+    context = GLib.MainContext.default()
+    start = time.perf_counter()
+    search = HistorySearch(
+        history.snapshot(), query, regex, case_sensitive, lambda s: None, lambda s: None
+    )
+    search.start()
+    iterations = 0
+    while not search.done:
+        context.iteration(True)
+        iterations += 1
+    return search, time.perf_counter() - start, iterations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size", type=int, default=1024, help="MB of history")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        history = HistoryStore(directory)
+        write_time = fill(history, args.size * 1000 * 1000)
+
+        # Let all blocks be compressed before searching
+        snapshot = history.snapshot()
+        while any(block.offset is None for block in snapshot.blocks[:-1]):
+            time.sleep(0.01)
+        compressed = sum(
+            block.offset[1] for block in snapshot.blocks if block.offset is not None
+        )
+
+        for name, query, regex, case_sensitive in SEARCHES:
+            found, elapsed, iterations = search(history, query, regex, case_sensitive)
+            results.append(
+                {
+                    "search": name,
+                    "size_mb": history.size / 1e6,
+                    "lines": history.line_count,
+                    "write_mb_per_s": history.size / 1e6 / write_time,
+                    "compression_ratio": history.size / (compressed or 1),
+                    "matches": found.count,
+                    "search_s": elapsed,
+                    "search_mb_per_s": history.size / 1e6 / elapsed,
+                    "main_loop_iterations": iterations,
+                }
+            )
+        history.close()
+
+    print_results(results, args.json)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Measures how fast LogFile writes received data, in text and binary mode.
+
+Text mode has to decode the data as UTF-8; this checks that it stays
+close to the speed of writing raw binary data.
+
+    python3 benchmarks/bench_logfile.py [--size MB] [--json]
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from common import load_package, print_results
+
+load_package()
+from serialconsole.logfile import LogFile  # noqa: E402
+
+CHUNK_SIZES = (64, 4096, 65536)
+
+
+def make_data(kind: str, size: int) -> bytes:
+    rng = random.Random(0)
+    if kind == "ascii":
+        line = b"[    1.234567] usb 1-1: new high-speed USB device number 2\r\n"
+        return (line * (size // len(line) + 1))[:size]
+    if kind == "utf-8":
+        line = "Zażółć gęślą jaźń — 日本語のログ ✓\r\n".encode("utf-8")
+        return (line * (size // len(line) + 1))[:size]
+    if kind == "binary":
+        return rng.randbytes(size)
+    raise ValueError(kind)
+
+
+def run(kind: str, binary: bool, chunk_size: int, data: bytes, directory: str):
+    path = os.path.join(directory, f"bench-{kind}-{chunk_size}.log")
+    log = LogFile(path, binary)
+    log.open()
+    chunks = [data[i : i + chunk_size] for i in range(0, len(data), chunk_size)]
+
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+    for chunk in chunks:
+        log.write(chunk)
+    log.close()
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - cpu_start
+
+    os.remove(path)
+    return {
+        "data": kind,
+        "mode": "binary" if binary else "text",
+        "chunk_size": chunk_size,
+        "mb_per_s": len(data) / elapsed / 1e6,
+        "cpu_s": cpu,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size", type=int, default=64, help="MB of data per run")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for kind in ("ascii", "utf-8", "binary"):
+            data = make_data(kind, args.size * 1000 * 1000)
+            for chunk_size in CHUNK_SIZES:
+                for binary in (True, False):
+                    results.append(run(kind, binary, chunk_size, data, directory))
+
+    print_results(results, args.json)
+
+
+if __name__ == "__main__":
+    main()
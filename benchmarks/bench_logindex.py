@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Measures how long the log viewer takes to open a large log and jump to a
+line or a point in time, with and without the index sidecar.
+
+With the sidecar, opening should take about the same time regardless of
+the size of the log; without it, the whole log has to be scanned.
+
+    python3 benchmarks/bench_logindex.py [--size MB] [--json]
+"""
+
+import argparse
+import mmap
+import os
+import random
+import tempfile
+import time
+
+from common import load_package, print_results
+
+load_package()
+from serialconsole.capture import RecordKind  # noqa: E402
+from serialconsole.logfile import CaptureFile, LogFile  # noqa: E402
+from serialconsole.logindex import LogIndex, get_index_path  # noqa: E402
+
+# Amount of random jumps to measure.
+JUMPS = 100
+CHUNK_SIZE = 4096
+
+
+def make_chunk(rng: random.Random) -> bytes:
+    lines = []
+    size = 0
+    while size < CHUNK_SIZE:
+        line = b"[%10.6f] sensor %d: value=%d\r\n" % (
+            rng.random() * 1000,
+            rng.randrange(16),
+            rng.randrange(1 << 20),
+        )
+        lines.append(line)
+        size += len(line)
+    return b"".join(lines)[:CHUNK_SIZE]
+
+
+def write_log(path: str, capture: bool, size: int):
+    rng = random.Random(0)
+    chunks = [make_chunk(rng) for _ in range(64)]
+    log = CaptureFile(path) if capture else LogFile(path, True)
+    log.open()
+    written = 0
+    timestamp = time.monotonic_ns()
+    while written < size:
+        if capture:
+            records = []
+            for chunk in chunks:
+                timestamp += 1000000
+                records.append((RecordKind.RX, timestamp, chunk))
+            log.write_records(records)
+        else:
+            for chunk in chunks:
+                log.write(chunk)
+        written += len(chunks) * CHUNK_SIZE
+    log.close()
+
+
+def run(path: str, capture: bool, sidecar: bool) -> dict:
+    if not sidecar:
+        os.remove(get_index_path(path))
+
+    start = time.perf_counter()
+    index = LogIndex(path)
+    index.load()
+    open_time = time.perf_counter() - start
+
+    rng = random.Random(1)
+    jump_times = []
+    with open(path, "rb") as file:
+        data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        for _ in range(JUMPS):
+            line = rng.randrange(index.line_count)
+            start = time.perf_counter()
+            chunk = index.find_line(line)
+            index.read_lines(data, chunk)
+            jump_times.append(time.perf_counter() - start)
+        data.close()
+
+    jump_times.sort()
+    return {
+        "format": "capture" if capture else "text",
+        "sidecar": sidecar,
+        "size_mb": os.path.getsize(path) / 1e6,
+        "lines": index.line_count,
+        "open_ms": open_time * 1000,
+        "jump_p50_ms": jump_times[len(jump_times) // 2] * 1000,
+        "jump_max_ms": jump_times[-1] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size", type=int, default=1024, help="MB of log data")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for capture in (False, True):
+            path = os.path.join(directory, "bench.sccap" if capture else "bench.log")
+            write_log(path, capture, args.size * 1000 * 1000)
+            for sidecar in (True, False):
+                results.append(run(path, capture, sidecar))
+            os.remove(path)
+
+    print_results(results, args.json)
+
+
+if __name__ == "__main__":
+    main()
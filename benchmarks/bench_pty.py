@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+"""
+Measures the read path of SerialHandler without hardware, using
+pseudo-terminals as stand-in serial devices.
+
+A separate writer process feeds the pty at a given rate and chunk pattern,
+while SerialHandler reads it and passes the data on to one of:
+
+ - reader: nothing, only read_done itself is measured;
+ - logger-text, logger-binary: a SerialLogger writing a text/binary log;
+ - terminal: a VTE terminal, as in SerialSession.terminal_read (needs a
+   display; skipped without one).
+
+For every run, it reports the sustained throughput, the latency from the
+write to the end of the read_done handler (percentiles, in ms), the CPU
+time used by the app (the writer runs in its own process), the amount of
+read_done emissions and main loop iterations, and how much the resident
+memory grew.
+
+    python3 benchmarks/bench_pty.py [--path PATH] [--pattern PATTERN]
+        [--rate KB/S] [--size MB] [--json]
+"""
+
+import argparse
+import array
+import bisect
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import load_package, print_results, use_source_schema
+
+PATHS = ("reader", "logger-text", "logger-binary", "terminal")
+PATTERNS = {
+    # Interactive use: a line at a time
+    "line": 64,
+    # Bulk output, e.g. a boot log or a hexdump
+    "fixed": 4096,
+    # Chunks of random size, up to the chunk size
+    "random": 4096,
+    # Bursts of 16 chunks, then a pause
+    "burst": 1024,
+}
+BURST_CHUNKS = 16
+# Pause after a burst when the rate is unlimited (in seconds).
+BURST_PAUSE = 0.01
+# Time to wait for the data to arrive after the writer is done (in seconds).
+DRAIN_TIMEOUT = 10
+
+LINE = b"[%10.6f] the quick brown fox jumps over the lazy dog %08x\r\n"
+
+
+def make_chunks(pattern: str, chunk_size: int, size: int, seed: int = 0):
+    """Yields the chunks written for a pattern, as printable log lines."""
+    rng = random.Random(seed)
+    text = b"".join(LINE % (i / 1000, rng.getrandbits(32)) for i in range(4096))
+    position = 0
+    while position < size:
+        length = chunk_size
+        if pattern == "random":
+            length = rng.randint(1, chunk_size)
+        length = min(length, size - position)
+        start = position % (len(text) - chunk_size)
+        yield text[start : start + length]
+        position += length
+
+
+def writer_main(args: argparse.Namespace):
+    """
+    Writes the data to the pty master, then stores the end offset and send
+    time (time.monotonic_ns()) of every chunk in the times file.
+    """
+    fd = args.writer_fd
+    rate = args.rate * 1000
+    offsets = array.array("q")
+    times = array.array("q")
+    start = time.monotonic()
+    position = 0
+
+    for i, chunk in enumerate(
+        make_chunks(args.pattern, PATTERNS[args.pattern], args.size * 1000 * 1000)
+    ):
+        if rate:
+            delay = start + position / rate - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        elif args.pattern == "burst" and i and i % BURST_CHUNKS == 0:
+            time.sleep(BURST_PAUSE)
+
+        view = memoryview(chunk)
+        while view:
+            view = view[os.write(fd, view) :]
+        position += len(chunk)
+        offsets.append(position)
+        times.append(time.monotonic_ns())
+
+    with open(args.writer_times, "wb") as file:
+        offsets.tofile(file)
+        times.tofile(file)
+
+
+def get_rss() -> int:
+    """Returns the current resident memory of the process, in bytes."""
+    with open("/proc/self/statm") as file:
+        return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def percentile(values: list, percent: float) -> float:
+    if not values:
+        return 0
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+def make_consumer(path: str, handler, directory: str):
+    """
+    Sets up what consumes the data read by the handler. Returns a
+    (feed, close) tuple, or None if the path can't run here.
+    """
+    from serialconsole.config import config
+    from serialconsole.logger import SerialLogger
+
+    if path == "reader":
+        return (lambda data: None), (lambda: None)
+
+    if path in ("logger-text", "logger-binary"):
+        config["log-binary"] = path == "logger-binary"
+        config["log-capture"] = False
+        config["log-path"] = os.path.join(directory, f"bench-{path}.log")
+        logger = SerialLogger(handler)
+        return (lambda data: None), logger.shutdown
+
+    if path == "terminal":
+        from gi.repository import Gtk, Vte
+
+        if not Gtk.init_check():
+            return None
+        terminal = Vte.Terminal()
+        terminal.set_scrollback_lines(10000)
+        return (lambda data: terminal.feed(data)), (lambda: None)
+
+    raise ValueError(path)
+
+
+def run(args: argparse.Namespace, path: str, pattern: str, directory: str):
+    from gi.repository import GLib
+    from serialconsole.serial import SerialHandler
+
+    size = args.size * 1000 * 1000
+    master, slave = os.openpty()
+    handler = SerialHandler()
+    handler.port = os.ttyname(slave)
+    handler.read_delivery_interval = args.delivery_interval
+
+    consumer = make_consumer(path, handler, directory)
+    if consumer is None:
+        os.close(master)
+        os.close(slave)
+        print(f"Skipping {path}: no display", file=sys.stderr)
+        return None
+    feed, close_consumer = consumer
+
+    received = 0
+    emissions = 0
+    delivered_offsets = []
+    delivered_times = []
+
+    def on_read(handler, data):
+        nonlocal received, emissions
+        data = data.get_data()
+        feed(data)
+        received += len(data)
+        emissions += 1
+        delivered_offsets.append(received)
+        delivered_times.append(time.monotonic_ns())
+
+    handler.connect("read_done", on_read)
+
+    rss_start = get_rss()
+    usage_start = resource.getrusage(resource.RUSAGE_SELF)
+    handler.open()
+    os.close(slave)
+
+    times_path = os.path.join(directory, "writer-times")
+    writer = subprocess.Popen(
+        [
+            sys.executable,
+            os.path.abspath(__file__),
+            "--writer-fd",
+            str(master),
+            "--writer-times",
+            times_path,
+            "--pattern",
+            pattern,
+            "--rate",
+            str(args.rate),
+            "--size",
+            str(args.size),
+        ],
+        pass_fds=(master,),
+    )
+
+    context = GLib.MainContext.default()
+    iterations = 0
+    timed_out = False
+    drain_timeout = None
+
+    def on_timeout():
+        nonlocal timed_out
+        timed_out = True
+        return False
+
+    def on_writer_exit(pid, status):
+        # Give the rest of the data some time to arrive
+        nonlocal drain_timeout
+        drain_timeout = GLib.timeout_add_seconds(DRAIN_TIMEOUT, on_timeout)
+
+    GLib.child_watch_add(GLib.PRIORITY_DEFAULT, writer.pid, on_writer_exit)
+
+    start = time.monotonic()
+    while received < size and not timed_out:
+        context.iteration(True)
+        iterations += 1
+    elapsed = time.monotonic() - start
+
+    while drain_timeout is None:
+        context.iteration(True)
+    if not timed_out:
+        GLib.source_remove(drain_timeout)
+    writer.wait()
+    handler.close()
+    close_consumer()
+    os.close(master)
+    usage_end = resource.getrusage(resource.RUSAGE_SELF)
+    rss_end = get_rss()
+
+    with open(times_path, "rb") as file:
+        sent = array.array("q")
+        sent.frombytes(file.read())
+    chunks = len(sent) // 2
+    sent_offsets, sent_times = sent[:chunks], sent[chunks:]
+
+    latencies = []
+    for offset, sent_time in zip(sent_offsets, sent_times, strict=True):
+        i = bisect.bisect_left(delivered_offsets, offset)
+        if i < len(delivered_offsets):
+            latencies.append((delivered_times[i] - sent_time) / 1e6)
+    latencies.sort()
+
+    cpu = (usage_end.ru_utime - usage_start.ru_utime) + (
+        usage_end.ru_stime - usage_start.ru_stime
+    )
+    return {
+        "path": path,
+        "pattern": pattern,
+        "rate_kbps": args.rate,
+        "mb": received / 1e6,
+        "complete": received == size,
+        "mb_per_s": received / 1e6 / elapsed,
+        "latency_p50_ms": percentile(latencies, 50),
+        "latency_p90_ms": percentile(latencies, 90),
+        "latency_p99_ms": percentile(latencies, 99),
+        "latency_max_ms": latencies[-1] if latencies else 0,
+        "cpu_s": cpu,
+        "cpu_percent": cpu / elapsed * 100,
+        "read_done": emissions,
+        "iterations": iterations,
+        "rss_growth_mb": (rss_end - rss_start) / 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--path",
+        action="append",
+        choices=PATHS,
+        help="read path to measure; can be given multiple times (default: all)",
+    )
+    parser.add_argument(
+        "--pattern",
+        action="append",
+        choices=PATTERNS.keys(),
+        help="chunk pattern to write; can be given multiple times (default: all)",
+    )
+    parser.add_argument(
+        "--rate", type=int, default=0, help="KB/s to write (default: unlimited)"
+    )
+    parser.add_argument("--size", type=int, default=16, help="MB of data per run")
+    parser.add_argument(
+        "--delivery-interval",
+        type=int,
+        default=16,
+        help="minimum time between read_done emissions, in ms (default: 16)",
+    )
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    parser.add_argument("--writer-fd", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--writer-times", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.writer_fd is not None:
+        args.pattern = args.pattern[0]
+        writer_main(args)
+        return
+
+    import gi
+
+    gi.require_version("Gtk", "4.0")
+    gi.require_version("Vte", "3.91")
+    use_source_schema()
+    load_package()
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for path in args.path or PATHS:
+            for pattern in args.pattern or PATTERNS:
+                result = run(args, path, pattern, directory)
+                if result is not None:
+                    results.append(result)
+
+    print_results(results, args.json)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Measures how fast SerialHandler reconnects to a device that was unplugged
+and plugged back in, using a simulated hotplug.
+
+The "device" is a pseudo-terminal, linked to from a stand-in for /dev
+(and /dev/serial/by-id) in a temporary directory: unplugging removes the
+links and closes the pty, plugging in creates a new pty and links it.
+With --rename, the device comes back under another name each time (as
+ttyUSB1 turning into ttyUSB2), so it can only be found again through its
+by-id link.
+
+For every run, it reports the time from the device being plugged back in
+to the port having been reopened (as seen by a traffic listener), and the
+reconnect-latency property of the handler, which counts from the ctime of
+the device node (here, the link to the pty), so the two should agree
+closely. With --max-latency, it exits
+with an error if any reconnection took longer, for use in CI.
+
+    python3 benchmarks/bench_reconnect.py [--runs N] [--downtime MS]
+        [--rename] [--max-latency MS] [--json]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+from common import load_package, print_results, use_source_schema
+
+# Time to wait for a reconnection before giving up (in seconds).
+RECONNECT_TIMEOUT = 5
+
+
+class SimulatedDevice:
+    """A pty that can be plugged in and unplugged under a device directory."""
+
+    def __init__(self, directory: str, by_id_dir: str):
+        self.directory = directory
+        self.by_id_dir = by_id_dir
+        self.name = None
+        self.master = self.slave = None
+
+    @property
+    def path(self) -> str:
+        return os.path.join(self.directory, self.name)
+
+    def plug(self, name: str, with_id: bool):
+        self.name = name
+        self.master, self.slave = os.openpty()
+        os.symlink(os.ttyname(self.slave), self.path)
+        if with_id:
+            os.makedirs(self.by_id_dir, exist_ok=True)
+            os.symlink(
+                os.path.relpath(self.path, self.by_id_dir),
+                os.path.join(self.by_id_dir, "usb-SerialConsole_Bench-if00"),
+            )
+
+    def unplug(self):
+        # udev removes the by-id directory along with the last link in it
+        if os.path.isdir(self.by_id_dir):
+            for name in os.listdir(self.by_id_dir):
+                os.unlink(os.path.join(self.by_id_dir, name))
+            os.rmdir(self.by_id_dir)
+        os.unlink(self.path)
+        os.close(self.slave)
+        os.close(self.master)
+
+
+def wait_for(context, condition) -> bool:
+    from gi.repository import GLib
+
+    timed_out = False
+
+    def on_timeout():
+        nonlocal timed_out
+        timed_out = True
+        return False
+
+    timeout = GLib.timeout_add_seconds(RECONNECT_TIMEOUT, on_timeout)
+    while not condition() and not timed_out:
+        context.iteration(True)
+    if not timed_out:
+        GLib.source_remove(timeout)
+    return not timed_out
+
+
+def run(args: argparse.Namespace, directory: str) -> dict:
+    from gi.repository import GLib
+    from serialconsole import portmonitor
+    from serialconsole.capture import RecordKind
+    from serialconsole.serial import SerialHandler, SerialHandlerState
+
+    portmonitor.BY_ID_DIR = os.path.join(directory, "serial", "by-id")
+    device = SimulatedDevice(directory, portmonitor.BY_ID_DIR)
+    device.plug("ttyUSB1", args.rename)
+
+    handler = SerialHandler()
+    handler.port = device.path
+    handler.reconnect_automatically = True
+
+    reconnected_at = None
+
+    def on_traffic(kind, timestamp, payload):
+        nonlocal reconnected_at
+        if kind == RecordKind.EVENT and payload.startswith("Reconnected"):
+            reconnected_at = timestamp
+
+    def is_reconnected():
+        return reconnected_at is not None and handler.state == SerialHandlerState.OPEN
+
+    handler.add_traffic_listener(on_traffic)
+    handler.open()
+
+    context = GLib.MainContext.default()
+    latencies = []
+    reported = []
+    failed = 0
+    for i in range(args.runs):
+        device.unplug()
+        wait_for(context, lambda: handler.state == SerialHandlerState.RECONNECTING)
+        time.sleep(args.downtime / 1000)
+
+        name = f"ttyUSB{i % 2 + 2}" if args.rename else device.name
+        reconnected_at = None
+        plugged_at = time.monotonic_ns()
+        device.plug(name, args.rename)
+        if not wait_for(context, is_reconnected):
+            failed += 1
+            continue
+        latencies.append((reconnected_at - plugged_at) / 1e6)
+        reported.append(handler.reconnect_latency)
+
+    handler.close()
+    device.unplug()
+
+    latencies.sort()
+    return {
+        "rename": args.rename,
+        "downtime_ms": args.downtime,
+        "runs": args.runs,
+        "failed": failed,
+        "latency_p50_ms": latencies[len(latencies) // 2] if latencies else 0,
+        "latency_max_ms": latencies[-1] if latencies else 0,
+        "reported_max_ms": max(reported, default=0),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=20, help="amount of replugs")
+    parser.add_argument(
+        "--downtime",
+        type=int,
+        default=100,
+        help="time the device stays unplugged, in ms (default: 100)",
+    )
+    parser.add_argument(
+        "--rename",
+        action="store_true",
+        help="bring the device back under another name, with a by-id link",
+    )
+    parser.add_argument(
+        "--max-latency",
+        type=float,
+        help="fail if a reconnection takes longer than this many ms",
+    )
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    use_source_schema()
+    load_package()
+
+    with tempfile.TemporaryDirectory() as directory:
+        result = run(args, directory)
+    print_results([result], args.json)
+
+    if result["failed"] or (
+        args.max_latency is not None and result["latency_max_ms"] > args.max_latency
+    ):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Measures how long SerialHandler takes to close and reopen a port, as done
+by scripts that reopen ports over and over, using a pseudo-terminal as a
+stand-in serial device.
+
+The cycle is measured on:
+
+ - idle: a silent port;
+ - flood: a port that a separate process keeps writing to;
+ - pending-tx: a port whose other end never reads, with data still queued
+   for sending when it is closed.
+
+For every case, it reports the time taken by open() and close()
+(percentiles, in ms) and the amount of cycles per second, main loop
+dispatching included.
+
+    python3 benchmarks/bench_reopen.py [--cycles N] [--json]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+from common import load_package, print_results, use_source_schema
+
+CASES = ("idle", "flood", "pending-tx")
+# Amount of data queued for sending before closing, for pending-tx.
+PENDING_TX_SIZE = 65536
+
+FLOOD_WRITER = """
+import os, sys
+fd = int(sys.argv[1])
+data = b"x" * 4096
+while True:
+    try:
+        os.write(fd, data)
+    except OSError:
+        break
+"""
+
+
+def percentile(values: list, percent: float) -> float:
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+def run(case: str, cycles: int) -> dict:
+    from gi.repository import GLib
+    from serialconsole.serial import SerialHandler
+
+    master, slave = os.openpty()
+    handler = SerialHandler()
+    handler.port = os.ttyname(slave)
+    os.close(slave)
+
+    writer = None
+    if case == "flood":
+        writer = subprocess.Popen(
+            [sys.executable, "-c", FLOOD_WRITER, str(master)], pass_fds=(master,)
+        )
+
+    context = GLib.MainContext.default()
+    open_times = []
+    close_times = []
+    start = time.perf_counter()
+    for _i in range(cycles):
+        before = time.perf_counter()
+        handler.open()
+        opened = time.perf_counter()
+        if case == "pending-tx":
+            handler.write(b"y" * PENDING_TX_SIZE)
+        while context.iteration(False):
+            pass
+        before_close = time.perf_counter()
+        handler.close()
+        closed = time.perf_counter()
+        while context.iteration(False):
+            pass
+        open_times.append((opened - before) * 1000)
+        close_times.append((closed - before_close) * 1000)
+    elapsed = time.perf_counter() - start
+
+    if writer is not None:
+        writer.kill()
+        writer.wait()
+    os.close(master)
+
+    open_times.sort()
+    close_times.sort()
+    return {
+        "case": case,
+        "cycles": cycles,
+        "cycles_per_s": cycles / elapsed,
+        "open_p50_ms": percentile(open_times, 50),
+        "open_p99_ms": percentile(open_times, 99),
+        "open_max_ms": open_times[-1],
+        "close_p50_ms": percentile(close_times, 50),
+        "close_p99_ms": percentile(close_times, 99),
+        "close_max_ms": close_times[-1],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--case",
+        action="append",
+        choices=CASES,
+        help="case to measure; can be given multiple times (default: all)",
+    )
+    parser.add_argument("--cycles", type=int, default=500, help="cycles per case")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    use_source_schema()
+    load_package()
+
+    results = [run(case, args.cycles) for case in args.case or CASES]
+    print_results(results, args.json)
+
+
+if __name__ == "__main__":
+    main()
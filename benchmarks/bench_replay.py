@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Measures how fast received data makes it through the serial handler and
+the logger, without any hardware, by replaying a generated capture as fast
+as possible.
+
+The whole read path runs just like with a real device (reactor thread,
+read buffer, read_done on the main loop and the log writer), so this gives
+the upper bound of the throughput the app can sustain.
+
+    python3 benchmarks/bench_replay.py [--size MB] [--json]
+"""
+
+import argparse
+import os
+import random
+import resource
+import tempfile
+import time
+
+from common import load_package, print_results, use_source_schema
+
+use_source_schema()
+load_package()
+from gi.repository import GLib  # noqa: E402
+
+from serialconsole.capture import RecordKind  # noqa: E402
+from serialconsole.logfile import CaptureFile, LogFile, LogWriter  # noqa: E402
+from serialconsole.replay import ReplayHandler  # noqa: E402
+
+RECORD_SIZES = (64, 4096, 65536)
+
+
+def write_capture(path: str, record_size: int, size: int):
+    rng = random.Random(0)
+    payloads = [rng.randbytes(record_size) for _ in range(64)]
+    capture = CaptureFile(path)
+    capture.open()
+    timestamp = time.monotonic_ns()
+    written = 0
+    while written < size:
+        records = []
+        for payload in payloads:
+            timestamp += 1000
+            records.append((RecordKind.RX, timestamp, payload))
+        capture.write_records(records)
+        written += len(payloads) * record_size
+    capture.close()
+
+
+def run(path: str, record_size: int, log_path: str = None) -> dict:
+    handler = ReplayHandler(path)
+    handler.speed = 0
+    loop = GLib.MainLoop()
+    received = 0
+    emissions = 0
+
+    log = None
+    if log_path:
+        log = LogWriter(LogFile(log_path, True))
+        log.open()
+
+    def on_read(handler, data):
+        nonlocal received, emissions
+        data = data.get_data()
+        received += len(data)
+        emissions += 1
+        if log:
+            log.write(data)
+
+    handler.connect("read_done", on_read)
+    handler.connect("message", lambda *args: loop.quit())
+
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+    handler.open()
+    loop.run()
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - cpu_start
+    if log:
+        log.close()
+
+    return {
+        "record_size": record_size,
+        "logged": log is not None,
+        "mb": received / 1e6,
+        "mb_per_s": received / 1e6 / elapsed,
+        "read_done": emissions,
+        "cpu_percent": cpu / elapsed * 100,
+        "dropped": handler._read_buffer.dropped,
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size", type=int, default=256, help="MB of replayed data")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for record_size in RECORD_SIZES:
+            path = os.path.join(directory, f"bench-{record_size}.sccap")
+            log_path = os.path.join(directory, f"bench-{record_size}.log")
+            write_capture(path, record_size, args.size * 1000 * 1000)
+            results.append(run(path, record_size))
+            results.append(run(path, record_size, log_path))
+
+    print_results(results, args.json)
+
+
+if __name__ == "__main__":
+    main()
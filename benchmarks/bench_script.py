@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Measures how fast a script (see src/script.py) keeps up with a chatty
+console: received data is fed in from one thread while a script thread
+waits for a prompt that shows up every so often, as when scripting a
+shell on a device that logs to its console all the time.
+
+For every read size, it reports the throughput (in MB/s), the time from
+a prompt being received to expect() returning, and the largest amount of
+data kept for expect().
+
+    python3 benchmarks/bench_script.py [--size MB] [--json]
+"""
+
+import argparse
+import threading
+import time
+
+from common import load_package, print_results, use_source_schema
+
+use_source_schema()
+load_package()
+from serialconsole.script import ScriptConsole  # noqa: E402
+
+READ_SIZES = (64, 4096)
+# Amount of log output between two prompts (in bytes).
+PROMPT_INTERVAL = 1024 * 1024
+LINE = b"[  123.456789] usb 1-1: new high-speed USB device number 3 using xhci\r\n"
+
+
+def run(size: int, read_size: int) -> dict:
+    output = LINE * (PROMPT_INTERVAL // len(LINE))
+    chunks = [output[i : i + read_size] for i in range(0, len(output), read_size)]
+    prompts = size // len(output)
+
+    console = ScriptConsole(lambda data: None)
+    latencies = []
+    max_buffer = 0
+    prompt_time = [0.0]
+    received = threading.Event()
+
+    def feed():
+        nonlocal max_buffer
+        for _i in range(prompts):
+            for chunk in chunks:
+                console.feed(chunk)
+            max_buffer = max(max_buffer, len(console._buffer))
+            received.clear()
+            prompt_time[0] = time.perf_counter()
+            console.feed(b"root@device:~# ")
+            received.wait()
+
+    feeder = threading.Thread(target=feed)
+    start = time.perf_counter()
+    feeder.start()
+    for _i in range(prompts):
+        console.expect([r"\w+@[\w-]+:[^#$]*[#$] ", "Password:"], timeout=60)
+        latencies.append(time.perf_counter() - prompt_time[0])
+        received.set()
+    feeder.join()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "read_size": read_size,
+        "mb_per_s": prompts * len(output) / 1e6 / elapsed,
+        "latency_p50_us": latencies[len(latencies) // 2] * 1e6,
+        "latency_max_us": latencies[-1] * 1e6,
+        "max_buffer_kb": max_buffer / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size", type=int, default=100, help="MB of console output")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    results = [run(args.size * 1024 * 1024, read_size) for read_size in READ_SIZES]
+    print_results(results, args.json)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Measures how much time matching triggers (see src/triggers.py) adds to
+every read, with a growing amount of literal and regular expression
+triggers, at small and large read sizes.
+
+    python3 benchmarks/bench_triggers.py [--duration S] [--json]
+"""
+
+import argparse
+import random
+import time
+
+from common import load_package, print_results
+
+load_package()
+from serialconsole.triggers import Trigger, TriggerAction, TriggerEngine  # noqa: E402
+
+CHUNK_SIZES = (64, 4096)
+TRIGGER_COUNTS = (1, 10, 100)
+WORDS = ("login", "Hit any key", "panic", "U-Boot", "error", "Oops", "reboot")
+
+
+def make_data(size: int) -> bytes:
+    rng = random.Random(0)
+    lines = []
+    length = 0
+    while length < size:
+        line = b"[%12.6f] usb 1-%d: new high-speed USB device number %d\n" % (
+            rng.random() * 1000,
+            rng.randrange(8),
+            rng.randrange(128),
+        )
+        lines.append(line)
+        length += len(line)
+    return b"".join(lines)[:size]
+
+
+def make_triggers(kind: str, count: int) -> list:
+    # Patterns that start differently, as the regex engine skips ahead
+    # faster to patterns with a common prefix
+    words = [WORDS[i % len(WORDS)] + str(i) for i in range(count)]
+    if kind == "literal":
+        return [Trigger(word, False, TriggerAction.MARK) for word in words]
+    return [Trigger(rf"{word}:\s*\d+", True, TriggerAction.MARK) for word in words]
+
+
+def run(kind: str, count: int, chunk_size: int, duration: float) -> dict:
+    engine = TriggerEngine()
+    engine.set_triggers(make_triggers(kind, count))
+    data = make_data(1024 * 1024)
+    chunks = [data[i : i + chunk_size] for i in range(0, len(data), chunk_size)]
+
+    processed = 0
+    elapsed = 0.0
+    while elapsed < duration:
+        start = time.perf_counter()
+        for chunk in chunks:
+            engine.feed(chunk)
+        elapsed += time.perf_counter() - start
+        processed += len(data)
+
+    return {
+        "triggers": kind,
+        "count": count,
+        "chunk_size": chunk_size,
+        "mb_per_s": processed / 1e6 / elapsed,
+        "us_per_chunk": elapsed * 1e6 * chunk_size / processed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--duration", type=float, default=1, help="seconds per case (default: 1)"
+    )
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    results = [
+        run(kind, count, chunk_size, args.duration)
+        for kind in ("literal", "regex")
+        for count in TRIGGER_COUNTS
+        for chunk_size in CHUNK_SIZES
+    ]
+    print_results(results, args.json)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Shared helpers for the benchmarks.
+
+The benchmarks run straight from the source tree; the src directory is
+imported as the serialconsole package, just like the installed app does.
+"""
+
+import atexit
+import gettext
+import importlib.util
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC_DIR = os.path.join(ROOT_DIR, "src")
+APP_ID = "com.github.knuxify.SerialConsole"
+
+
+def load_package():
+    """Imports the source tree as the serialconsole package."""
+    if "serialconsole" in sys.modules:
+        return sys.modules["serialconsole"]
+
+    gettext.install(APP_ID)
+    spec = importlib.util.spec_from_file_location(
+        "serialconsole",
+        os.path.join(SRC_DIR, "__init__.py"),
+        submodule_search_locations=[SRC_DIR],
+    )
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["serialconsole"] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def use_source_schema():
+    """
+    Compiles the settings schema from the source tree and makes GSettings
+    use it with the in-memory backend, so that modules which read the
+    config can be imported without installing the app, and benchmarks
+    never touch the user's settings. Must be called before load_package().
+    """
+    schema_dir = tempfile.mkdtemp(prefix="serialconsole-schema-")
+    atexit.register(shutil.rmtree, schema_dir, ignore_errors=True)
+    with open(os.path.join(ROOT_DIR, "data", APP_ID + ".gschema.xml.in")) as file:
+        schema = file.read().replace("@APP_ID@", APP_ID)
+    with open(os.path.join(schema_dir, APP_ID + ".gschema.xml"), "w") as file:
+        file.write(schema)
+    subprocess.run(["glib-compile-schemas", schema_dir], check=True)
+    os.environ["GSETTINGS_SCHEMA_DIR"] = schema_dir
+    os.environ["GSETTINGS_BACKEND"] = "memory"
+
+
+def get_system_info() -> dict:
+    """Describes what the benchmark ran on, so results can be compared."""
+    try:
+        revision = subprocess.run(
+            ["git", "-C", ROOT_DIR, "describe", "--always", "--dirty"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        revision = None
+    return {
+        "revision": revision,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+
+def print_results(results: list, as_json: bool = False):
+    """
+    Prints a list of result dicts, either as a table or as JSON (one
+    object with a "results" list, along with a "system" description)
+    for tracking results across releases.
+    """
+    if as_json:
+        json.dump(
+            {"system": get_system_info(), "results": results}, sys.stdout, indent=2
+        )
+        sys.stdout.write("\n")
+        return
+
+    if not results:
+        return
+    columns = list(results[0].keys())
+    rows = [[_format(result.get(column)) for column in columns] for result in results]
+    widths = [
+        max(len(column), *(len(row[i]) for row in rows))
+        for i, column in enumerate(columns)
+    ]
+    print(
+        "  ".join(
+            column.ljust(width) for column, width in zip(columns, widths, strict=True)
+        )
+    )
+    for row in rows:
+        print(
+            "  ".join(
+                value.ljust(width) for value, width in zip(row, widths, strict=True)
+            )
+        )
+
+
+def _format(value) -> str:
+    if isinstance(value, float):
+        return f"{value:.2f}"
+    return str(value)
@@ -0,0 +1,301 @@
+"""
+Contains an asyncio-based serial session, for use by automation code
+that runs on an asyncio event loop rather than the GLib main loop.
+"""
+
+import asyncio
+import os
+import serial
+
+from .portsettings import PortSettings
+
+# Maximum amount of bytes read from the device in one go.
+DEFAULT_READ_CHUNK_SIZE = 65536
+# Amount of unread data after which reading from the device is paused
+# until the consumer catches up.
+DEFAULT_LIMIT = 4 * 1024 * 1024
+
+
+class AsyncSerialSession:
+    """
+    Serial session driven by an asyncio event loop.
+
+    The device is opened in non-blocking mode and watched with the event
+    loop's reader/writer callbacks, so any number of sessions can share
+    a single thread.
+
+    The API mirrors asyncio.StreamReader/StreamWriter:
+
+        async with AsyncSerialSession(PortSettings("/dev/ttyUSB0")) as s:
+            s.write(b"help\\r")
+            await s.drain()
+            print(await s.readuntil(b"=> "))
+    """
+
+    def __init__(
+        self,
+        settings: PortSettings,
+        read_chunk_size: int = DEFAULT_READ_CHUNK_SIZE,
+        limit: int = DEFAULT_LIMIT,
+    ):
+        self.settings = settings
+        self.read_chunk_size = read_chunk_size
+        self.limit = limit
+
+        self.serial = serial.Serial()
+        self._loop = None
+        self._fd = None
+        self._buffer = bytearray()
+        self._eof = False
+        self._exception = None
+        self._reading_paused = False
+        self._read_waiter = None
+        self._write_buffer = bytearray()
+        self._drain_waiter = None
+
+    @property
+    def is_open(self) -> bool:
+        return self._fd is not None
+
+    async def open(self):
+        """Opens the serial port."""
+        if self._fd is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self.settings.apply(self.serial)
+        self.serial.open()
+
+        self._fd = self.serial.fileno()
+        os.set_blocking(self._fd, False)
+        self._buffer.clear()
+        self._write_buffer.clear()
+        self._eof = False
+        self._exception = None
+        self._reading_paused = False
+        self._loop.add_reader(self._fd, self._on_readable)
+
+    async def close(self):
+        """Closes the serial port. Unwritten data is discarded."""
+        if self._fd is None:
+            return
+        self._loop.remove_reader(self._fd)
+        self._loop.remove_writer(self._fd)
+        self._fd = None
+        self.serial.close()
+        self._set_eof()
+        self._wake_drain_waiter()
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    # Reading
+
+    def _wake_read_waiter(self):
+        waiter = self._read_waiter
+        if waiter is not None:
+            self._read_waiter = None
+            if not waiter.done():
+                waiter.set_result(None)
+
+    def _set_eof(self, exception: Exception = None):
+        self._eof = True
+        if exception is not None and self._exception is None:
+            self._exception = exception
+        self._wake_read_waiter()
+
+    def _on_readable(self):
+        try:
+            data = os.read(self._fd, self.read_chunk_size)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            self._connection_lost(e)
+            return
+
+        if not data:
+            self._connection_lost(None)
+            return
+
+        self._buffer += data
+        if len(self._buffer) >= self.limit and not self._reading_paused:
+            self._loop.remove_reader(self._fd)
+            self._reading_paused = True
+        self._wake_read_waiter()
+
+    def _connection_lost(self, exception: Exception):
+        self._loop.remove_reader(self._fd)
+        self._loop.remove_writer(self._fd)
+        self._set_eof(exception)
+        self._wake_drain_waiter()
+
+    def _maybe_resume_reading(self):
+        if (
+            self._reading_paused
+            and self._fd is not None
+            and len(self._buffer) < self.limit
+        ):
+            self._reading_paused = False
+            self._loop.add_reader(self._fd, self._on_readable)
+
+    async def _wait_for_data(self):
+        if self._read_waiter is not None:
+            raise RuntimeError("read() called while another read is waiting")
+        # The reader needs more data than the limit (e.g. readexactly() of
+        # a large block), so keep reading
+        if self._reading_paused and self._fd is not None:
+            self._reading_paused = False
+            self._loop.add_reader(self._fd, self._on_readable)
+        self._read_waiter = self._loop.create_future()
+        try:
+            await self._read_waiter
+        finally:
+            self._read_waiter = None
+
+    async def read(self, n: int = -1) -> bytes:
+        """
+        Reads up to n bytes (or everything that is available if n is -1),
+        waiting until at least one byte is available.
+
+        Returns an empty bytes object once the port was closed or lost.
+        """
+        if n == 0:
+            return b""
+        while not self._buffer and not self._eof:
+            await self._wait_for_data()
+
+        if n < 0:
+            data = bytes(self._buffer)
+            self._buffer.clear()
+        else:
+            data = bytes(self._buffer[:n])
+            del self._buffer[:n]
+        self._maybe_resume_reading()
+        return data
+
+    async def readexactly(self, n: int) -> bytes:
+        """
+        Reads exactly n bytes. Raises asyncio.IncompleteReadError if the
+        port is lost before that.
+        """
+        while len(self._buffer) < n:
+            if self._eof:
+                partial = bytes(self._buffer)
+                self._buffer.clear()
+                raise asyncio.IncompleteReadError(partial, n)
+            await self._wait_for_data()
+
+        data = bytes(self._buffer[:n])
+        del self._buffer[:n]
+        self._maybe_resume_reading()
+        return data
+
+    async def readuntil(self, separator: bytes = b"\n") -> bytes:
+        """
+        Reads until separator is found and returns the data including
+        the separator.
+
+        Raises asyncio.IncompleteReadError if the port is lost before the
+        separator is found, and asyncio.LimitOverrunError if no separator
+        shows up within the first limit bytes.
+        """
+        if not separator:
+            raise ValueError("Separator should be at least one-byte string")
+
+        offset = 0
+        while True:
+            pos = self._buffer.find(separator, offset)
+            if pos != -1:
+                end = pos + len(separator)
+                break
+
+            # Only search the new data next time, including a possibly
+            # partial separator at the end of the buffer.
+            offset = max(0, len(self._buffer) - len(separator) + 1)
+            # The same bound as the one reading is paused at, so that
+            # readuntil() does not wait for data that is never read
+            if len(self._buffer) >= self.limit:
+                raise asyncio.LimitOverrunError(
+                    "Separator is not found, and chunk exceed the limit", offset
+                )
+            if self._eof:
+                partial = bytes(self._buffer)
+                self._buffer.clear()
+                raise asyncio.IncompleteReadError(partial, None)
+            self._maybe_resume_reading()
+            await self._wait_for_data()
+
+        data = bytes(self._buffer[:end])
+        del self._buffer[:end]
+        self._maybe_resume_reading()
+        return data
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> bytes:
+        data = await self.read()
+        if not data:
+            if self._exception is not None:
+                raise self._exception
+            raise StopAsyncIteration
+        return data
+
+    # Writing
+
+    def _wake_drain_waiter(self):
+        waiter = self._drain_waiter
+        if waiter is not None:
+            self._drain_waiter = None
+            if not waiter.done():
+                waiter.set_result(None)
+
+    def _on_writable(self):
+        try:
+            written = os.write(self._fd, self._write_buffer)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            self._connection_lost(e)
+            return
+
+        del self._write_buffer[:written]
+        if not self._write_buffer:
+            self._loop.remove_writer(self._fd)
+            self._wake_drain_waiter()
+
+    def write(self, data: bytes):
+        """
+        Queues data for writing. As much as possible is written right away;
+        use drain() to wait for the rest.
+        """
+        if self._fd is None:
+            raise serial.PortNotOpenError()
+        if not data:
+            return
+
+        if not self._write_buffer:
+            try:
+                written = os.write(self._fd, data)
+            except BlockingIOError:
+                written = 0
+            except OSError as e:
+                self._connection_lost(e)
+                raise
+            data = memoryview(data)[written:]
+            if not data:
+                return
+            self._loop.add_writer(self._fd, self._on_writable)
+        self._write_buffer += data
+
+    async def drain(self):
+        """Waits until all queued data has been handed to the device."""
+        while self._write_buffer and self._fd is not None and not self._eof:
+            if self._drain_waiter is None:
+                self._drain_waiter = self._loop.create_future()
+            await self._drain_waiter
+        if self._exception is not None:
+            raise self._exception
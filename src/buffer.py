@@ -0,0 +1,176 @@
+"""
+Contains a thread-safe ring buffer used to pass data between threads.
+"""
+
+from enum import IntEnum
+import threading
+
+
+class OverflowPolicy(IntEnum):
+    """What to do when data is written to a full RingBuffer."""
+
+    # Make the writer wait until the reader has made space.
+    BLOCK = 0
+    # Discard the oldest buffered data to make space for new data.
+    DROP_OLDEST = 1
+    # Keep the buffered data; data that does not fit is returned to the
+    # writer, which can pass it on elsewhere (e.g. only to the log).
+    SPILL = 2
+
+
+class RingBuffer:
+    """
+    Bounded byte ring buffer.
+
+    One thread appends data with write(), another one takes everything
+    that has accumulated so far with read_all(). Data is copied into
+    a preallocated bytearray, so no per-chunk objects are kept around.
+    """
+
+    def __init__(self, size: int, policy: int = OverflowPolicy.DROP_OLDEST):
+        if size < 1:
+            raise ValueError
+        self._buf = bytearray(size)
+        self._start = 0
+        self._length = 0
+        self._closed = False
+        self._lock = threading.Lock()
+        self._space_available = threading.Condition(self._lock)
+
+        self.policy = OverflowPolicy(policy)
+        #: Total amount of bytes that were discarded. Data that does not fit
+        #: under the SPILL policy is returned to the writer, so it does not
+        #: count.
+        self.dropped = 0
+
+    def __len__(self):
+        return self._length
+
+    @property
+    def size(self) -> int:
+        return len(self._buf)
+
+    @property
+    def free(self) -> int:
+        """Amount of bytes that can be written without overflowing."""
+        return len(self._buf) - self._length
+
+    def _put(self, data: memoryview):
+        """Copies data into the free space. Must be called with the lock held."""
+        size = len(self._buf)
+        end = (self._start + self._length) % size
+        first = min(len(data), size - end)
+        self._buf[end : end + first] = data[:first]
+        if first < len(data):
+            self._buf[: len(data) - first] = data[first:]
+        self._length += len(data)
+
+    def _take(self) -> bytes:
+        """Removes and returns all buffered data. Must be called with the lock held."""
+        size = len(self._buf)
+        end = self._start + self._length
+        if end <= size:
+            data = bytes(self._buf[self._start : end])
+        else:
+            data = bytes(self._buf[self._start :]) + bytes(self._buf[: end - size])
+        self._start = 0
+        self._length = 0
+        return data
+
+    def write(self, data: bytes) -> bytes:
+        """
+        Appends data to the buffer, applying the overflow policy if it
+        does not fit.
+
+        Returns the data that was not stored; this is only ever non-empty
+        for the SPILL policy.
+        """
+        view = memoryview(data)
+        size = len(self._buf)
+
+        with self._lock:
+            if self._closed:
+                return b""
+
+            if self.policy == OverflowPolicy.BLOCK:
+                while view:
+                    free = size - self._length
+                    if free:
+                        self._put(view[:free])
+                        view = view[free:]
+                    elif self._closed:
+                        self.dropped += len(view)
+                        break
+                    else:
+                        self._space_available.wait()
+                return b""
+
+            free = size - self._length
+            if len(view) <= free:
+                self._put(view)
+                return b""
+
+            if self.policy == OverflowPolicy.SPILL:
+                self._put(view[:free])
+                return bytes(view[free:])
+
+            # DROP_OLDEST
+            if len(view) >= size:
+                self.dropped += self._length + len(view) - size
+                self._start = 0
+                self._length = 0
+                self._put(view[-size:])
+            else:
+                overflow = len(view) - free
+                self.dropped += overflow
+                self._start = (self._start + overflow) % size
+                self._length -= overflow
+                self._put(view)
+            return b""
+
+    def write_available(self, data: bytes) -> bytes:
+        """
+        Appends as much of data as fits, without applying the overflow
+        policy or waiting. Returns the data that was not stored.
+        """
+        view = memoryview(data)
+        with self._lock:
+            if self._closed:
+                return b""
+            free = len(self._buf) - self._length
+            self._put(view[:free])
+            return bytes(view[free:])
+
+    def read_all(self) -> bytes:
+        """Removes and returns all data currently in the buffer."""
+        with self._lock:
+            if not self._length:
+                return b""
+            data = self._take()
+            self._space_available.notify_all()
+        return data
+
+    def resize(self, size: int):
+        """Changes the size of the buffer, keeping the newest data."""
+        if size < 1:
+            raise ValueError
+        with self._lock:
+            data = self._take()[-size:]
+            self._buf = bytearray(size)
+            self._put(memoryview(data))
+            self._space_available.notify_all()
+
+    def close(self):
+        """Discards any further writes and wakes up blocked writers."""
+        with self._lock:
+            self._closed = True
+            self._space_available.notify_all()
+
+    def reset(self):
+        """Empties the buffer and makes it accept writes again."""
+        with self._lock:
+            self._start = 0
+            self._length = 0
+            self._closed = False
+            self.dropped = 0
+            self._space_available.notify_all()
@@ -0,0 +1,115 @@
+"""
+Contains the capture file format, which records everything that happens
+on a serial port along with the time it happened at.
+
+A capture file starts with an 8-byte header (CAPTURE_MAGIC followed by
+the format version and two reserved bytes), followed by records. Every
+record consists of a 13-byte little-endian header:
+
+    kind (u8) | timestamp (u64, CLOCK_MONOTONIC nanoseconds) | length (u32)
+
+and length bytes of payload. RX and TX payloads are the raw bytes; INFO
+and EVENT payloads are UTF-8 text. A CLOCK record, written whenever
+a file is opened, carries the wall-clock time (i64, nanoseconds since
+the epoch) that corresponds to its monotonic timestamp, so that the
+timestamps of the records that follow can be converted to wall-clock time.
+"""
+
+from enum import IntEnum
+import os
+import struct
+import time
+
+CAPTURE_MAGIC = b"SCCAP"
+CAPTURE_VERSION = 1
+CAPTURE_EXTENSION = ".sccap"
+
+FILE_HEADER = CAPTURE_MAGIC + bytes((CAPTURE_VERSION, 0, 0))
+RECORD_HEADER = struct.Struct("<BQI")
+_CLOCK = struct.Struct("<q")
+
+# Size of the blocks read by iter_records.
+READ_BLOCK_SIZE = 1024 * 1024
+
+
+class RecordKind(IntEnum):
+    # Data read from the device
+    RX = 0
+    # Data written to the device
+    TX = 1
+    # Informational message from the app
+    INFO = 2
+    # Connection event, e.g. the port being opened or lost
+    EVENT = 3
+    # Wall-clock time reference
+    CLOCK = 4
+
+
+class CaptureFormatError(Exception):
+    pass
+
+
+def get_capture_path(path: str) -> str:
+    """Returns the capture file path for the given log path."""
+    return os.path.splitext(path)[0] + CAPTURE_EXTENSION
+
+
+def clock_record() -> tuple:
+    """Returns a CLOCK record for the current time."""
+    timestamp = time.monotonic_ns()
+    return (RecordKind.CLOCK, timestamp, _CLOCK.pack(time.time_ns()))
+
+
+def iter_records(file, offset: int = 0, block_size: int = READ_BLOCK_SIZE):
+    """
+    Yields (offset, kind, timestamp, payload) tuples for the records in
+    a capture file (opened in binary mode), starting at the record at the
+    given offset, or at the first record if offset is 0.
+
+    A record that was cut short (e.g. by a crash) ends the iteration.
+    """
+    if not offset:
+        file.seek(0)
+        header = file.read(len(FILE_HEADER))
+        if header[: len(CAPTURE_MAGIC)] != CAPTURE_MAGIC:
+            raise CaptureFormatError("Not a capture file")
+        if header[len(CAPTURE_MAGIC)] > CAPTURE_VERSION:
+            raise CaptureFormatError("Unsupported capture file version")
+        offset = len(FILE_HEADER)
+
+    file.seek(offset)
+    buffer = b""
+    position = 0
+    header_size = RECORD_HEADER.size
+    unpack_from = RECORD_HEADER.unpack_from
+
+    while True:
+        if len(buffer) - position < header_size:
+            more = file.read(block_size)
+            if not more:
+                return
+            buffer = buffer[position:] + more
+            position = 0
+            continue
+
+        kind, timestamp, length = unpack_from(buffer, position)
+        end = position + header_size + length
+        if end > len(buffer):
+            more = file.read(max(block_size, end - len(buffer)))
+            if not more:
+                return
+            buffer = buffer[position:] + more
+            position = 0
+            continue
+
+        yield offset, kind, timestamp, buffer[position + header_size : end]
+        offset += end - position
+        position = end
+
+
+def get_clock_offset(payload: bytes, timestamp: int) -> int:
+    """
+    Returns the offset to add to monotonic timestamps to get wall-clock
+    time (in nanoseconds since the epoch), from a CLOCK record.
+    """
+    return _CLOCK.unpack(payload)[0] - timestamp
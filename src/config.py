@@ -2,7 +2,7 @@
 Shim for global config access.
 """
 
-from gi.repository import Gio, Gtk
+from gi.repository import Gio
 from enum import IntEnum
 
 config = Gio.Settings.new("com.github.knuxify.SerialConsole")
@@ -48,6 +48,10 @@ def enum_to_stringlist(enum):
     Takes an enum generated with get_enum_for_key and returns
     a GtkStringList containing its items.
     """
+    # Gtk is imported here so that headless mode can use the config
+    # without pulling it in.
+    from gi.repository import Gtk
+
     return Gtk.StringList.new(list(enum_names[enum].values()))
 
 
@@ -0,0 +1,251 @@
+"""
+Contains the filter chain, which transforms data read from the device
+before it is passed on to the main loop (i.e. the terminal and text log).
+
+A chain is an ordered list of stages. Every stage takes a chunk of data
+as it was read and returns the transformed chunk; state that spans
+chunks (e.g. whether the last chunk ended mid-line) is kept by the stage
+itself. Stages work on whole chunks with bytes methods and regular
+expressions, so they add no per-byte Python overhead.
+
+Filters run in the reactor thread. Captures and the session history are
+fed by traffic listeners, and always get the unfiltered data.
+
+Filter plugins are Python files that define a create_filter() function,
+returning a FilterStage (or any object with a process(data) method):
+
+    from serialconsole.filters import FilterStage
+
+    class UpperCaseFilter(FilterStage):
+        name = "Upper case"
+
+        def process(self, data):
+            return data.upper()
+
+    def create_filter():
+        return UpperCaseFilter()
+"""
+
+import importlib.util
+import os
+import time
+import traceback
+
+
+class FilterStage:
+    """A stage of the filter chain. Passes data on unchanged."""
+
+    #: Name of the stage, as shown in the statistics.
+    name = "Filter"
+
+    def process(self, data: bytes) -> bytes:
+        """Returns the filtered version of a chunk of data."""
+        return data
+
+    def reset(self):
+        """Forgets the state carried over from the previous chunks."""
+        pass
+
+
+class TimestampFilter(FilterStage):
+    """Prefixes every line with the time at which it was read."""
+
+    name = _("Timestamps")
+
+    def __init__(self):
+        self._at_line_start = True
+        self._second = None
+        self._prefix_start = ""
+
+    def reset(self):
+        self._at_line_start = True
+
+    def _get_prefix(self) -> bytes:
+        now = time.time()
+        second = int(now)
+        if second != self._second:
+            self._second = second
+            self._prefix_start = time.strftime("[%H:%M:%S", time.localtime(now))
+        return f"{self._prefix_start}.{int(now * 1000) % 1000:03d}] ".encode()
+
+    def process(self, data: bytes) -> bytes:
+        prefix = self._get_prefix()
+        out = (b"\n" + prefix).join(data.split(b"\n"))
+        if self._at_line_start:
+            out = prefix + out
+        # Lines are prefixed once their first character comes in, so that
+        # the time shown is that of the line rather than of the line end.
+        self._at_line_start = data.endswith(b"\n")
+        if self._at_line_start:
+            out = out[: -len(prefix)]
+        return out
+
+
+class NewlineFilter(FilterStage):
+    """
+    Turns bare LF line endings into CRLF, which the terminal needs to go
+    back to the start of the line. With convert_cr, bare CR line endings
+    are converted too (which breaks progress bars drawn with CR).
+    """
+
+    name = _("Line endings")
+
+    def __init__(self, convert_cr: bool = False):
+        self.convert_cr = convert_cr
+        self._after_cr = False
+
+    def reset(self):
+        self._after_cr = False
+
+    def process(self, data: bytes) -> bytes:
+        after_cr = self._after_cr
+        self._after_cr = data.endswith(b"\r")
+
+        start = b""
+        if after_cr and data.startswith(b"\n"):
+            # A CRLF split across two chunks; the CR has been passed on
+            # already (as CRLF, with convert_cr).
+            data = data[1:]
+            if not self.convert_cr:
+                start = b"\n"
+
+        if self.convert_cr and b"\r" in data:
+            data = data.replace(b"\r\n", b"\n").replace(b"\r", b"\n")
+        elif b"\n" not in data:
+            return start + data
+        else:
+            data = data.replace(b"\r\n", b"\n")
+        return start + data.replace(b"\n", b"\r\n")
+
+
+# Unicode Control Pictures for C0 control characters and DEL.
+_CONTROL_PICTURES = {i: chr(0x2400 + i).encode() for i in range(32)}
+_CONTROL_PICTURES[0x7F] = "␡".encode()
+
+
+class ControlCharFilter(FilterStage):
+    """
+    Shows control characters as their Unicode Control Pictures. Tabs and
+    line endings are left alone, as are escape sequences unless
+    show_escapes is set.
+    """
+
+    name = _("Control characters")
+
+    def __init__(self, show_escapes: bool = False):
+        self._pictures = [
+            (bytes((char,)), picture)
+            for char, picture in _CONTROL_PICTURES.items()
+            if char not in b"\t\n\r" and (show_escapes or char != 0x1B)
+        ]
+        self._controls = b"".join(char for char, _picture in self._pictures)
+
+    def process(self, data: bytes) -> bytes:
+        # Most chunks have no control characters, which translate() checks
+        # for in one pass. Replacing one character at a time with replace()
+        # is still several times faster than a regex with a callback,
+        # even for binary data.
+        if len(data.translate(None, self._controls)) == len(data):
+            return data
+        for char, picture in self._pictures:
+            if char in data:
+                data = data.replace(char, picture)
+        return data
+
+
+def load_plugin(path: str) -> FilterStage:
+    """
+    Loads a filter plugin (see above) and returns the stage it creates.
+    Raises an exception if the plugin could not be loaded.
+    """
+    name = os.path.splitext(os.path.basename(path))[0]
+    spec = importlib.util.spec_from_file_location(f"serialconsole_filter_{name}", path)
+    if spec is None:
+        raise ImportError(f"not a Python file: {path}")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    stage = module.create_filter()
+    if not getattr(stage, "name", None):
+        stage.name = name
+    return stage
+
+
+class FilterStats:
+    """Counters for a stage of the filter chain."""
+
+    __slots__ = ("name", "chunks", "bytes_in", "bytes_out", "time", "errors")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.reset()
+
+    def reset(self):
+        #: Amount of chunks processed.
+        self.chunks = 0
+        #: Amount of bytes that went into and came out of the stage.
+        self.bytes_in = 0
+        self.bytes_out = 0
+        #: Time spent in the stage (in nanoseconds).
+        self.time = 0
+        #: Amount of chunks that the stage raised an exception for.
+        self.errors = 0
+
+
+class FilterChain:
+    """
+    Runs chunks of data through a list of stages, timing every stage.
+
+    Stages are replaced all at once, so the chain can be changed from the
+    main loop while the reactor thread runs it.
+    """
+
+    def __init__(self, stages: list = ()):
+        self._stages = ()
+        self.set_stages(stages)
+
+    def __bool__(self) -> bool:
+        return bool(self._stages)
+
+    @property
+    def stages(self) -> list:
+        return [stage for stage, _stats in self._stages]
+
+    @property
+    def stats(self) -> list:
+        """FilterStats of every stage, in order."""
+        return [stats for _stage, stats in self._stages]
+
+    def set_stages(self, stages: list):
+        self._stages = tuple((stage, FilterStats(stage.name)) for stage in stages)
+
+    def reset(self):
+        """Resets the state of all stages, e.g. after reconnecting."""
+        for stage, _stats in self._stages:
+            # Plugins do not have to subclass FilterStage
+            reset = getattr(stage, "reset", None)
+            if reset is not None:
+                reset()
+
+    def reset_stats(self):
+        for _stage, stats in self._stages:
+            stats.reset()
+
+    def process(self, data: bytes) -> bytes:
+        """Runs data through all stages and returns the result."""
+        for stage, stats in self._stages:
+            start = time.perf_counter_ns()
+            try:
+                out = stage.process(data)
+            except Exception:
+                # Pass the data on as it is rather than losing it
+                traceback.print_exc()
+                stats.errors += 1
+                out = data
+            stats.time += time.perf_counter_ns() - start
+            stats.chunks += 1
+            stats.bytes_in += len(data)
+            stats.bytes_out += len(out)
+            data = out
+            if not data:
+                break
+        return data
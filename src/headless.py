@@ -0,0 +1,499 @@
+"""
+Contains the headless capture mode, which logs one or more serial ports
+without starting the GUI:
+
+    serialconsole --headless --port /dev/ttyUSB0 --log capture.txt
+
+Port settings not given on the command line are taken from the config.
+With --log-capture, a timestamped capture (see capture.py) is written
+instead of a text log, just like the GUI does. With --reconnect, ports that
+are lost or missing are reopened as soon as their device node shows up
+(see portmonitor.DeviceWatcher).
+With --script, a script (see script.py) is run on the port once it is
+connected, and the capture stops when the script is done.
+This module must not import Gtk, Adw or Vte.
+"""
+
+import argparse
+import asyncio
+import errno
+import json
+import os
+import signal
+import sys
+import threading
+import time
+import traceback
+
+import serial
+
+from .asyncserial import AsyncSerialSession
+from .capture import RecordKind, get_capture_path
+from .config import config, Parity, FlowControl
+from .logfile import (
+    CaptureFile,
+    LogFile,
+    LogWriter,
+    DecodeErrors,
+    get_session_log_path,
+)
+from .logrotate import LogCompression, LogRotation, get_available_compression
+from .portsettings import PortSettings
+from .script import ScriptCancelled, ScriptConsole, describe_error, run_script
+
+# Longest time between attempts to reopen a lost port (in seconds); it is
+# reopened right away if its device node shows up before that.
+RECONNECT_INTERVAL = 1
+
+
+def _enum_choices(enum) -> dict:
+    """Returns command line names for the items of a config enum."""
+    return {item.name.lower().replace("_", "-"): item for item in enum}
+
+
+def parse_args(argv: list) -> argparse.Namespace:
+    parities = _enum_choices(Parity)
+    flow_controls = _enum_choices(FlowControl)
+    decode_errors = _enum_choices(DecodeErrors)
+    compressions = _enum_choices(LogCompression)
+
+    parser = argparse.ArgumentParser(
+        prog="serialconsole --headless",
+        description="Capture serial ports without a GUI.",
+    )
+    parser.add_argument("--headless", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument(
+        "-p",
+        "--port",
+        action="append",
+        dest="ports",
+        metavar="PORT",
+        help="serial port to capture; can be given multiple times",
+    )
+    parser.add_argument("-b", "--baud-rate", type=int)
+    parser.add_argument("--data-bits", type=int, choices=(5, 6, 7, 8))
+    parser.add_argument("--parity", choices=parities.keys())
+    parser.add_argument("--stop-bits", type=int, choices=(1, 2))
+    parser.add_argument("--flow-control", choices=flow_controls.keys())
+    parser.add_argument(
+        "-l",
+        "--log",
+        metavar="PATH",
+        help="log file; further ports log to numbered files next to it",
+    )
+    parser.add_argument(
+        "--log-binary",
+        action=argparse.BooleanOptionalAction,
+        default=None,
+        help="write raw binary data to the log file",
+    )
+    parser.add_argument(
+        "--log-capture",
+        action=argparse.BooleanOptionalAction,
+        default=None,
+        help="write a timestamped capture of sent and received data and "
+        "connection events (.sccap) instead of a text log",
+    )
+    parser.add_argument(
+        "--log-errors",
+        choices=decode_errors.keys(),
+        help="how to log data that is not valid UTF-8 in text mode",
+    )
+    parser.add_argument(
+        "--log-rotate-size",
+        type=int,
+        metavar="MIB",
+        help="start a new log file once the current one grows past this size",
+    )
+    parser.add_argument(
+        "--log-rotate-interval",
+        type=int,
+        metavar="MINUTES",
+        help="start a new log file at every multiple of this many minutes",
+    )
+    parser.add_argument(
+        "--log-compression",
+        choices=compressions.keys(),
+        help="how to compress rotated log files",
+    )
+    parser.add_argument(
+        "--log-keep",
+        type=int,
+        metavar="COUNT",
+        help="amount of rotated log files to keep (0 keeps all)",
+    )
+    parser.add_argument(
+        "--reconnect",
+        action=argparse.BooleanOptionalAction,
+        default=None,
+        help="re-connect automatically when the connection is lost, and wait "
+        "for ports that are missing at startup",
+    )
+    parser.add_argument(
+        "--stdout",
+        action="store_true",
+        help="also write received data to standard output",
+    )
+
+    parser.add_argument(
+        "--script",
+        metavar="PATH",
+        help="run a script on the port, and stop once it is done",
+    )
+    parser.add_argument(
+        "--script-results",
+        metavar="PATH",
+        help="write the results of the script to this file as JSON, "
+        "rather than to standard output",
+    )
+
+    args = parser.parse_args(argv)
+    if args.script and args.ports and len(args.ports) > 1:
+        parser.error("--script can only be used with a single port")
+    if args.parity is not None:
+        args.parity = parities[args.parity]
+    if args.flow_control is not None:
+        args.flow_control = flow_controls[args.flow_control]
+    if args.log_errors is not None:
+        args.log_errors = decode_errors[args.log_errors]
+    if args.log_compression is not None:
+        args.log_compression = compressions[args.log_compression]
+    return args
+
+
+def _status(port: str, text: str):
+    print(f"--- {port}: {text} ---", file=sys.stderr, flush=True)
+
+
+class HeadlessCapture:
+    """Captures the data from a single serial port."""
+
+    def __init__(
+        self,
+        settings: PortSettings,
+        log: LogWriter = None,
+        stdout: bool = False,
+        reconnect: bool = False,
+        log_capture: bool = False,
+    ):
+        self.settings = settings
+        self.log = log
+        self.stdout = stdout
+        self.reconnect = reconnect
+        #: Whether log is a capture file (see capture.py) rather than a text log.
+        self.log_capture = log_capture
+        #: Console of the script run on the port, if any.
+        self.console = None
+        #: Set once the port was connected for the first time.
+        self.connected = asyncio.Event()
+        self._session = None
+        self._loop = None
+        # Set when the directory of the port changes while waiting for it
+        # to come back, and the DeviceWatcher callback that sets it
+        self._port_changed = None
+        self._on_port_change = None
+
+    def _record(self, kind: int, payload):
+        if self.log and self.log_capture:
+            self.log.write_record(kind, time.monotonic_ns(), payload)
+
+    def _write(self, data: bytes):
+        if self.console:
+            self.console.feed(data)
+        if self.log_capture:
+            self._record(RecordKind.RX, data)
+        elif self.log:
+            self.log.write(data)
+        if self.stdout:
+            sys.stdout.buffer.write(data)
+            sys.stdout.buffer.flush()
+
+    async def _send(self, data: bytes):
+        session = self._session
+        if session is None or not session.is_open:
+            raise OSError(errno.ENOTCONN, "port is not connected")
+        session.write(data)
+        self._record(RecordKind.TX, bytes(data))
+        await session.drain()
+
+    def send(self, data: bytes):
+        """Writes data to the port; called from the script thread."""
+        asyncio.run_coroutine_threadsafe(self._send(data), self._loop).result()
+
+    async def run(self) -> bool:
+        """
+        Captures data until the port is lost (and reconnecting is off) or
+        the task is cancelled. Returns False if the port could not be opened
+        (with reconnecting on, it is retried until it can be opened).
+        """
+        try:
+            return await self._run()
+        finally:
+            self._unwatch_port()
+            if self.console:
+                self.console.close()
+
+    def _watch_port(self):
+        """
+        Starts watching the directory of the port with the DeviceWatcher
+        (see portmonitor.py), which the GUI uses to reconnect as well.
+        """
+        if self._on_port_change is not None:
+            return
+        # Imported here, so that the reactor only starts when it is needed
+        from .portmonitor import get_device_watcher
+        from .reactor import get_reactor
+
+        loop = self._loop
+        changed = self._port_changed = asyncio.Event()
+
+        def on_port_change():
+            loop.call_soon_threadsafe(changed.set)
+
+        directories = [os.path.dirname(os.path.abspath(self.settings.port))]
+        self._on_port_change = on_port_change
+        get_reactor().call_soon(
+            lambda: get_device_watcher().add_listener(on_port_change, directories)
+        )
+
+    def _unwatch_port(self):
+        on_port_change = self._on_port_change
+        if on_port_change is None:
+            return
+        from .portmonitor import get_device_watcher
+        from .reactor import get_reactor
+
+        self._on_port_change = None
+        get_reactor().call_soon(
+            lambda: get_device_watcher().remove_listener(on_port_change)
+        )
+
+    async def _wait_for_port(self):
+        """
+        Waits until the directory of the port changes (e.g. as its device
+        node was created), or for RECONNECT_INTERVAL at most.
+        """
+        self._watch_port()
+        try:
+            await asyncio.wait_for(self._port_changed.wait(), RECONNECT_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        self._port_changed.clear()
+
+    async def _run(self) -> bool:
+        port = self.settings.port
+        # Whether a failure to open the port was reported, or the port was
+        # connected before, so that retries do not report it again
+        quiet = False
+        self._loop = asyncio.get_running_loop()
+
+        while True:
+            session = AsyncSerialSession(self.settings)
+            try:
+                await session.open()
+            except serial.SerialException as e:
+                if not self.reconnect:
+                    _status(port, f"failed to open port: {e}")
+                    return False
+                if not quiet:
+                    _status(port, f"failed to open port: {e}; retrying")
+                    quiet = True
+                await self._wait_for_port()
+                continue
+
+            self._unwatch_port()
+            if self.connected.is_set():
+                self._record(RecordKind.EVENT, f"Reconnected to {port}")
+            else:
+                self._record(RecordKind.EVENT, f"Opened {port}")
+            quiet = True
+            _status(port, "connected")
+            self._session = session
+            self.connected.set()
+            try:
+                async for data in session:
+                    self._write(data)
+            except asyncio.CancelledError:
+                self._record(RecordKind.EVENT, f"Closed {port}")
+                raise
+            except OSError as e:
+                _status(port, f"connection lost: {e}")
+            else:
+                _status(port, "connection lost")
+            finally:
+                self._session = None
+                await session.close()
+            self._record(RecordKind.EVENT, f"Lost connection to {port}")
+
+            if not self.reconnect:
+                return True
+            await self._wait_for_port()
+
+
+async def run_headless_script(
+    capture: HeadlessCapture, capture_task: asyncio.Task, path: str
+) -> dict:
+    """
+    Runs a script on the port of a capture once it is connected. Returns
+    the results of the script, or None if it failed.
+    """
+    connected = asyncio.create_task(capture.connected.wait())
+    await asyncio.wait((connected, capture_task), return_when=asyncio.FIRST_COMPLETED)
+    if not connected.done():
+        connected.cancel()
+        return None
+
+    # A daemon thread rather than asyncio.to_thread(), so that a script
+    # that ignores being stopped does not keep the process alive
+    loop = asyncio.get_running_loop()
+    finished = loop.create_future()
+
+    def _run():
+        try:
+            run_script(path, capture.console)
+        except BaseException as e:
+            if not isinstance(e, ScriptCancelled):
+                traceback.print_exc()
+            loop.call_soon_threadsafe(finished.set_result, describe_error(e))
+        else:
+            loop.call_soon_threadsafe(finished.set_result, None)
+
+    _status(capture.settings.port, f"running script {path}")
+    threading.Thread(target=_run, name="serial-script", daemon=True).start()
+    try:
+        error = await finished
+    except asyncio.CancelledError:
+        capture.console.cancel()
+        raise
+    if error:
+        _status(capture.settings.port, f"script failed: {error}")
+        return None
+    _status(capture.settings.port, "script finished")
+    return capture.console.results
+
+
+def write_script_results(results: dict, path: str = None):
+    """Writes script results as JSON to the given file, or standard output."""
+    text = json.dumps(results, indent=2, default=str)
+    if path:
+        with open(path, "w") as file:
+            file.write(text + "\n")
+    else:
+        print(text, flush=True)
+
+
+async def run(args: argparse.Namespace) -> int:
+    defaults = PortSettings.from_config(config)
+    ports = args.ports or [defaults.port]
+    log_binary = config["log-binary"] if args.log_binary is None else args.log_binary
+    log_errors = (
+        config.get_enum("log-decode-errors")
+        if args.log_errors is None
+        else args.log_errors
+    )
+    log_capture = (
+        config["log-capture"] if args.log_capture is None else args.log_capture
+    )
+    rotation = LogRotation.from_config(config)
+    if args.log_rotate_size is not None:
+        rotation.max_size = args.log_rotate_size * 1024 * 1024
+    if args.log_rotate_interval is not None:
+        rotation.interval = args.log_rotate_interval * 60
+    if args.log_compression is not None:
+        rotation.compression = get_available_compression(args.log_compression)
+    if args.log_keep is not None:
+        rotation.keep = args.log_keep
+
+    reconnect = (
+        config["reconnect-automatically"] if args.reconnect is None else args.reconnect
+    )
+
+    captures = []
+    logs = []
+    for index, port in enumerate(ports):
+        settings = PortSettings(
+            port=port,
+            baud_rate=args.baud_rate or defaults.baud_rate,
+            data_bits=args.data_bits or defaults.data_bits,
+            parity=defaults.parity if args.parity is None else args.parity,
+            stop_bits=args.stop_bits or defaults.stop_bits,
+            flow_control=(
+                defaults.flow_control
+                if args.flow_control is None
+                else args.flow_control
+            ),
+        )
+
+        log = None
+        if args.log:
+            path = get_session_log_path(args.log, index)
+            if log_capture:
+                file = CaptureFile(get_capture_path(path))
+            else:
+                file = LogFile(path, log_binary, log_errors)
+            log = LogWriter.from_config(file, config)
+            log.rotation = rotation
+            try:
+                log.open()
+            except OSError as e:
+                print(f"Failed to open log file {log.path}: {e}", file=sys.stderr)
+                for _log in logs:
+                    _log.close()
+                return 1
+            logs.append(log)
+
+        captures.append(
+            HeadlessCapture(settings, log, args.stdout, reconnect, log_capture)
+        )
+
+    script = None
+    if args.script:
+        capture = captures[0]
+        capture.console = ScriptConsole(capture.send)
+        capture.console.on_log = lambda message: _status(capture.settings.port, message)
+
+    loop = asyncio.get_running_loop()
+    tasks = [asyncio.create_task(capture.run()) for capture in captures]
+    if args.script:
+        script = asyncio.create_task(
+            run_headless_script(captures[0], tasks[0], args.script)
+        )
+
+    def _stop():
+        for task in tasks:
+            task.cancel()
+        if script is not None:
+            script.cancel()
+
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, _stop)
+
+    script_results = None
+    if script is not None:
+        try:
+            script_results = await script
+        except asyncio.CancelledError:
+            pass
+        for task in tasks:
+            task.cancel()
+
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    for log in logs:
+        log.close()
+
+    if script is not None:
+        if script_results is None:
+            return 1
+        try:
+            write_script_results(script_results, args.script_results)
+        except OSError as e:
+            print(f"Failed to write script results: {e}", file=sys.stderr)
+            return 1
+        return 0
+    if any(result is False for result in results):
+        return 1
+    return 0
+
+
+def main(argv: list) -> int:
+    return asyncio.run(run(parse_args(argv[1:])))
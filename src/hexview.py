@@ -0,0 +1,256 @@
+"""
+Contains the hex view, which shows the data received by a session as a
+hex dump, as an alternative to the terminal for binary protocols.
+
+Received data is kept in a ByteStore, fed by the serial handler's traffic
+listener (so it is there no matter which view is shown). The view is a
+Gtk.ListView over a model with one row per BYTES_PER_ROW bytes; row
+objects are only created for the rows on screen, and the model is brought
+up to date with the store at most once per frame, while it is shown.
+"""
+
+from gi.repository import Gio, GObject, Gtk
+import threading
+
+from .capture import RecordKind
+
+BYTES_PER_ROW = 16
+# Size of the blocks that received data is stored in (in bytes); must be a
+# multiple of BYTES_PER_ROW.
+SEGMENT_SIZE = 1024 * 1024
+# Amount of received data kept for the hex view (in bytes). Once there is
+# more, the oldest data is dropped, a segment at a time.
+MAX_STORE_SIZE = 64 * 1024 * 1024
+
+# Shows bytes outside of printable ASCII as dots in the text column.
+_PRINTABLE = bytes(char if 32 <= char < 127 else ord(".") for char in range(256))
+
+
+class ByteStore:
+    """
+    Append-only store for received data. Offsets are counted from the
+    first byte ever received, so they stay the same as old data is dropped.
+    """
+
+    def __init__(self, max_size: int = MAX_STORE_SIZE):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._segments = [bytearray()]
+        #: Offset of the oldest byte still kept.
+        self.start = 0
+        #: Offset right after the newest byte.
+        self.end = 0
+        self._serial = None
+
+    def attach(self, serial):
+        """Starts keeping everything read by the serial handler."""
+        self._serial = serial
+        serial.add_traffic_listener(self._on_traffic)
+
+    def close(self):
+        """Stops keeping data and drops what was kept."""
+        if self._serial is not None:
+            self._serial.remove_traffic_listener(self._on_traffic)
+            self._serial = None
+        with self._lock:
+            self._segments = [bytearray()]
+            self.start = self.end
+
+    def _on_traffic(self, kind: int, timestamp: int, payload):
+        if kind == RecordKind.RX:
+            self.append(payload)
+
+    def append(self, data: bytes):
+        """Adds data to the store. Can be called from any thread."""
+        data = memoryview(data)
+        with self._lock:
+            segments = self._segments
+            while data:
+                last = segments[-1]
+                free = SEGMENT_SIZE - len(last)
+                if not free:
+                    last = bytearray()
+                    segments.append(last)
+                    free = SEGMENT_SIZE
+                part = data[:free]
+                last += part
+                data = data[free:]
+                self.end += len(part)
+            # Drop whole segments, so that offsets in the kept segments
+            # stay aligned to them
+            while len(segments) > 1 and self.end - self.start > self.max_size:
+                del segments[0]
+                self.start += SEGMENT_SIZE
+
+    def read(self, offset: int, size: int) -> bytes:
+        """
+        Returns up to size bytes starting at offset, which must be at a
+        multiple of size and within one segment.
+        """
+        with self._lock:
+            if offset < self.start:
+                return b""
+            segment, position = divmod(offset - self.start, SEGMENT_SIZE)
+            if segment >= len(self._segments):
+                return b""
+            return bytes(self._segments[segment][position : position + size])
+
+
+class HexRow(GObject.Object):
+    """A row of the hex view."""
+
+    def __init__(self, offset: int, data: bytes):
+        super().__init__()
+        self.offset = offset
+        self.data = data
+
+    @property
+    def hex(self) -> str:
+        half = BYTES_PER_ROW // 2
+        text = self.data[:half].hex(" ")
+        if len(self.data) > half:
+            text += "  " + self.data[half:].hex(" ")
+        return text
+
+    @property
+    def text(self) -> str:
+        return self.data.translate(_PRINTABLE).decode("ascii")
+
+
+class HexRowModel(GObject.Object, Gio.ListModel):
+    """
+    List model of the rows of a ByteStore. It only changes in update(),
+    which is where rows added to (or dropped from) the store show up.
+    """
+
+    def __init__(self, store: ByteStore = None):
+        super().__init__()
+        self.store = store
+        self._start = 0
+        self._end = 0
+        if store is not None:
+            self._start = self._end = store.start
+
+    def _row_count(self, start: int, end: int) -> int:
+        return (end - start + BYTES_PER_ROW - 1) // BYTES_PER_ROW
+
+    def do_get_item_type(self):
+        return HexRow.__gtype__
+
+    def do_get_n_items(self):
+        return self._row_count(self._start, self._end)
+
+    def do_get_item(self, position):
+        if position >= self.do_get_n_items():
+            return None
+        offset = self._start + position * BYTES_PER_ROW
+        size = min(BYTES_PER_ROW, self._end - offset)
+        return HexRow(offset, self.store.read(offset, size))
+
+    def update(self) -> bool:
+        """Catches up with the store. Returns True if any rows changed."""
+        if self.store is None:
+            return False
+        start = self.store.start
+        end = self.store.end
+        changed = False
+
+        if start > self._start:
+            dropped = min(self._row_count(self._start, start), self.do_get_n_items())
+            self._start = start
+            self._end = max(self._end, start)
+            self.items_changed(0, dropped, 0)
+            changed = True
+
+        if end > self._end:
+            rows = self.do_get_n_items()
+            # An unfinished last row is replaced along with the new ones
+            partial = 1 if (self._end - self._start) % BYTES_PER_ROW else 0
+            self._end = end
+            added = self.do_get_n_items() - rows
+            self.items_changed(rows - partial, partial, added + partial)
+            changed = True
+        return changed
+
+
+@Gtk.Template(resource_path="/com/github/knuxify/SerialConsole/ui/hex-view.ui")
+class SerialConsoleHexView(Gtk.Box):
+    """
+    Shows the data in a ByteStore as a hex dump. While scrolled to the
+    bottom, it follows new data as it comes in.
+    """
+
+    __gtype_name__ = "SerialConsoleHexView"
+
+    stack = Gtk.Template.Child()
+    scrolled_window = Gtk.Template.Child()
+    list_view = Gtk.Template.Child()
+
+    def __init__(self):
+        super().__init__()
+        self.model = HexRowModel()
+        self.list_view.set_model(Gtk.NoSelection.new(self.model))
+        self._tick = None
+
+        factory = Gtk.SignalListItemFactory()
+        factory.connect("setup", self.setup_row)
+        factory.connect("bind", self.bind_row)
+        self.list_view.set_factory(factory)
+
+        self.connect("map", self.start_updates)
+        self.connect("unmap", self.stop_updates)
+
+    def set_store(self, store: ByteStore):
+        """Makes the view show the data in the given store."""
+        self.model = HexRowModel(store)
+        self.list_view.set_model(Gtk.NoSelection.new(self.model))
+        self.update()
+
+    # Row widgets
+
+    def setup_row(self, factory, item):
+        box = Gtk.Box(spacing=18)
+        for css_class in ("hex-offset", "hex-bytes", "hex-text"):
+            label = Gtk.Label(xalign=0)
+            label.add_css_class(css_class)
+            label.add_css_class("monospace")
+            box.append(label)
+        # Keep the text column in place for unfinished rows
+        box.get_first_child().get_next_sibling().set_width_chars(BYTES_PER_ROW * 3 + 1)
+        item.set_child(box)
+
+    def bind_row(self, factory, item):
+        row = item.get_item()
+        offset = item.get_child().get_first_child()
+        data = offset.get_next_sibling()
+        text = data.get_next_sibling()
+        offset.set_label(f"{row.offset:08x}")
+        data.set_label(row.hex)
+        text.set_label(row.text)
+
+    # Updates
+
+    def start_updates(self, *args):
+        if self._tick is None:
+            self._tick = self.add_tick_callback(self.update)
+        self.update()
+
+    def stop_updates(self, *args):
+        if self._tick is not None:
+            self.remove_tick_callback(self._tick)
+            self._tick = None
+
+    def update(self, *args):
+        adjustment = self.scrolled_window.get_vadjustment()
+        following = (
+            adjustment.get_value()
+            >= adjustment.get_upper() - adjustment.get_page_size() - 1
+        )
+        if self.model.update() and following:
+            self.list_view.scroll_to(
+                self.model.get_n_items() - 1, Gtk.ListScrollFlags.NONE, None
+            )
+        self.stack.set_visible_child_name(
+            "rows" if self.model.get_n_items() else "empty"
+        )
+        return True
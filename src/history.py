@@ -0,0 +1,367 @@
+"""
+Contains the session history, which keeps everything a session received,
+so that it can be searched (and looked at in the log viewer) long after
+it has left the terminal's scrollback.
+
+Data comes in through the serial handler's traffic listener, off the main
+loop. It is collected into blocks, which are cut at a line end once they
+are BLOCK_SIZE bytes long, compressed on the history thread and appended
+to an (unlinked) temporary file in the cache directory; only the position
+and first line of every block are kept in memory.
+
+Searches run on a thread of their own, over a snapshot of the history.
+"""
+
+from gi.repository import GLib
+from array import array
+import os
+import queue
+import re
+import tempfile
+import threading
+import time
+import zlib
+
+from .logindex import IndexFormat, LineTracker, LogIndex, iter_line_ends
+from .capture import RecordKind
+
+# Amount of data collected into a block before it is compressed (in bytes).
+BLOCK_SIZE = 256 * 1024
+# zlib level used for blocks; the fastest one still shrinks logs ~5-10x.
+COMPRESSION_LEVEL = 1
+# Maximum amount of matching lines remembered by a search; all matches are
+# counted regardless.
+MAX_SEARCH_MATCHES = 1000000
+# Minimum time between two progress reports of a search (in seconds).
+SEARCH_PROGRESS_INTERVAL = 0.1
+
+# Escape sequences, which the terminal does not show and which would get
+# in the way of matches; newlines are left alone so that line numbers of
+# matches can be counted in the stripped data.
+_ESCAPE_SEQUENCES = re.compile(
+    rb"\x1b(?:\[[0-?]*[ -/]*[@-~]|\][^\x07\x1b\n]*(?:\x07|\x1b\\)?|[@-Z\\-_])"
+)
+
+
+def get_history_dir() -> str:
+    """Returns the directory that history files are kept in."""
+    return os.path.join(GLib.get_user_cache_dir(), "serialconsole")
+
+
+class HistoryBlock:
+    """A block of the history: BLOCK_SIZE bytes or so of whole lines."""
+
+    __slots__ = ("first_line", "line_count", "timestamp", "size", "data", "offset")
+
+    def __init__(self, first_line: int, line_count: int, timestamp: int, data):
+        self.first_line = first_line
+        self.line_count = line_count
+        #: Wall-clock time of the first data in the block (in nanoseconds).
+        self.timestamp = timestamp
+        self.size = len(data)
+        #: Uncompressed data, until the block has been compressed.
+        self.data = data
+        #: (offset, size) of the compressed data in the history file.
+        self.offset = None
+
+
+class HistoryStore:
+    """Keeps the full output of a session."""
+
+    def __init__(self, directory: str = None):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._blocks = []
+        self._current = bytearray()
+        self._current_timestamp = 0
+        self._tracker = LineTracker()
+        self._first_line = 0
+        self._size = 0
+        self._file = None
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._serial = None
+        # Offset from time.monotonic_ns() to wall-clock time
+        self._clock_offset = time.time_ns() - time.monotonic_ns()
+
+    @property
+    def line_count(self) -> int:
+        """Amount of lines in the history, including an unfinished last line."""
+        return self._tracker.line + (1 if self._tracker.column else 0)
+
+    @property
+    def size(self) -> int:
+        """Amount of bytes in the history."""
+        return self._size
+
+    def attach(self, serial):
+        """Starts keeping everything read by the serial handler."""
+        self._serial = serial
+        serial.add_traffic_listener(self._on_traffic)
+
+    def close(self):
+        """Stops keeping data and drops the history."""
+        if self._serial is not None:
+            self._serial.remove_traffic_listener(self._on_traffic)
+            self._serial = None
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+        with self._lock:
+            self._blocks = []
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def _on_traffic(self, kind: int, timestamp: int, payload):
+        if kind == RecordKind.RX:
+            self.write(payload, timestamp + self._clock_offset)
+
+    def write(self, data: bytes, timestamp: int = None):
+        """
+        Adds data to the history, received at the given wall-clock time
+        (now if None). Can be called from any thread.
+        """
+        if not data:
+            return
+        with self._lock:
+            if not self._current:
+                self._current_timestamp = timestamp or time.time_ns()
+            self._tracker.feed(data)
+            self._current += data
+            self._size += len(data)
+            if len(self._current) >= BLOCK_SIZE:
+                self._cut_block()
+
+    def write_message(self, text: str):
+        """Adds an info message, on a line of its own, to the history."""
+        with self._lock:
+            column = self._tracker.column
+        self.write((b"\r\n" if column else b"") + f"--- {text} ---\r\n".encode())
+
+    def _cut_block(self):
+        """Turns the complete lines of the current block into a block."""
+        end = len(self._current) - self._tracker.column
+        block = HistoryBlock(
+            self._first_line,
+            self._tracker.line - self._first_line,
+            self._current_timestamp,
+            bytes(self._current[:end]),
+        )
+        del self._current[:end]
+        self._first_line = self._tracker.line
+        self._blocks.append(block)
+
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name="session-history", daemon=True
+            )
+            self._thread.start()
+        self._queue.put(block)
+
+    def _run(self):
+        while True:
+            block = self._queue.get()
+            if block is None:
+                return
+            compressed = zlib.compress(block.data, COMPRESSION_LEVEL)
+            try:
+                if self._file is None:
+                    directory = self.directory or get_history_dir()
+                    os.makedirs(directory, exist_ok=True)
+                    self._file = tempfile.TemporaryFile(
+                        prefix="history-", dir=directory
+                    )
+                offset = self._file.seek(0, os.SEEK_END)
+                self._file.write(compressed)
+                self._file.flush()
+            except (OSError, ValueError):
+                # Keep the block in memory instead; ValueError if the file
+                # was closed in the meantime
+                continue
+            block.offset = (offset, len(compressed))
+            block.data = None
+
+    def read_block(self, block: HistoryBlock) -> bytes:
+        """
+        Returns the data of a block. Raises OSError if the history has
+        been closed.
+        """
+        data = block.data
+        if data is not None:
+            return data
+        file = self._file
+        if file is None:
+            raise OSError("the history has been closed")
+        offset, size = block.offset
+        return zlib.decompress(os.pread(file.fileno(), size, offset))
+
+    def snapshot(self) -> "HistoryIndex":
+        """Returns an index of the history as it is now."""
+        with self._lock:
+            blocks = list(self._blocks)
+            if self._current:
+                blocks.append(
+                    HistoryBlock(
+                        self._first_line,
+                        self.line_count - self._first_line,
+                        self._current_timestamp,
+                        bytes(self._current),
+                    )
+                )
+            return HistoryIndex(self, blocks, self.line_count, self._size)
+
+
+class HistoryIndex(LogIndex):
+    """
+    Index of a snapshot of the history, with one entry per block. Can be
+    shown by the log viewer like the index of a text log.
+    """
+
+    def __init__(self, store: HistoryStore, blocks: list, line_count: int, size: int):
+        self.path = None
+        self.format = IndexFormat.TEXT
+        self.store = store
+        self.blocks = blocks
+        self.offsets = list(range(len(blocks)))
+        self.timestamps = [block.timestamp for block in blocks]
+        self.lines = [block.first_line for block in blocks]
+        self.skips = [0] * len(blocks)
+        self.line_count = line_count
+        self.size = size
+        self.from_sidecar = False
+
+    def load(self):
+        pass
+
+    def read_lines(self, file, index: int) -> list:
+        """
+        Returns the lines of a block (none if the history has been closed);
+        file is not used.
+        """
+        try:
+            data = self.store.read_block(self.blocks[index])
+        except (OSError, ValueError, zlib.error):
+            return []
+        lines = []
+        pos = 0
+        for end in iter_line_ends(data):
+            lines.append((0, RecordKind.RX, data[pos:end]))
+            pos = end
+        if pos < len(data):
+            lines.append((0, RecordKind.RX, data[pos:]))
+        return lines
+
+
+class HistorySearch:
+    """
+    Searches a snapshot of the history on a thread of its own, for text or
+    a regular expression. on_progress(search) is called on the main loop
+    while it runs, and on_done(search) once it has finished; neither is
+    called after cancel().
+
+    Raises re.error if the query is not a valid regular expression.
+    """
+
+    def __init__(
+        self,
+        index: HistoryIndex,
+        query: str,
+        regex: bool,
+        case_sensitive: bool,
+        on_progress,
+        on_done,
+    ):
+        self.index = index
+        pattern = query.encode("utf-8")
+        flags = re.MULTILINE
+        # Plain text is matched against lowercased data rather than with
+        # re.IGNORECASE, which is several times slower.
+        self._lower = not regex and not case_sensitive
+        if self._lower:
+            pattern = pattern.lower()
+        if not regex:
+            pattern = re.escape(pattern)
+        elif not case_sensitive:
+            flags |= re.IGNORECASE
+        self.pattern = re.compile(pattern, flags)
+        self.on_progress = on_progress
+        self.on_done = on_done
+        #: Total amount of matches found so far.
+        self.count = 0
+        #: Numbers of the lines with matches, in order (up to
+        #: MAX_SEARCH_MATCHES of them).
+        self.lines = array("Q")
+        #: Fraction of the history searched so far.
+        self.progress = 0.0
+        self.done = False
+        self._cancelled = False
+
+    def start(self):
+        threading.Thread(target=self._run, name="history-search", daemon=True).start()
+
+    def cancel(self):
+        self._cancelled = True
+
+    def _add_match(self, line: int):
+        self.count += 1
+        lines = self.lines
+        if (not lines or lines[-1] != line) and len(lines) < MAX_SEARCH_MATCHES:
+            lines.append(line)
+
+    def _search_block(self, block: HistoryBlock, data: bytes):
+        finditer = self.pattern.finditer
+        newline_lines = data.count(b"\n") + (0 if data.endswith(b"\n") else 1)
+        if newline_lines == block.line_count:
+            # No lines were broken up for being too long, so line numbers
+            # can be counted with newlines
+            text = _ESCAPE_SEQUENCES.sub(b"", data) if b"\x1b" in data else data
+            if self._lower:
+                text = text.lower()
+            line = block.first_line
+            pos = 0
+            for match in finditer(text):
+                line += text.count(b"\n", pos, match.start())
+                pos = match.start()
+                self._add_match(line)
+            return
+
+        if self._lower:
+            data = data.lower()
+        pos = 0
+        for line, end in enumerate(iter_line_ends(data), block.first_line):
+            for _match in finditer(_ESCAPE_SEQUENCES.sub(b"", data[pos:end])):
+                self._add_match(line)
+            pos = end
+        if pos < len(data):
+            for _match in finditer(_ESCAPE_SEQUENCES.sub(b"", data[pos:])):
+                self._add_match(block.first_line + block.line_count - 1)
+
+    def _run(self):
+        size = sum(block.size for block in self.index.blocks) or 1
+        searched = 0
+        last_report = time.monotonic()
+        for block in self.index.blocks:
+            if self._cancelled:
+                return
+            try:
+                data = self.index.store.read_block(block)
+            except (OSError, ValueError, zlib.error):
+                # The history was closed
+                return
+            self._search_block(block, data)
+            searched += block.size
+            self.progress = searched / size
+            now = time.monotonic()
+            if now - last_report >= SEARCH_PROGRESS_INTERVAL:
+                last_report = now
+                GLib.idle_add(self._report, self.on_progress)
+        self.done = True
+        self.progress = 1.0
+        GLib.idle_add(self._report, self.on_done)
+
+    def _report(self, callback):
+        if not self._cancelled:
+            callback(self)
+        return False
@@ -0,0 +1,641 @@
+"""
+Contains the log file writer. This is kept free of GObject so that it can
+be shared between the GUI logger and headless mode.
+"""
+
+from enum import IntEnum
+import codecs
+import collections
+import errno
+import os
+import threading
+import time
+import traceback
+
+from .capture import (
+    CAPTURE_MAGIC,
+    FILE_HEADER,
+    RECORD_HEADER,
+    RecordKind,
+    clock_record,
+)
+from .logindex import IndexFormat, LogIndexWriter
+from .logrotate import LogRotation, compressor, get_segment_path
+
+# Default time between two log flushes (in seconds).
+DEFAULT_FLUSH_INTERVAL = 1
+# Default amount of written bytes after which the log is flushed early.
+DEFAULT_FLUSH_BYTES = 64 * 1024
+# Default maximum amount of bytes waiting to be written to the log.
+DEFAULT_LOG_QUEUE_SIZE = 16 * 1024 * 1024
+# Longest time (in seconds) to wait for space in a full log queue under the
+# BLOCK overflow policy; the data is dropped after that.
+LOG_BLOCK_TIMEOUT = 1
+
+# Kinds of items queued in a LogWriter.
+_ITEM_DATA = 0
+_ITEM_TEXT = 1
+_ITEM_RECORD = 2
+
+
+class FsyncPolicy(IntEnum):
+    """When to make sure log data has hit the disk (matches the config enum)."""
+
+    NEVER = 0
+    ON_CLOSE = 1
+    ON_FLUSH = 2
+
+
+class DecodeErrors(IntEnum):
+    """How to log invalid UTF-8 in text mode (matches the config enum)."""
+
+    # Write U+FFFD REPLACEMENT CHARACTER in place of invalid data.
+    REPLACE = 0
+    # Write invalid bytes as \xNN escapes.
+    ESCAPE = 1
+    # Leave invalid bytes out.
+    IGNORE = 2
+
+
+_DECODE_ERROR_HANDLERS = {
+    DecodeErrors.REPLACE: "replace",
+    DecodeErrors.ESCAPE: "backslashreplace",
+    DecodeErrors.IGNORE: "ignore",
+}
+
+
+class LogOverflowPolicy(IntEnum):
+    """What to do when the log queue is full (matches the config enum)."""
+
+    # Make the writer wait (up to LOG_BLOCK_TIMEOUT) until the queue has
+    # space. The main thread never waits, and neither do capture records
+    # (see LogWriter.write_record), so they drop the data instead.
+    BLOCK = 0
+    # Drop the new data, and note the amount of dropped bytes in the log.
+    DROP_NEWEST = 1
+
+
+def get_session_log_path(path: str, index: int) -> str:
+    """
+    Returns the log path for the session with the given index. The first
+    session logs to the configured path; other sessions get a numbered
+    file next to it, so that concurrent sessions never share a file.
+    """
+    if not index:
+        return path
+    base, ext = os.path.splitext(path)
+    return f"{base}-{index + 1}{ext}"
+
+
+class LogFile:
+    """
+    Log file for data read from a serial device.
+
+    In binary mode, received data is written as-is; otherwise it is
+    decoded as UTF-8 text. Decoding is incremental, so characters that
+    are split across reads come out whole; NUL bytes are written as "\\0",
+    and invalid data is handled as set by the errors argument.
+
+    A sparse index of the log is kept next to it (see logindex.py).
+    """
+
+    def __init__(
+        self, path: str, binary: bool = False, errors: int = DecodeErrors.REPLACE
+    ):
+        self.path = path
+        self.binary = binary
+        self.errors = DecodeErrors(errors)
+        self._file = None
+        self._decoder = None
+        self._decoder_pending = False
+        self._index = LogIndexWriter(path, IndexFormat.TEXT)
+        #: Size of the log file, in bytes.
+        self.size = 0
+
+    @property
+    def is_open(self) -> bool:
+        return self._file is not None
+
+    def open(self):
+        """Opens the log file for appending. Raises OSError on failure."""
+        # Text is encoded by write(), so the file is always opened in
+        # binary mode.
+        self._file = open(self.path, "a+b")
+        self.size = os.fstat(self._file.fileno()).st_size
+        self._decoder = codecs.getincrementaldecoder("utf-8")(
+            _DECODE_ERROR_HANDLERS[self.errors]
+        )
+        self._decoder_pending = False
+        self._index.open(self.size)
+
+    def _write_bytes(self, data: bytes):
+        self._index.add_text(self.size, data)
+        self.size += self._file.write(data)
+
+    def write(self, data: bytes):
+        """Writes data received from the serial device to the log."""
+        if not self._file:
+            return
+        if self.binary:
+            self._write_bytes(data)
+            return
+
+        # Plain ASCII without NULs is valid UTF-8 as it is; skip decoding
+        # unless the last chunk ended in the middle of a character.
+        if not self._decoder_pending and data.isascii() and b"\0" not in data:
+            self._write_bytes(data)
+            return
+
+        text = self._decoder.decode(data)
+        self._decoder_pending = bool(self._decoder.getstate()[0])
+        self._write_decoded(text)
+
+    def _write_decoded(self, text: str):
+        if "\0" in text:
+            text = text.replace("\0", "\\0")
+        self._write_bytes(text.encode("utf-8"))
+
+    def write_text(self, text: str):
+        """Writes text (e.g. local echo or info messages) to the log."""
+        if not self._file:
+            return
+        self._write_bytes(text.encode("utf-8"))
+
+    def flush(self):
+        if self._file:
+            try:
+                self._file.flush()
+            except ValueError:
+                pass
+            self._index.flush()
+
+    def sync(self):
+        """Flushes the log and waits for the data to be written to disk."""
+        if self._file:
+            self.flush()
+            os.fsync(self._file.fileno())
+
+    def rotate(self, segment: str):
+        """
+        Moves everything written so far to segment, and continues in a new,
+        empty file at the log path. Raises OSError on failure; if moving the
+        file fails, writing continues in the old file.
+        """
+        self.flush()
+        os.rename(self.path, segment)
+        self._file.close()
+        self._file = None
+        # A character split across the rotation still comes out whole,
+        # as the decoder is kept.
+        self._file = open(self.path, "a+b")
+        self.size = 0
+        self._index.rotate(segment)
+
+    def close(self):
+        if self._file:
+            if self._decoder_pending:
+                # Log the incomplete character at the end of the data
+                self._write_decoded(self._decoder.decode(b"", final=True))
+                self._decoder_pending = False
+            self.flush()
+            self._file.close()
+            self._file = None
+            self._index.close()
+
+
+class CaptureFile:
+    """
+    Capture file (see capture.py). Has the same interface as LogFile, so
+    that it can be driven by a LogWriter, but only takes records.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+        self._index = LogIndexWriter(path, IndexFormat.CAPTURE)
+        #: Size of the capture file, in bytes.
+        self.size = 0
+
+    @property
+    def is_open(self) -> bool:
+        return self._file is not None
+
+    def open(self):
+        """
+        Opens the capture file for appending. Raises OSError on failure,
+        including if the file exists but is not a capture.
+        """
+        file = open(self.path, "a+b")
+        try:
+            self.size = os.fstat(file.fileno()).st_size
+            if self.size:
+                file.seek(0)
+                if file.read(len(CAPTURE_MAGIC)) != CAPTURE_MAGIC:
+                    raise OSError(errno.EINVAL, "Not a capture file", self.path)
+            self._file = file
+            self._index.open(self.size)
+            self._start()
+        except BaseException:
+            self._file = None
+            file.close()
+            raise
+
+    def _start(self):
+        """Writes the file header (for new files) and a clock record."""
+        if not self.size:
+            self.size += self._file.write(FILE_HEADER)
+        self.write_records([clock_record()])
+
+    def write_records(self, records: list):
+        """Writes a list of (kind, timestamp, payload) records at once."""
+        if not self._file:
+            return
+        pack = RECORD_HEADER.pack
+        index = self._index
+        offset = self.size
+        parts = []
+        for kind, timestamp, payload in records:
+            if isinstance(payload, str):
+                payload = payload.encode("utf-8")
+            parts.append(pack(kind, timestamp, len(payload)))
+            parts.append(payload)
+            index.add_record(offset, kind, timestamp, payload)
+            offset += RECORD_HEADER.size + len(payload)
+        self.size += self._file.write(b"".join(parts))
+
+    def flush(self):
+        if self._file:
+            try:
+                self._file.flush()
+            except ValueError:
+                pass
+            self._index.flush()
+
+    def sync(self):
+        """Flushes the capture and waits for the data to be written to disk."""
+        if self._file:
+            self.flush()
+            os.fsync(self._file.fileno())
+
+    def rotate(self, segment: str):
+        """
+        Moves everything written so far to segment, and continues in a new
+        capture file at the original path. Raises OSError on failure.
+        """
+        self.flush()
+        os.rename(self.path, segment)
+        self._file.close()
+        self._file = None
+        self._file = open(self.path, "a+b")
+        self.size = 0
+        self._index.rotate(segment)
+        self._start()
+
+    def close(self):
+        if self._file:
+            self.flush()
+            self._file.close()
+            self._file = None
+            self._index.close()
+
+
+class LogWriter:
+    """
+    Writes to a LogFile (or a capture.CaptureFile) from a background thread,
+    so that slow disks do not hold up the caller.
+
+    Data is queued by write()/write_text(), or write_record() for capture
+    files, and written in batches; the log
+    is flushed every flush_interval seconds or flush_bytes written bytes,
+    whichever comes first, and once more when it is closed.
+
+    If rotation is set, the log is rotated between two batches, so no data
+    is lost or reordered; rotated segments are compressed elsewhere (see
+    logrotate.SegmentCompressor).
+    """
+
+    def __init__(
+        self,
+        log: LogFile,
+        flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+        flush_bytes: int = DEFAULT_FLUSH_BYTES,
+        fsync: int = FsyncPolicy.NEVER,
+        queue_size: int = DEFAULT_LOG_QUEUE_SIZE,
+        overflow_policy: int = LogOverflowPolicy.DROP_NEWEST,
+        rotation: LogRotation = None,
+    ):
+        self.log = log
+        self.flush_interval = flush_interval
+        self.flush_bytes = flush_bytes
+        self.fsync = FsyncPolicy(fsync)
+        self.queue_size = queue_size
+        self.overflow_policy = LogOverflowPolicy(overflow_policy)
+        self.rotation = rotation
+
+        #: Called from the writer thread with the exception if writing to
+        #: the log fails. No further data is written afterwards.
+        self.on_error = None
+
+        # Queued (item kind, data) items
+        self._items = collections.deque()
+        self._queued = 0
+        self._unreported_drops = 0
+        self._cond = threading.Condition()
+        self._closing = False
+        self._failed = False
+        self._thread = None
+        # time.monotonic() at which the oldest queued item and the oldest
+        # item of the batch being written were queued, or None
+        self._queued_since = None
+        self._writing_since = None
+
+        #: Total amount of bytes dropped due to the queue being full.
+        self.dropped = 0
+
+    @classmethod
+    def from_config(cls, log: LogFile, config):
+        """Creates a log writer with the settings stored in the config."""
+        return cls(
+            log,
+            flush_interval=config["log-flush-interval"] / 1000,
+            flush_bytes=config["log-flush-bytes"],
+            fsync=config.get_enum("log-fsync"),
+            queue_size=config["log-queue-size"],
+            overflow_policy=config.get_enum("log-overflow-policy"),
+            rotation=LogRotation.from_config(config),
+        )
+
+    @property
+    def path(self) -> str:
+        return self.log.path
+
+    @property
+    def queued(self) -> int:
+        """Amount of bytes waiting to be written."""
+        return self._queued
+
+    @property
+    def lag(self) -> float:
+        """
+        How long (in seconds) the oldest data that has not been written yet
+        has been waiting, or 0 if everything has been written.
+        """
+        since = self._writing_since or self._queued_since
+        if since is None:
+            return 0.0
+        return time.monotonic() - since
+
+    def open(self, after: "LogWriter" = None):
+        """
+        Opens the log file and starts the writer thread. Raises OSError.
+
+        If after is given (a writer for the same file that is still being
+        closed), the log file is opened by the writer thread once that
+        writer is done, so that their data is not mixed up; failing to
+        open it is then reported through on_error.
+        """
+        if after is None:
+            self.log.open()
+        self._closing = False
+        self._failed = False
+        self._thread = threading.Thread(
+            target=self._run, args=(after,), name="log-writer", daemon=True
+        )
+        self._thread.start()
+
+    def close(self, timeout: float = None) -> bool:
+        """
+        Stops taking data; the writer thread writes out all queued data,
+        then closes the log file. Waits up to timeout seconds (or until
+        it is done if None) for that, and returns whether it is done.
+        """
+        thread = self._thread
+        if thread is None:
+            return True
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+        thread.join(timeout)
+        if thread.is_alive():
+            return False
+        self._thread = None
+        return True
+
+    def write(self, data: bytes):
+        """Queues data received from the serial device for writing."""
+        if data:
+            self._put(_ITEM_DATA, data, len(data))
+
+    def write_text(self, text: str):
+        """Queues text (e.g. local echo or info messages) for writing."""
+        if text:
+            self._put(_ITEM_TEXT, text, len(text))
+
+    def write_record(self, kind: int, timestamp: int, payload):
+        """
+        Queues a record for a capture file; timestamp is the time.monotonic_ns()
+        value for the moment the payload was sent or received.
+
+        This is called from the I/O threads, so it never waits for queue
+        space: if the queue is full, the record is dropped (and counted in
+        dropped) regardless of the overflow policy.
+        """
+        self._put(_ITEM_RECORD, (kind, timestamp, payload), len(payload), block=False)
+
+    def _drop_marker(self) -> tuple:
+        count = self._unreported_drops
+        self._unreported_drops = 0
+        if hasattr(self.log, "write_records"):
+            message = f"{count} bytes dropped"
+            return (_ITEM_RECORD, (RecordKind.EVENT, time.monotonic_ns(), message))
+        return (_ITEM_TEXT, f"\r\n--- {count} bytes dropped ---\r\n")
+
+    def _put(self, item_kind: int, data, size: int, block: bool = True):
+        with self._cond:
+            if self._thread is None or self._closing or self._failed:
+                return
+
+            if self._queued + size > self.queue_size and self._queued:
+                # Waiting on the main thread would freeze the UI (or the
+                # event loop in headless mode), so only other threads wait
+                if (
+                    block
+                    and self.overflow_policy == LogOverflowPolicy.BLOCK
+                    and threading.current_thread() is not threading.main_thread()
+                ):
+                    self._cond.wait_for(
+                        lambda: (
+                            self._queued + size <= self.queue_size
+                            or not self._queued
+                            or self._closing
+                        ),
+                        LOG_BLOCK_TIMEOUT,
+                    )
+                if (
+                    self._queued + size > self.queue_size
+                    and self._queued
+                    and not self._closing
+                ):
+                    self.dropped += size
+                    self._unreported_drops += size
+                    return
+
+            if not self._items:
+                self._queued_since = time.monotonic()
+            if self._unreported_drops:
+                self._items.append(self._drop_marker())
+            self._items.append((item_kind, data))
+            self._queued += size
+            self._cond.notify_all()
+
+    def _take_batch(self, timeout) -> tuple:
+        """
+        Waits up to timeout seconds (or indefinitely if None) for data and
+        takes everything that was queued so far.
+        """
+        with self._cond:
+            if not self._items and not self._closing:
+                self._cond.wait(timeout)
+            items = self._items
+            self._items = collections.deque()
+            self._queued = 0
+            self._writing_since = self._queued_since
+            self._queued_since = None
+            closing = self._closing
+            if closing and self._unreported_drops:
+                items.append(self._drop_marker())
+            self._cond.notify_all()
+        return items, closing
+
+    def _write_batch(self, items) -> int:
+        """
+        Writes queued items, joining runs of items of the same kind into
+        a single write. Returns the amount of written bytes.
+        """
+        written = 0
+        run = []
+        run_kind = _ITEM_DATA
+        for item_kind, data in items:
+            if run and item_kind != run_kind:
+                written += self._write_run(run_kind, run)
+                run = []
+            run_kind = item_kind
+            run.append(data)
+        if run:
+            written += self._write_run(run_kind, run)
+        return written
+
+    def _write_run(self, item_kind: int, run: list) -> int:
+        if item_kind == _ITEM_RECORD:
+            self.log.write_records(run)
+            return sum(len(payload) for _kind, _timestamp, payload in run)
+        if item_kind == _ITEM_TEXT:
+            data = "".join(run)
+            self.log.write_text(data)
+        else:
+            data = b"".join(run)
+            self.log.write(data)
+        return len(data)
+
+    def _flush(self, sync: bool):
+        if sync:
+            self.log.sync()
+        else:
+            self.log.flush()
+
+    def _rotate_if_needed(self, next_rotation) -> tuple:
+        """
+        Rotates the log if it is too large or the rotation interval has
+        passed. Returns a tuple of whether the log was rotated and the time
+        of the next interval-based rotation.
+        """
+        now = time.time()
+        rotation = self.rotation
+        if not (
+            (rotation.max_size and self.log.size >= rotation.max_size)
+            or (next_rotation is not None and now >= next_rotation)
+        ):
+            return False, next_rotation
+
+        next_rotation = rotation.next_rotation_time(now)
+        if not self.log.size:
+            return False, next_rotation
+
+        # Make sure the segment is complete before it gets compressed.
+        self._flush(self.fsync != FsyncPolicy.NEVER)
+        segment = get_segment_path(self.log.path, now)
+        try:
+            self.log.rotate(segment)
+        except OSError:
+            if not self.log.is_open:
+                raise
+            traceback.print_exc()
+            return False, next_rotation
+
+        compressor.submit(self.log.path, segment, rotation)
+        return True, next_rotation
+
+    def _fail(self, e: OSError):
+        traceback.print_exc()
+        self._failed = True
+        if self.on_error:
+            self.on_error(e)
+
+    def _run(self, after):
+        if after is not None:
+            after.close()
+            try:
+                self.log.open()
+            except OSError as e:
+                self._fail(e)
+
+        last_flush = time.monotonic()
+        unflushed = 0
+        rotating = self.rotation is not None and self.rotation.enabled
+        next_rotation = None
+        if rotating:
+            next_rotation = self.rotation.next_rotation_time(time.time())
+
+        while True:
+            timeout = None
+            if unflushed:
+                timeout = max(0, last_flush + self.flush_interval - time.monotonic())
+            if next_rotation is not None:
+                until_rotation = max(0, next_rotation - time.time())
+                timeout = (
+                    until_rotation if timeout is None else min(timeout, until_rotation)
+                )
+            items, closing = self._take_batch(timeout)
+
+            try:
+                if items and not self._failed:
+                    unflushed += self._write_batch(items)
+                self._writing_since = None
+
+                now = time.monotonic()
+                if closing:
+                    if not self._failed:
+                        self._flush(self.fsync != FsyncPolicy.NEVER)
+                    self.log.close()
+                    return
+                if rotating and not self._failed:
+                    rotated, next_rotation = self._rotate_if_needed(next_rotation)
+                    if rotated:
+                        unflushed = 0
+                        last_flush = now
+                if unflushed and (
+                    unflushed >= self.flush_bytes
+                    or now - last_flush >= self.flush_interval
+                ):
+                    self._flush(self.fsync == FsyncPolicy.ON_FLUSH)
+                    unflushed = 0
+                    last_flush = now
+            except OSError as e:
+                self._fail(e)
+                unflushed = 0
+                if closing:
+                    try:
+                        self.log.close()
+                    except OSError:
+                        pass
+                    return
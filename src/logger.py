@@ -4,9 +4,36 @@ Contains code for handling the serial device.
 
 from gi.repository import GLib, GObject, Gio
 import os
+import sys
+import time
 
+from .capture import RecordKind, get_capture_path
 from .config import config
-from .serial import SerialHandlerState
+from .logfile import (
+    CaptureFile,
+    LogFile,
+    LogWriter,
+    FsyncPolicy,
+    LOG_BLOCK_TIMEOUT,
+    LogOverflowPolicy,
+    get_session_log_path,
+)
+
+# Config keys that are passed on to the log writer while it is running.
+LOG_WRITER_CONFIG_KEYS = (
+    "log-flush-interval",
+    "log-flush-bytes",
+    "log-fsync",
+    "log-overflow-policy",
+)
+
+# Config keys for log rotation.
+LOG_ROTATION_CONFIG_KEYS = (
+    "log-rotate-size",
+    "log-rotate-interval",
+    "log-compression",
+    "log-keep-segments",
+)
 
 # TRANSLATORS: Default log file filename, lowercase, preferrably with no spaces.
 # Do not add a file extension!
@@ -14,23 +41,56 @@ DEFAULT_LOG_FILENAME = _("serial-log") + ".txt"
 
 
 class SerialLogger(GObject.Object):
-    """Handles logging for the serial file."""
+    """
+    Handles logging for the serial file.
+
+    Writing happens on a background thread (see logfile.LogWriter), so
+    the handlers here only queue data. Closed logs are written out on that
+    thread too; only shutdown() waits for them, for a limited time.
 
-    def __init__(self, serial):
+    With log-capture set, a capture file (see capture.py) is written
+    instead of a text log. Data for it comes straight from the serial
+    handler's traffic listener, so that it is timestamped when it is read.
+    """
+
+    def __init__(self, serial, index: int = 0):
         super().__init__()
-        self._file = None
+        self._log = None
+        self._capture = False
+        self._index = index
+        # Closed log writers that may still be writing out queued data
+        self._closing_logs = []
 
         self.serial = serial
         self.serial.connect("read_done", self.serial_read)
-        self.serial.connect("notify::state", self.start_flush_timeout)
+        self.serial.connect("read_spilled", self.serial_read)
 
         config.bind("log-path", self, "log-path", flags=Gio.SettingsBindFlags.DEFAULT)
-        config.connect("changed::log-binary", self.reopen_log)
+        self._config_handlers = [
+            config.connect("changed::log-binary", self.reopen_log),
+            config.connect("changed::log-capture", self.reopen_log),
+            config.connect("changed::log-decode-errors", self.reopen_log),
+            config.connect("changed::log-queue-size", self.reopen_log),
+        ]
+        # Rotation is scheduled when the writer starts, so reopen the log
+        # for changes to take effect.
+        for key in LOG_ROTATION_CONFIG_KEYS:
+            self._config_handlers.append(
+                config.connect(f"changed::{key}", self.reopen_log)
+            )
+        for key in LOG_WRITER_CONFIG_KEYS:
+            self._config_handlers.append(
+                config.connect(f"changed::{key}", self.update_writer_settings)
+            )
 
     @GObject.Signal
     def log_open_failure(self):
         pass
 
+    @GObject.Signal
+    def log_write_failure(self):
+        pass
+
     @GObject.Property(type=str)
     def log_path(self):
         return self._path
@@ -41,6 +101,7 @@ class SerialLogger(GObject.Object):
         if not value:
             self.close_log()
             return
+        value = get_session_log_path(value, self._index)
 
         if not os.path.exists(value):
             basedir = os.path.dirname(value)
@@ -58,59 +119,147 @@ class SerialLogger(GObject.Object):
         self.close_log()
         self.open_log()
 
+    @property
+    def is_logging(self) -> bool:
+        """Whether a log file is open."""
+        return self._log is not None
+
+    @GObject.Property(type=float, flags=GObject.ParamFlags.READABLE)
+    def write_lag(self):
+        """
+        How long (in milliseconds) the oldest data that has not been written
+        to the log yet has been waiting. Not notified, like the statistics
+        of the serial handler.
+        """
+        if not self._log:
+            return 0.0
+        return self._log.lag * 1000
+
+    @GObject.Property(type=GObject.TYPE_UINT64, flags=GObject.ParamFlags.READABLE)
+    def write_queued_bytes(self):
+        """Amount of bytes waiting to be written to the log."""
+        if not self._log:
+            return 0
+        return self._log.queued
+
+    @GObject.Property(type=GObject.TYPE_UINT64, flags=GObject.ParamFlags.READABLE)
+    def write_dropped_bytes(self):
+        """Amount of bytes dropped because the log could not keep up."""
+        if not self._log:
+            return 0
+        return self._log.dropped
+
+    def get_file_path(self) -> str:
+        """Returns the path of the file the log is written to."""
+        path = get_session_log_path(self._path, self._index)
+        if config["log-capture"]:
+            return get_capture_path(path)
+        return path
+
     def serial_read(self, serial, data, *args):
-        if self._file:
-            if config["log-binary"]:
-                self._file.write(data.get_data())
-            else:
-                if data.get_data() == bytes(0x00):
-                    self._file.write(r"\0")
-                else:
-                    try:
-                        self._file.write(data.get_data().decode("utf-8"))
-                    except UnicodeDecodeError:
-                        self._file.write("�")
+        if self._log and not self._capture:
+            self._log.write(data.get_data())
+
+    def serial_traffic(self, kind, timestamp, payload):
+        """Records data passing over the port. Runs in the I/O threads."""
+        log = self._log
+        if log and self._capture:
+            log.write_record(kind, timestamp, payload)
 
     def write_text(self, text):
-        """Writes text to the log file."""
-        if self._file:
-            if config["log-binary"]:
-                self._file.write(bytes(text, "utf-8"))
-            else:
-                self._file.write(text)
-
-    def flush_log(self, *args):
-        """Flushes the logfile."""
-        if self._file:
-            try:
-                self._file.flush()
-            except ValueError:
-                pass
-        return self.serial.state == SerialHandlerState.CLOSED
+        """
+        Writes text (i.e. local echo) to the log file. Captures already
+        contain the sent data, so this is only written to text logs.
+        """
+        if self._log and not self._capture:
+            self._log.write_text(text)
+
+    def write_message(self, text):
+        """Writes an info message to the log file."""
+        if not self._log:
+            return
+        if self._capture:
+            self._log.write_record(RecordKind.INFO, time.monotonic_ns(), text)
+        else:
+            self._log.write_text(f"\r\n--- {text} ---")
 
     def open_log(self):
         """Opens the logfile."""
+        capture = config["log-capture"]
+        if capture:
+            file = CaptureFile(self.get_file_path())
+        else:
+            file = LogFile(
+                self.get_file_path(),
+                config["log-binary"],
+                config.get_enum("log-decode-errors"),
+            )
+        log = LogWriter.from_config(file, config)
+        log.on_error = self._on_write_error
+        # Let a closed writer for the same file finish before writing to it
+        after = None
+        for closing in self._closing_logs:
+            if closing.path == file.path:
+                after = closing
         try:
-            if config["log-binary"]:
-                self._file = open(self._path, "a+b")
-            else:
-                self._file = open(self._path, "a+")
+            log.open(after)
         except:  # noqa: E722
             self.emit("log-open-failure")
             return
+        self._capture = capture
+        self._log = log
+        if capture:
+            self.serial.add_traffic_listener(self.serial_traffic)
+
+    def update_writer_settings(self, *args):
+        """Passes changed flush/overflow settings on to the log writer."""
+        if not self._log:
+            return
+        self._log.flush_interval = config["log-flush-interval"] / 1000
+        self._log.flush_bytes = config["log-flush-bytes"]
+        self._log.fsync = FsyncPolicy(config.get_enum("log-fsync"))
+        self._log.overflow_policy = LogOverflowPolicy(
+            config.get_enum("log-overflow-policy")
+        )
+
+    def _on_write_error(self, e: Exception):
+        GLib.idle_add(self.emit, "log-write-failure")
 
     def close_log(self, *args):
         """Closes the logfile."""
-        if self._file:
-            self.flush_log()
-            self._file.close()
-            self._file = None
+        if self._log:
+            if self._capture:
+                self.serial.remove_traffic_listener(self.serial_traffic)
+            log = self._log
+            self._log = None
+            self._closing_logs = [
+                closing for closing in self._closing_logs if not closing.close(0)
+            ]
+            if not log.close(0):
+                self._closing_logs.append(log)
+
+    def shutdown(self):
+        """
+        Closes the logfile and stops following the config. Waits up to
+        LOG_BLOCK_TIMEOUT for closed logs to be written out.
+        """
+        for handler in self._config_handlers:
+            config.disconnect(handler)
+        self._config_handlers = []
+        Gio.Settings.unbind(self, "log-path")
+        self.close_log()
+
+        deadline = time.monotonic() + LOG_BLOCK_TIMEOUT
+        for log in self._closing_logs:
+            if not log.close(max(0, deadline - time.monotonic())):
+                print(
+                    f"Log file {log.path} is still being written, "
+                    "data may be lost if the app quits now",
+                    file=sys.stderr,
+                )
+        self._closing_logs = []
 
     def reopen_log(self, *args):
-        if self._file:
+        if self._log:
             self.close_log()
             self.open_log()
-
-    def start_flush_timeout(self, *args):
-        if self.serial.state == SerialHandlerState.OPEN:
-            GLib.timeout_add(1000, self.flush_log)
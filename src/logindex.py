@@ -0,0 +1,556 @@
+"""
+Contains the sparse log index, which maps byte offsets in a log or capture
+file to line numbers and timestamps, so that the log viewer can jump to any
+line or time without reading the whole file.
+
+The index is kept in a sidecar file next to the log (with INDEX_EXTENSION
+appended to its name), written by the log writer as data comes in. It
+starts with an 8-byte header (INDEX_MAGIC, the format version, the
+IndexFormat of the log and a reserved byte), followed by fixed-size
+entries of:
+
+    offset (u64) | timestamp (i64) | line (u64) | skip (u32) | reserved (u32)
+
+Every entry marks the start of a line. offset is where the line starts in
+text logs; in capture files, it is the offset of the record the line starts
+in, and skip is the position of the line start in the record's payload.
+timestamp is the wall-clock time in nanoseconds since the epoch (the record
+timestamp for captures, the time of writing for text logs), or 0 if unknown.
+"""
+
+from bisect import bisect_right
+from enum import IntEnum
+import os
+import struct
+import time
+import traceback
+
+from .capture import CAPTURE_MAGIC, RecordKind, get_clock_offset, iter_records
+
+INDEX_MAGIC = b"SCIDX"
+INDEX_VERSION = 1
+INDEX_EXTENSION = ".idx"
+
+ENTRY = struct.Struct("<QqQI4x")
+
+# Minimum distance between two index entries (in bytes).
+INDEX_INTERVAL = 256 * 1024
+# Lines longer than this are broken up, so that binary data without
+# newlines still gets indexed.
+MAX_LINE_LENGTH = 4096
+# Maximum amount of unindexed data at the end of a log that the writer
+# indexes when it reopens the log; for larger amounts, the index is dropped
+# and the viewer falls back to scanning the log.
+MAX_CATCH_UP = 64 * 1024 * 1024
+# Size of the blocks read when scanning a log.
+SCAN_BLOCK_SIZE = 1024 * 1024
+
+
+class IndexFormat(IntEnum):
+    TEXT = 0
+    CAPTURE = 1
+
+
+def get_index_path(path: str) -> str:
+    """Returns the path of the index sidecar for the log at path."""
+    return path + INDEX_EXTENSION
+
+
+def get_log_format(path: str) -> IndexFormat:
+    """Returns whether the file at path is a text log or a capture."""
+    with open(path, "rb") as file:
+        if file.read(len(CAPTURE_MAGIC)) == CAPTURE_MAGIC:
+            return IndexFormat.CAPTURE
+    return IndexFormat.TEXT
+
+
+def iter_line_ends(data, pos: int = 0, column: int = 0):
+    """
+    Yields the end positions (exclusive) of the lines that end in data,
+    starting at pos, where column bytes of the current line came before.
+
+    A line ends after a newline, or once it is MAX_LINE_LENGTH bytes long.
+    """
+    size = len(data)
+    while pos < size:
+        limit = pos + MAX_LINE_LENGTH - column
+        newline = data.find(b"\n", pos, limit)
+        if newline != -1:
+            pos = newline + 1
+        elif limit <= size:
+            pos = limit
+        else:
+            return
+        column = 0
+        yield pos
+
+
+def _has_long_lines(data, column: int) -> bool:
+    """Returns whether iter_line_ends would break up any lines in data."""
+    first = data.find(b"\n")
+    if first == -1:
+        return column + len(data) >= MAX_LINE_LENGTH
+    if column + first >= MAX_LINE_LENGTH:
+        return True
+    # Every run of MAX_LINE_LENGTH bytes without a newline contains one of
+    # these blocks, so it is enough to check that all of them have one.
+    step = MAX_LINE_LENGTH // 2
+    for block in range(first, len(data) - step + 1, step):
+        if data.find(b"\n", block, block + step) == -1:
+            return True
+    return False
+
+
+class LineTracker:
+    """Follows the line structure of a stream of data."""
+
+    def __init__(self, line: int = 0):
+        #: Number of the line being written, counting from 0.
+        self.line = line
+        #: Amount of bytes written to the current line so far.
+        self.column = 0
+
+    def feed(self, data) -> int:
+        """
+        Follows data added to the stream. Returns the position of the first
+        line start in data, or -1 if there is none.
+        """
+        size = len(data)
+        start = 0 if not self.column else -1
+
+        if self.column + size < MAX_LINE_LENGTH or not _has_long_lines(
+            data, self.column
+        ):
+            count = data.count(b"\n")
+            if not count:
+                self.column += size
+                return start
+            if start == -1:
+                start = data.find(b"\n") + 1
+                if start == size:
+                    start = -1
+            self.line += count
+            self.column = size - data.rfind(b"\n") - 1
+            return start
+
+        end = None
+        for end in iter_line_ends(data, 0, self.column):
+            self.line += 1
+            if start == -1 and end < size:
+                start = end
+        if end is None:
+            self.column += size
+        else:
+            self.column = size - end
+        return start
+
+    def break_line(self):
+        """Ends the current line early, e.g. before an info message."""
+        if self.column:
+            self.line += 1
+            self.column = 0
+
+
+class IndexBuilder:
+    """
+    Follows the data written to a log and decides where index entries go.
+    on_entry(offset, timestamp, line, skip) is called for every new entry.
+    """
+
+    def __init__(self, on_entry, line: int = 0, last_offset: int = None):
+        self.on_entry = on_entry
+        self.tracker = LineTracker(line)
+        self.last_offset = last_offset
+        #: Offset between record timestamps and wall-clock time, for captures.
+        self.clock_offset = 0
+
+    @property
+    def line_count(self) -> int:
+        """Amount of lines seen so far, including an unfinished last line."""
+        return self.tracker.line + (1 if self.tracker.column else 0)
+
+    def _due(self, offset: int) -> bool:
+        return self.last_offset is None or offset - self.last_offset >= INDEX_INTERVAL
+
+    def _add(self, offset: int, timestamp: int, line: int, skip: int = 0):
+        self.last_offset = offset
+        self.on_entry(offset, timestamp, line, skip)
+
+    def add_text(self, offset: int, data, timestamp: int = None):
+        """
+        Follows data written to a text log at the given offset, at the given
+        wall-clock time (now if None, 0 if unknown).
+        """
+        if len(data) > INDEX_INTERVAL:
+            # Large writes may need more than one entry.
+            for pos in range(0, len(data), INDEX_INTERVAL):
+                self.add_text(offset + pos, data[pos : pos + INDEX_INTERVAL], timestamp)
+            return
+
+        line = self.tracker.line
+        start = self.tracker.feed(data)
+        if start != -1 and self._due(offset + start):
+            if timestamp is None:
+                timestamp = time.time_ns()
+            self._add(offset + start, timestamp, line if not start else line + 1)
+
+    def add_record(self, offset: int, kind: int, timestamp: int, payload):
+        """Follows a record written to a capture file at the given offset."""
+        if kind == RecordKind.CLOCK:
+            self.clock_offset = get_clock_offset(payload, timestamp)
+        elif kind == RecordKind.RX:
+            line = self.tracker.line
+            start = self.tracker.feed(payload)
+            if start != -1 and self._due(offset):
+                self._add(
+                    offset,
+                    timestamp + self.clock_offset,
+                    line if not start else line + 1,
+                    start,
+                )
+        elif kind in (RecordKind.INFO, RecordKind.EVENT):
+            self.tracker.break_line()
+            if self._due(offset):
+                self._add(offset, timestamp + self.clock_offset, self.tracker.line)
+            self.tracker.line += 1
+
+
+def scan_text(file, builder: IndexBuilder, start: int, end: int = None):
+    """Feeds the text log data from start to end into builder."""
+    file.seek(start)
+    offset = start
+    while end is None or offset < end:
+        size = SCAN_BLOCK_SIZE
+        if end is not None:
+            size = min(size, end - offset)
+        data = file.read(size)
+        if not data:
+            break
+        builder.add_text(offset, data, 0)
+        offset += len(data)
+
+
+def scan_capture(
+    file,
+    builder: IndexBuilder,
+    start: int = 0,
+    skip: int = 0,
+    timestamp: int = 0,
+    end: int = None,
+):
+    """
+    Feeds the capture records from start to end into builder. If skip is
+    set, the payload of the first record is only followed from there on;
+    timestamp is the wall-clock time of the first record, if known.
+    """
+    first = True
+    for offset, kind, record_timestamp, payload in iter_records(file, start):
+        if end is not None and offset >= end:
+            return
+        if first:
+            if timestamp:
+                builder.clock_offset = timestamp - record_timestamp
+            if skip:
+                payload = payload[skip:]
+            first = False
+        builder.add_record(offset, kind, record_timestamp, payload)
+
+
+def _header(log_format: IndexFormat) -> bytes:
+    return INDEX_MAGIC + bytes((INDEX_VERSION, log_format, 0))
+
+
+def read_index(path: str, log_format: IndexFormat, log_size: int):
+    """
+    Reads the index sidecar at path. Returns a list of (offset, timestamp,
+    line, skip) entries, or None if there is no usable index for the log.
+    """
+    try:
+        with open(path, "rb") as file:
+            data = file.read()
+    except OSError:
+        return None
+
+    header = _header(log_format)
+    if data[: len(header)] != header:
+        return None
+
+    entries = []
+    # A partially written entry at the end is ignored.
+    for offset in range(len(header), len(data) - ENTRY.size + 1, ENTRY.size):
+        entry = ENTRY.unpack_from(data, offset)
+        if entry[0] > log_size or (entries and entry[0] < entries[-1][0]):
+            return None
+        entries.append(entry)
+    return entries
+
+
+class LogIndexWriter:
+    """
+    Maintains the index sidecar for a log while it is written.
+
+    The index is a best-effort helper: if it cannot be read or written,
+    it is dropped, and the viewer scans the log instead.
+    """
+
+    def __init__(self, log_path: str, log_format: IndexFormat):
+        self.log_path = log_path
+        self.path = get_index_path(log_path)
+        self.format = log_format
+        self._file = None
+        self._pending = bytearray()
+        self.builder = None
+
+    @property
+    def enabled(self) -> bool:
+        return self._file is not None
+
+    def open(self, log_size: int):
+        """
+        Opens the index for the log, which is log_size bytes long, and
+        indexes whatever was written to the log after the last entry.
+        """
+        try:
+            self._open(log_size)
+        except OSError:
+            traceback.print_exc()
+            self._disable()
+
+    def _open(self, log_size: int):
+        self._pending.clear()
+        if not log_size:
+            self._file = open(self.path, "wb")
+            self._file.write(_header(self.format))
+            self.builder = IndexBuilder(self._add_entry)
+            return
+
+        entries = read_index(self.path, self.format, log_size)
+        last = entries[-1] if entries else None
+        if entries is None or log_size - (last[0] if last else 0) > MAX_CATCH_UP:
+            # Indexing the log from scratch would hold up the writer for
+            # too long; leave it to the viewer.
+            self._disable()
+            return
+
+        with open(self.path, "r+b") as file:
+            file.truncate(len(_header(self.format)) + len(entries) * ENTRY.size)
+
+        self._file = open(self.path, "ab")
+        if last:
+            offset, timestamp, line, skip = last
+            self.builder = IndexBuilder(self._add_entry, line, offset)
+        else:
+            offset = timestamp = skip = 0
+            self.builder = IndexBuilder(self._add_entry)
+
+        with open(self.log_path, "rb") as log:
+            if self.format == IndexFormat.CAPTURE:
+                scan_capture(log, self.builder, offset, skip, timestamp, log_size)
+            else:
+                scan_text(log, self.builder, offset, log_size)
+
+    def _disable(self):
+        if self._file:
+            self._file.close()
+        self._file = None
+        self.builder = None
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+        except OSError:
+            traceback.print_exc()
+
+    def _add_entry(self, offset: int, timestamp: int, line: int, skip: int):
+        self._pending += ENTRY.pack(offset, timestamp, line, skip)
+
+    def add_text(self, offset: int, data):
+        if self.builder:
+            self.builder.add_text(offset, data)
+
+    def add_record(self, offset: int, kind: int, timestamp: int, payload):
+        if self.builder:
+            self.builder.add_record(offset, kind, timestamp, payload)
+
+    def flush(self):
+        """Writes out pending entries."""
+        if not self._file or not self._pending:
+            return
+        try:
+            self._file.write(self._pending)
+            self._file.flush()
+        except OSError:
+            traceback.print_exc()
+            self._disable()
+        self._pending.clear()
+
+    def rotate(self, segment: str):
+        """Moves the index along with a log rotated out to segment."""
+        if not self._file:
+            self.open(0)
+            return
+        self.flush()
+        self._file.close()
+        self._file = None
+        try:
+            os.rename(self.path, get_index_path(segment))
+        except OSError:
+            traceback.print_exc()
+        self.open(0)
+
+    def close(self):
+        if self._file:
+            self.flush()
+            if self._file:
+                self._file.close()
+                self._file = None
+
+
+class LogIndex:
+    """
+    In-memory index of a log, used by the viewer. Built from the index
+    sidecar plus a scan of whatever was written after its last entry; logs
+    without a sidecar are scanned in full.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.format = get_log_format(path)
+        self.offsets = []
+        self.timestamps = []
+        self.lines = []
+        self.skips = []
+        #: Amount of lines in the log.
+        self.line_count = 0
+        #: Amount of bytes of the log that were indexed.
+        self.size = 0
+        #: Whether the sidecar was used.
+        self.from_sidecar = False
+
+    def _add_entry(self, offset: int, timestamp: int, line: int, skip: int):
+        self.offsets.append(offset)
+        self.timestamps.append(timestamp)
+        self.lines.append(line)
+        self.skips.append(skip)
+
+    def load(self):
+        """Builds the index. Raises OSError if the log cannot be read."""
+        size = os.path.getsize(self.path)
+        entries = read_index(get_index_path(self.path), self.format, size) or []
+        self.from_sidecar = bool(entries)
+        for entry in entries:
+            self._add_entry(*entry)
+
+        if entries:
+            offset, timestamp, line, skip = entries[-1]
+            builder = IndexBuilder(self._add_entry, line, offset)
+        else:
+            offset = timestamp = skip = 0
+            builder = IndexBuilder(self._add_entry)
+
+        with open(self.path, "rb") as log:
+            if self.format == IndexFormat.CAPTURE:
+                scan_capture(log, builder, offset, skip, timestamp, size)
+            else:
+                scan_text(log, builder, offset, size)
+
+        self.line_count = builder.line_count
+        self.size = size
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def find_line(self, line: int) -> int:
+        """Returns the index of the entry that the given line comes after."""
+        return max(0, bisect_right(self.lines, line) - 1)
+
+    def find_time(self, timestamp: int) -> int:
+        """
+        Returns the index of the last entry at or before the given
+        wall-clock time (in nanoseconds since the epoch).
+        """
+        return max(0, bisect_right(self.timestamps, timestamp) - 1)
+
+    def get_chunk_range(self, index: int) -> tuple:
+        """Returns the first line and the amount of lines of a chunk."""
+        first = self.lines[index]
+        if index + 1 < len(self.lines):
+            return first, self.lines[index + 1] - first
+        return first, self.line_count - first
+
+    def read_lines(self, file, index: int) -> list:
+        """
+        Returns the lines of the chunk starting at the given entry, as
+        (timestamp, kind, data) tuples. file is the log, opened in binary
+        mode (or mapped into memory). For text logs, timestamp is 0 and
+        kind is always RecordKind.RX.
+        """
+        _first, count = self.get_chunk_range(index)
+        start = self.offsets[index]
+        lines = []
+        if not count:
+            return lines
+
+        if self.format == IndexFormat.TEXT:
+            if index + 1 < len(self.offsets):
+                end = self.offsets[index + 1]
+            else:
+                end = self.size
+            file.seek(start)
+            data = file.read(end - start)
+            pos = 0
+            for end in iter_line_ends(data):
+                lines.append((0, RecordKind.RX, data[pos:end]))
+                pos = end
+                if len(lines) == count:
+                    return lines
+            if pos < len(data):
+                lines.append((0, RecordKind.RX, data[pos:]))
+            return lines
+
+        current = bytearray()
+        current_timestamp = 0
+        clock_offset = 0
+        skip = self.skips[index]
+        first = True
+        for _offset, kind, timestamp, payload in iter_records(
+            file, start, INDEX_INTERVAL
+        ):
+            if first:
+                clock_offset = self.timestamps[index] - timestamp
+                payload = payload[skip:]
+                first = False
+            if kind == RecordKind.CLOCK:
+                clock_offset = get_clock_offset(payload, timestamp)
+                continue
+            timestamp += clock_offset
+
+            if kind == RecordKind.RX:
+                pos = 0
+                for end in iter_line_ends(payload, 0, len(current)):
+                    if not current:
+                        current_timestamp = timestamp
+                    lines.append(
+                        (current_timestamp, kind, bytes(current) + payload[pos:end])
+                    )
+                    current.clear()
+                    pos = end
+                    if len(lines) == count:
+                        return lines
+                if pos < len(payload):
+                    if not current:
+                        current_timestamp = timestamp
+                    current += payload[pos:]
+            elif kind in (RecordKind.INFO, RecordKind.EVENT):
+                if current:
+                    lines.append((current_timestamp, RecordKind.RX, bytes(current)))
+                    current.clear()
+                    if len(lines) == count:
+                        return lines
+                lines.append((timestamp, kind, payload))
+                if len(lines) == count:
+                    return lines
+
+        if current:
+            lines.append((current_timestamp, RecordKind.RX, bytes(current)))
+        return lines
@@ -0,0 +1,248 @@
+"""
+Contains log rotation: naming of rotated log segments, their compression
+(on a background thread) and retention.
+"""
+
+from enum import IntEnum
+import gzip
+import lzma
+import os
+import queue
+import re
+import shutil
+import sys
+import threading
+import time
+import traceback
+
+from .logindex import get_index_path
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Size of the blocks copied into the compressor at once.
+COMPRESS_BLOCK_SIZE = 1024 * 1024
+
+# Whether the missing zstandard module was reported already.
+_zstd_fallback_reported = False
+
+
+class LogCompression(IntEnum):
+    """Compression for rotated log segments (matches the config enum)."""
+
+    NONE = 0
+    GZIP = 1
+    XZ = 2
+    # Needs the zstandard module; falls back to gzip if it is missing.
+    ZSTD = 3
+
+
+COMPRESSION_SUFFIXES = {
+    LogCompression.NONE: "",
+    LogCompression.GZIP: ".gz",
+    LogCompression.XZ: ".xz",
+    LogCompression.ZSTD: ".zst",
+}
+
+
+def get_available_compression(compression: int) -> LogCompression:
+    """Returns the given compression, or a fallback if it is unavailable."""
+    global _zstd_fallback_reported
+    compression = LogCompression(compression)
+    if compression == LogCompression.ZSTD and zstandard is None:
+        if not _zstd_fallback_reported:
+            _zstd_fallback_reported = True
+            print(
+                "zstandard module not found, compressing logs with gzip instead",
+                file=sys.stderr,
+            )
+        return LogCompression.GZIP
+    return compression
+
+
+def get_segment_path(path: str, when: float) -> str:
+    """
+    Returns the path for a segment rotated out of the log at path, at the
+    given time: "serial-log.txt" becomes "serial-log.20240131-235959.txt".
+    A counter is added if a segment for the same second already exists.
+    """
+    base, ext = os.path.splitext(path)
+    stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(when))
+    segment = f"{base}.{stamp}{ext}"
+    counter = 1
+    while any(
+        os.path.exists(segment + suffix) for suffix in COMPRESSION_SUFFIXES.values()
+    ):
+        counter += 1
+        segment = f"{base}.{stamp}-{counter}{ext}"
+    return segment
+
+
+def get_segments(path: str) -> list:
+    """Returns the rotated segments of the log at path, oldest first."""
+    directory = os.path.dirname(path) or "."
+    base, ext = os.path.splitext(os.path.basename(path))
+    pattern = re.compile(
+        re.escape(base)
+        + r"\.\d{8}-\d{6}(-\d+)?"
+        + re.escape(ext)
+        + r"(\.gz|\.xz|\.zst)?"
+    )
+
+    segments = []
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return []
+    for name in names:
+        if pattern.fullmatch(name):
+            segment = os.path.join(directory, name)
+            try:
+                segments.append((os.path.getmtime(segment), name, segment))
+            except OSError:
+                pass
+    return [segment for _mtime, _name, segment in sorted(segments)]
+
+
+class LogRotation:
+    """
+    When to rotate a log, and what to do with the rotated segments.
+
+    The log is rotated once it grows past max_size bytes, and/or at every
+    multiple of interval seconds of local wall-clock time (so an interval
+    of 3600 rotates on the hour). A value of 0 disables either trigger.
+    Only the newest keep segments are kept; 0 keeps all of them.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 0,
+        interval: float = 0,
+        compression: int = LogCompression.NONE,
+        keep: int = 0,
+    ):
+        self.max_size = max_size
+        self.interval = interval
+        self.compression = get_available_compression(compression)
+        self.keep = keep
+
+    @classmethod
+    def from_config(cls, config):
+        """Creates rotation settings from the values stored in the config."""
+        return cls(
+            max_size=config["log-rotate-size"] * 1024 * 1024,
+            interval=config["log-rotate-interval"] * 60,
+            compression=config.get_enum("log-compression"),
+            keep=config["log-keep-segments"],
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.max_size or self.interval)
+
+    def next_rotation_time(self, now: float):
+        """
+        Returns the wall-clock time of the next interval-based rotation,
+        or None if the interval is not set.
+        """
+        if not self.interval:
+            return None
+        offset = time.localtime(now).tm_gmtoff
+        return ((now + offset) // self.interval + 1) * self.interval - offset
+
+
+class SegmentCompressor:
+    """
+    Compresses rotated log segments and enforces retention limits, on a
+    background thread that runs for as long as there is work to do.
+
+    Segments are compressed into a temporary file first, and the original
+    is only removed once the compressed copy is complete.
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def submit(self, log_path: str, segment: str, rotation: LogRotation):
+        """Queues a freshly rotated segment of the log at log_path."""
+        self._queue.put((log_path, segment, rotation.compression, rotation.keep))
+        with self._lock:
+            if self._thread is None:
+                # Not a daemon thread, so that quitting the app finishes
+                # the compression instead of leaving partial files around.
+                self._thread = threading.Thread(target=self._run, name="log-compressor")
+                self._thread.start()
+
+    def join(self, timeout: float = None):
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                try:
+                    log_path, segment, compression, keep = self._queue.get_nowait()
+                except queue.Empty:
+                    self._thread = None
+                    return
+
+            try:
+                if compression != LogCompression.NONE:
+                    compress_file(segment, compression)
+                    # The index only works with uncompressed logs.
+                    _remove_index(segment)
+                if keep:
+                    for old in get_segments(log_path)[:-keep]:
+                        os.remove(old)
+                        _remove_index(old)
+            except OSError:
+                traceback.print_exc()
+
+
+def _remove_index(path: str):
+    try:
+        os.remove(get_index_path(path))
+    except FileNotFoundError:
+        pass
+
+
+def compress_file(path: str, compression: LogCompression) -> str:
+    """
+    Compresses the file at path, removes the original and returns the path
+    of the compressed file.
+    """
+    target = path + COMPRESSION_SUFFIXES[compression]
+    partial = target + ".part"
+
+    try:
+        with open(path, "rb") as src:
+            if compression == LogCompression.GZIP:
+                with gzip.open(partial, "wb", compresslevel=6) as dst:
+                    shutil.copyfileobj(src, dst, COMPRESS_BLOCK_SIZE)
+            elif compression == LogCompression.XZ:
+                with lzma.open(partial, "wb") as dst:
+                    shutil.copyfileobj(src, dst, COMPRESS_BLOCK_SIZE)
+            elif compression == LogCompression.ZSTD:
+                with open(partial, "wb") as raw:
+                    zstd = zstandard.ZstdCompressor()
+                    with zstd.stream_writer(raw) as dst:
+                        shutil.copyfileobj(src, dst, COMPRESS_BLOCK_SIZE)
+            else:
+                raise ValueError(compression)
+    except BaseException:
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+
+    os.rename(partial, target)
+    os.remove(path)
+    return target
+
+
+# Shared by all log writers; there is no need for concurrent compression.
+compressor = SegmentCompressor()
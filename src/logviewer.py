@@ -0,0 +1,411 @@
+"""
+Contains the log viewer, which shows log and capture files of any size,
+as well as the history of a session (see history.py).
+
+The log is memory-mapped and only the lines that are on screen are read,
+using the sparse index kept next to the log (see logindex.py) to find
+them; jumping to a line or a point in time takes the same time no matter
+how large the log is.
+"""
+
+from gi.repository import Adw, Gio, GLib, GObject, Gtk
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import mmap
+import os
+import threading
+import time
+
+from .capture import CaptureFormatError, RecordKind
+from .logindex import IndexFormat, LogIndex
+
+# Amount of index chunks (see logindex.INDEX_INTERVAL) kept in memory.
+CHUNK_CACHE_SIZE = 32
+
+# Shows control characters as their Unicode Control Pictures.
+_CONTROL_PICTURES = {i: 0x2400 + i for i in range(32) if i != ord("\t")}
+_CONTROL_PICTURES[0x7F] = 0x2421
+
+_TIME_FORMATS = ("%H:%M", "%H:%M:%S", "%H:%M:%S.%f")
+_DATE_TIME_FORMATS = ("%Y-%m-%d %H:%M", "%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M:%S.%f")
+
+
+def format_timestamp(timestamp: int) -> str:
+    """Formats a wall-clock timestamp (in nanoseconds) for display."""
+    seconds, nanoseconds = divmod(timestamp, 1000000000)
+    return time.strftime("%H:%M:%S", time.localtime(seconds)) + (
+        f".{nanoseconds // 1000:06d}"
+    )
+
+
+def parse_time(query: str, timestamps: list):
+    """
+    Parses a time entered by the user into a wall-clock timestamp in
+    nanoseconds, or returns None if it is not a valid time. Times without
+    a date refer to the first occurrence of that time after the first of
+    the given timestamps (0 if there are none).
+    """
+    for fmt in _DATE_TIME_FORMATS:
+        try:
+            return int(datetime.strptime(query, fmt).timestamp() * 1e9)
+        except ValueError:
+            pass
+
+    for fmt in _TIME_FORMATS:
+        try:
+            parsed = datetime.strptime(query, fmt).time()
+        except ValueError:
+            continue
+        first = next((t for t in timestamps if t), None)
+        if first is None:
+            return 0
+        first = datetime.fromtimestamp(first / 1e9)
+        when = datetime.combine(first.date(), parsed)
+        if when < first.replace(microsecond=0):
+            when += timedelta(days=1)
+        return int(when.timestamp() * 1e9)
+    return None
+
+
+class LogLine(GObject.Object):
+    """A single line of a log, as shown in the viewer."""
+
+    def __init__(self, number: int, timestamp: int, kind: int, data: bytes):
+        super().__init__()
+        self.number = number
+        self.timestamp = timestamp
+        self.kind = kind
+        self.data = data
+
+    @property
+    def text(self) -> str:
+        text = self.data.decode("utf-8", errors="replace").rstrip("\r\n")
+        text = text.translate(_CONTROL_PICTURES)
+        if self.kind in (RecordKind.INFO, RecordKind.EVENT):
+            return f"--- {text} ---"
+        return text
+
+
+class LogLineModel(GObject.Object, Gio.ListModel):
+    """List model of the lines of an indexed log, read on demand."""
+
+    def __init__(self):
+        super().__init__()
+        self.index = None
+        self._file = None
+        self._chunks = OrderedDict()
+
+    def set_log(self, index: LogIndex, file):
+        """Switches to a new index of the log, mapped into memory as file."""
+        removed = self.do_get_n_items()
+        self.index = index
+        self._file = file
+        self._chunks.clear()
+        self.items_changed(0, removed, self.do_get_n_items())
+
+    def get_chunk(self, chunk: int) -> list:
+        """Returns the lines of an index chunk, reading it if needed."""
+        lines = self._chunks.get(chunk)
+        if lines is not None:
+            self._chunks.move_to_end(chunk)
+            return lines
+        lines = self.index.read_lines(self._file, chunk)
+        self._chunks[chunk] = lines
+        if len(self._chunks) > CHUNK_CACHE_SIZE:
+            self._chunks.popitem(last=False)
+        return lines
+
+    def do_get_item_type(self):
+        return LogLine.__gtype__
+
+    def do_get_n_items(self):
+        if self.index is None:
+            return 0
+        return self.index.line_count
+
+    def do_get_item(self, position):
+        if self.index is None or position >= self.index.line_count:
+            return None
+        chunk = self.index.find_line(position)
+        lines = self.get_chunk(chunk)
+        offset = position - self.index.lines[chunk]
+        if offset >= len(lines):
+            return None
+        timestamp, kind, data = lines[offset]
+        return LogLine(position, timestamp, kind, data)
+
+
+@Gtk.Template(resource_path="/com/github/knuxify/SerialConsole/ui/log-viewer.ui")
+class SerialConsoleLogViewer(Adw.Window):
+    __gtype_name__ = "SerialConsoleLogViewer"
+
+    toast_overlay = Gtk.Template.Child()
+    window_title = Gtk.Template.Child()
+    match_box = Gtk.Template.Child()
+    previous_match_button = Gtk.Template.Child()
+    match_label = Gtk.Template.Child()
+    next_match_button = Gtk.Template.Child()
+    open_button = Gtk.Template.Child()
+    go_to_entry = Gtk.Template.Child()
+    stack = Gtk.Template.Child()
+    error_page = Gtk.Template.Child()
+    list_view = Gtk.Template.Child()
+
+    def __init__(self, path: str = None, *args, history=None, **kwargs):
+        """
+        Shows the log at the given path or, if history (a HistoryStore) is
+        given, the history of a session.
+        """
+        super().__init__(*args, **kwargs)
+        self.path = path
+        self.history = history
+        self._file = None
+        self._mmap = None
+        self._loading = False
+        self._matches = None
+        self._match = 0
+
+        if history is not None:
+            title = _("Session History")
+            self.open_button.set_visible(False)
+        else:
+            title = os.path.basename(path)
+        self.window_title.set_title(title)
+        self.set_title(title)
+
+        self.model = LogLineModel()
+        self.selection = Gtk.SingleSelection.new(self.model)
+        self.selection.props.autoselect = False
+        self.selection.props.can_unselect = True
+        self.list_view.set_model(self.selection)
+
+        factory = Gtk.SignalListItemFactory()
+        factory.connect("setup", self.setup_line)
+        factory.connect("bind", self.bind_line)
+        self.list_view.set_factory(factory)
+
+        self.connect("close-request", self.on_close_request)
+        self.load()
+
+    # Line widgets
+
+    def setup_line(self, factory, item):
+        box = Gtk.Box(spacing=12)
+        number = Gtk.Label(xalign=1, width_chars=8)
+        number.add_css_class("line-number")
+        number.add_css_class("monospace")
+        box.append(number)
+        timestamp = Gtk.Label(xalign=0)
+        timestamp.add_css_class("line-time")
+        timestamp.add_css_class("monospace")
+        box.append(timestamp)
+        text = Gtk.Label(xalign=0, hexpand=True, use_markup=False)
+        text.add_css_class("monospace")
+        box.append(text)
+        item.set_child(box)
+
+    def bind_line(self, factory, item):
+        line = item.get_item()
+        number = item.get_child().get_first_child()
+        timestamp = number.get_next_sibling()
+        text = timestamp.get_next_sibling()
+
+        number.set_label(str(line.number + 1))
+        timestamp.set_visible(self.model.index.format == IndexFormat.CAPTURE)
+        timestamp.set_label(format_timestamp(line.timestamp) if line.timestamp else "")
+        text.set_label(line.text)
+        if line.kind in (RecordKind.INFO, RecordKind.EVENT):
+            text.add_css_class("line-message")
+        else:
+            text.remove_css_class("line-message")
+
+    # Loading
+
+    def load(self):
+        """(Re)builds the index of the log on a background thread."""
+        if self._loading:
+            return
+        self._loading = True
+        if self.model.index is None:
+            self.stack.set_visible_child_name("loading")
+        threading.Thread(target=self._load_index, daemon=True).start()
+
+    def _load_index(self):
+        try:
+            if self.history is not None:
+                index = self.history.snapshot()
+            else:
+                index = LogIndex(self.path)
+                index.load()
+        except OSError as e:
+            GLib.idle_add(self._on_loaded, None, e.strerror or str(e))
+            return
+        except CaptureFormatError as e:
+            GLib.idle_add(self._on_loaded, None, str(e))
+            return
+        GLib.idle_add(self._on_loaded, index, None)
+
+    def _on_loaded(self, index: LogIndex, error: str):
+        self._loading = False
+        if index is None:
+            self.error_page.set_description(error)
+            self.stack.set_visible_child_name("error")
+            self.go_to_entry.set_sensitive(False)
+            return False
+
+        old_file, old_mmap = self._file, self._mmap
+        self._file = self._mmap = None
+        if index.size and self.history is None:
+            try:
+                self._file = open(self.path, "rb")
+                self._mmap = mmap.mmap(
+                    self._file.fileno(), index.size, access=mmap.ACCESS_READ
+                )
+            except (OSError, ValueError) as e:
+                if self._file:
+                    self._file.close()
+                    self._file = None
+                self.model.set_log(None, None)
+                self._close_file(old_file, old_mmap)
+                self.error_page.set_description(str(e))
+                self.stack.set_visible_child_name("error")
+                return False
+
+        self.model.set_log(index, self._mmap)
+        self._close_file(old_file, old_mmap)
+
+        self.window_title.set_subtitle(self._describe(index))
+        self.go_to_entry.set_sensitive(bool(index.line_count))
+        self.stack.set_visible_child_name("log" if index.line_count else "empty")
+        if self._matches is not None:
+            self.show_match()
+        return False
+
+    def _describe(self, index: LogIndex) -> str:
+        timestamps = [timestamp for timestamp in index.timestamps if timestamp]
+        lines = _("{count} lines").format(count=f"{index.line_count:,}")
+        if not timestamps:
+            return lines
+        start = datetime.fromtimestamp(timestamps[0] / 1e9)
+        return _("{lines}, from {start}").format(
+            lines=lines, start=start.strftime("%Y-%m-%d %H:%M:%S")
+        )
+
+    def _close_file(self, file, mapping):
+        if mapping:
+            mapping.close()
+        if file:
+            file.close()
+
+    def on_close_request(self, *args):
+        self.model.set_log(None, None)
+        self._close_file(self._file, self._mmap)
+        self._file = self._mmap = None
+        return False
+
+    @Gtk.Template.Callback()
+    def reload(self, *args):
+        self.load()
+
+    @Gtk.Template.Callback()
+    def open_externally(self, *args):
+        Gio.AppInfo.launch_default_for_uri(GLib.filename_to_uri(self.path))
+
+    # Go to line/time
+
+    @Gtk.Template.Callback()
+    def go_to_changed(self, *args):
+        self.go_to_entry.remove_css_class("error")
+
+    @Gtk.Template.Callback()
+    def go_to(self, *args):
+        index = self.model.index
+        if index is None or not index.line_count:
+            return
+        query = self.go_to_entry.get_text().strip()
+
+        if query.isdigit():
+            position = min(max(int(query), 1), index.line_count) - 1
+        else:
+            timestamp = parse_time(query, index.timestamps)
+            if timestamp is None:
+                self.go_to_entry.add_css_class("error")
+                return
+            position = self.find_time(timestamp)
+            if position is None:
+                self.toast_overlay.add_toast(
+                    Adw.Toast.new(_("This log has no timestamps"))
+                )
+                return
+
+        self.list_view.scroll_to(
+            position, Gtk.ListScrollFlags.FOCUS | Gtk.ListScrollFlags.SELECT, None
+        )
+
+    def find_time(self, timestamp: int):
+        """
+        Returns the position of the first line at or after the given time,
+        or None if the log has no timestamps.
+        """
+        index = self.model.index
+        if not any(index.timestamps):
+            return None
+        chunk = index.find_time(timestamp)
+        first, count = index.get_chunk_range(chunk)
+        if index.format != IndexFormat.CAPTURE:
+            return first
+        for offset, (line_timestamp, _kind, _data) in enumerate(
+            self.model.get_chunk(chunk)
+        ):
+            if line_timestamp >= timestamp:
+                return first + offset
+        # The time is between this chunk and the next one
+        return min(first + count, index.line_count - 1)
+
+    # Matches
+
+    def set_matches(self, lines, position: int = 0):
+        """
+        Sets the lines with matches of a search (e.g. HistorySearch.lines),
+        to be stepped through with the previous/next match buttons, and
+        goes to the one at the given position.
+        """
+        self._matches = lines
+        self._match = min(max(position, 0), len(lines) - 1)
+        self.match_box.set_visible(bool(lines))
+        if self.model.index is not None:
+            self.show_match()
+
+    def show_match(self):
+        """Scrolls to and selects the current match."""
+        if not self._matches:
+            return
+        self.previous_match_button.set_sensitive(self._match > 0)
+        self.next_match_button.set_sensitive(self._match < len(self._matches) - 1)
+        # TRANSLATORS: {number} is the number of the shown match and {count}
+        # is the amount of lines with matches; do not modify the strings
+        # between the braces!
+        self.match_label.set_label(
+            _("{number} of {count}").format(
+                number=f"{self._match + 1:,}", count=f"{len(self._matches):,}"
+            )
+        )
+        line = self._matches[self._match]
+        index = self.model.index
+        if index is None or line >= index.line_count:
+            return
+        self.list_view.scroll_to(
+            line, Gtk.ListScrollFlags.FOCUS | Gtk.ListScrollFlags.SELECT, None
+        )
+
+    @Gtk.Template.Callback()
+    def previous_match(self, *args):
+        if self._matches and self._match > 0:
+            self._match -= 1
+            self.show_match()
+
+    @Gtk.Template.Callback()
+    def next_match(self, *args):
+        if self._matches and self._match < len(self._matches) - 1:
+            self._match += 1
+            self.show_match()
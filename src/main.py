@@ -10,6 +10,10 @@ gi.require_version("Vte", "3.91")
 
 from gi.repository import Adw, Gtk, Gio  # noqa: E402
 
+from .config import config  # noqa: E402
+from .portlist import PortListModel  # noqa: E402
+from .portmonitor import PortMonitor  # noqa: E402
+from .portsettings import PortSettings  # noqa: E402
 from .window import SerialConsoleWindow  # noqa: E402
 
 
@@ -23,16 +27,30 @@ class Application(Adw.Application):
         self.version = version
         self.connect("open", self.do_activate)
 
+        # Port list shared by all windows and sessions, kept up to date by
+        # the port monitor
+        self._session_indices = set()
+        self.ports = PortListModel()
+        self.port_monitor = PortMonitor(self.on_ports_changed)
+
+    def do_startup(self):
+        Adw.Application.do_startup(self)
+        self.ports.update(self.port_monitor.start(), [])
+
     def do_activate(self):
         win = self.props.active_window
         if not win:
             win = SerialConsoleWindow(application=self)
         self.create_action("about", self.on_about_action, None)
         self.create_action("quit", self.on_quit_action, "<Ctrl>q")
+        self.create_action("new-window", self.on_new_window_action, "<shift><primary>n")
 
         self.set_accels_for_action("term.copy", ("<shift><primary>c", None))
         self.set_accels_for_action("term.paste", ("<shift><primary>v", None))
         self.set_accels_for_action("win.find", ("<shift><primary>f", None))
+        self.set_accels_for_action("win.new-tab", ("<shift><primary>t", None))
+        self.set_accels_for_action("win.close-tab", ("<shift><primary>w", None))
+        self.set_accels_for_action("win.show-hex", ("<shift><primary>h", None))
 
         win.present()
         self._ = _
@@ -63,9 +81,78 @@ class Application(Adw.Application):
 
         about.present(self.props.active_window)
 
+    def do_shutdown(self):
+        self.port_monitor.stop()
+        Adw.Application.do_shutdown(self)
+
     def on_quit_action(self, *args):
-        win = self.props.active_window
-        win.close()
+        for win in self.get_windows():
+            win.close()
+
+    def on_new_window_action(self, *args):
+        SerialConsoleWindow(application=self).present()
+
+    # Session management
+
+    @property
+    def sessions(self) -> list:
+        """All sessions open in all windows."""
+        sessions = []
+        for win in self.get_windows():
+            if isinstance(win, SerialConsoleWindow):
+                sessions += win.sessions
+        return sessions
+
+    def on_ports_changed(self, changed: list, removed: list):
+        """Applies changes reported by the port monitor to the port list."""
+        windows = [
+            win for win in self.get_windows() if isinstance(win, SerialConsoleWindow)
+        ]
+
+        for win in windows:
+            win.sidebar._ignore_port_change = True
+        self.ports.update(changed, removed)
+        for win in windows:
+            win.sidebar._ignore_port_change = False
+            win.update_port_selection()
+
+        return False
+
+    def acquire_session_index(self) -> int:
+        """Returns the lowest session index that is not in use."""
+        index = 0
+        while index in self._session_indices:
+            index += 1
+        self._session_indices.add(index)
+        return index
+
+    def release_session(self, session):
+        """Frees up the index of a closed session."""
+        self._session_indices.discard(session.log_index)
+
+    def get_new_session_settings(self) -> PortSettings:
+        """
+        Returns the port settings for a new session: the last used settings,
+        with the port switched to one that is not used by another session
+        if possible.
+        """
+        settings = PortSettings.from_config(config)
+        ports = self.ports.devices
+        # Sessions might refer to the same port by another path (e.g. its
+        # by-id link), so ports are compared by their position in the list
+        used = {self.ports.find(session.serial.port) for session in self.sessions}
+
+        current = self.ports.find(settings.port)
+        if current < 0 or current in used:
+            for i, port in enumerate(ports):
+                if i not in used:
+                    settings.port = port
+                    break
+            else:
+                if current < 0:
+                    settings.port = ports[0] if ports else ""
+
+        return settings
 
 
 def main(version):
@@ -0,0 +1,160 @@
+"""
+Contains the list model of the serial ports on the system, shared by all
+windows and sessions.
+"""
+
+from gi.repository import GObject, Gio
+import os
+import re
+
+from .portmonitor import PortDetails
+
+_DIGITS = re.compile(r"(\d+)")
+
+
+def _sort_key(device: str) -> tuple:
+    """Sorts numbers in device paths by value, so that ttyUSB10 comes after ttyUSB9."""
+    return tuple(
+        (0, int(part)) if part.isdigit() else (1, part)
+        for part in _DIGITS.split(device)
+    )
+
+
+class PortInfo(GObject.Object):
+    """A serial port, as shown in port selectors."""
+
+    def __init__(self, details: PortDetails):
+        super().__init__()
+        self.details = details
+        self.sort_key = _sort_key(details.device)
+
+    @GObject.Property(type=str, flags=GObject.ParamFlags.READABLE)
+    def device(self):
+        return self.details.device
+
+    @GObject.Property(type=str, flags=GObject.ParamFlags.READABLE)
+    def description(self):
+        return self.details.description
+
+    @GObject.Property(type=str, flags=GObject.ParamFlags.READABLE)
+    def vid_pid(self):
+        return self.details.vid_pid
+
+    @GObject.Property(type=str, flags=GObject.ParamFlags.READABLE)
+    def serial_number(self):
+        return self.details.serial_number
+
+    @GObject.Property(type=str, flags=GObject.ParamFlags.READABLE)
+    def by_id(self):
+        return self.details.by_id
+
+    @GObject.Property(type=str, flags=GObject.ParamFlags.READABLE)
+    def title(self):
+        """Name to show for the port: its description and device name."""
+        name = os.path.basename(self.details.device)
+        if self.details.description:
+            return f"{self.details.description} ({name})"
+        return name
+
+    @GObject.Property(type=str, flags=GObject.ParamFlags.READABLE)
+    def subtitle(self):
+        """Device path and USB identity of the port."""
+        return " · ".join(
+            part
+            for part in (
+                self.details.device,
+                self.details.vid_pid,
+                self.details.serial_number,
+            )
+            if part
+        )
+
+    @GObject.Property(type=str, flags=GObject.ParamFlags.READABLE)
+    def search_text(self):
+        """Everything a port can be searched for by."""
+        return " ".join(part for part in self.details if part)
+
+
+class PortListModel(GObject.Object, Gio.ListModel):
+    """
+    List model of the serial ports on the system, sorted by device path.
+
+    Ports can be looked up by device path (or by-id link) without going
+    through the list, and every update is applied with a single
+    items-changed emission covering only the part of the list that changed.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._items = []
+        # device path or by-id link -> position
+        self._positions = {}
+
+    def do_get_item_type(self):
+        return PortInfo.__gtype__
+
+    def do_get_n_items(self):
+        return len(self._items)
+
+    def do_get_item(self, position):
+        if position >= len(self._items):
+            return None
+        return self._items[position]
+
+    @property
+    def devices(self) -> list:
+        """Device paths of all ports, in list order."""
+        return [item.details.device for item in self._items]
+
+    def find(self, port: str) -> int:
+        """
+        Returns the position of the port with the given device path or by-id
+        link, or -1 if there is none. Other links to a port are followed.
+        """
+        position = self._positions.get(port)
+        if position is None and port:
+            position = self._positions.get(os.path.realpath(port))
+        return -1 if position is None else position
+
+    def get_port(self, port: str):
+        """Returns the PortInfo for a device path or by-id link, or None."""
+        position = self.find(port)
+        return self._items[position] if position >= 0 else None
+
+    def update(self, changed: list, removed: list):
+        """
+        Adds the ports in changed (a list of PortDetails), replacing the
+        ones with the same device path, and removes the device paths in
+        removed.
+        """
+        old = self._items
+        gone = set(removed).union(details.device for details in changed)
+        if not gone.intersection(self._positions) and not changed:
+            return
+
+        items = [item for item in old if item.details.device not in gone]
+        items += [PortInfo(details) for details in changed]
+        items.sort(key=lambda item: item.sort_key)
+
+        # Only report the part of the list between the first and last
+        # difference as changed
+        start = 0
+        while start < len(old) and start < len(items) and old[start] is items[start]:
+            start += 1
+        old_end = len(old)
+        new_end = len(items)
+        while (
+            old_end > start
+            and new_end > start
+            and old[old_end - 1] is items[new_end - 1]
+        ):
+            old_end -= 1
+            new_end -= 1
+
+        self._items = items
+        self._positions = {}
+        for position, item in enumerate(items):
+            self._positions[item.details.device] = position
+            if item.details.by_id:
+                self._positions[item.details.by_id] = position
+        self.items_changed(start, old_end - start, new_end - start)
@@ -0,0 +1,409 @@
+"""
+Contains the port monitor, which keeps track of the serial ports on the
+system without polling them from the main loop.
+
+On Linux, a background thread watches /dev with inotify and only looks
+for ports (which walks sysfs for every tty, and can take a while with
+many adapters) after a tty node or by-id link was added or removed.
+Elsewhere, or if inotify is not available, the thread falls back to
+looking for ports every POLL_INTERVAL seconds. The details of every port
+(description, USB IDs, serial number and by-id link) are gathered in the
+same go, so that the UI never has to query them.
+
+It also contains the device watcher, which serial handlers use to notice
+their device coming back right away when reconnecting, and the helpers
+for finding a device again by its /dev/serial/by-id link after it was
+re-enumerated under another name.
+"""
+
+from gi.repository import GLib
+import ctypes
+import errno
+import os
+import select
+import struct
+import threading
+import time
+import traceback
+from typing import NamedTuple
+
+import serial.tools.list_ports
+
+from .reactor import get_reactor
+
+# Directory that device nodes are created in.
+DEV_DIR = "/dev"
+# Directory in which udev links serial devices by their identity (bus,
+# vendor, model and serial number), which stays the same across replugs.
+BY_ID_DIR = "/dev/serial/by-id"
+# Prefixes of the device nodes that can be serial ports.
+PORT_PREFIXES = ("tty", "rfcomm")
+# Time to wait after a device node was added or removed before looking for
+# ports (in seconds), so that the nodes and links that udev creates for a
+# device in quick succession are handled in one go.
+SETTLE_TIME = 0.2
+# Time between two looks for ports when inotify is not available (in seconds).
+POLL_INTERVAL = 1
+
+# From <sys/inotify.h>
+IN_ATTRIB = 0x00000004
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+_INOTIFY_EVENT = struct.Struct("iIII")
+
+
+class PortDetails(NamedTuple):
+    """What is known about a serial port; empty strings where unknown."""
+
+    device: str
+    description: str = ""
+    #: USB vendor and product ID, as "0403:6001".
+    vid_pid: str = ""
+    serial_number: str = ""
+    manufacturer: str = ""
+    #: Link to the port in BY_ID_DIR.
+    by_id: str = ""
+
+
+def list_ports() -> dict:
+    """Returns the details of all serial ports on the system, by device path."""
+    by_id = {}
+    try:
+        for name in os.listdir(BY_ID_DIR):
+            link = os.path.join(BY_ID_DIR, name)
+            by_id[os.path.realpath(link)] = link
+    except OSError:
+        pass
+
+    ports = {}
+    for port in serial.tools.list_ports.comports():
+        description = port.description
+        if description in ("n/a", port.name):
+            description = ""
+        ports[port.device] = PortDetails(
+            port.device,
+            description,
+            f"{port.vid:04x}:{port.pid:04x}" if port.vid is not None else "",
+            port.serial_number or "",
+            port.manufacturer or "",
+            by_id.get(os.path.realpath(port.device), ""),
+        )
+    return ports
+
+
+def resolve_link(path: str) -> str:
+    """
+    Returns the path a symlink points to, resolved by one level only, so
+    that e.g. a by-id link gives /dev/ttyUSB0 rather than wherever that
+    node might be linked to in turn.
+    """
+    target = os.readlink(path)
+    return os.path.normpath(os.path.join(os.path.dirname(path), target))
+
+
+def get_device_id(port: str):
+    """
+    Returns the link in BY_ID_DIR that points to the given port, or None
+    if there is none (e.g. for built-in UARTs, or without udev).
+    """
+    try:
+        device = os.path.realpath(port)
+        names = os.listdir(BY_ID_DIR)
+    except OSError:
+        return None
+    for name in names:
+        link = os.path.join(BY_ID_DIR, name)
+        if os.path.realpath(link) == device:
+            return link
+    return None
+
+
+class Inotify:
+    """Minimal wrapper around the Linux inotify API."""
+
+    def __init__(self):
+        self._libc = ctypes.CDLL(None, use_errno=True)
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            e = ctypes.get_errno()
+            raise OSError(e, os.strerror(e))
+
+    def add_watch(self, path: str, mask: int) -> int:
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            e = ctypes.get_errno()
+            raise OSError(e, os.strerror(e), path)
+        return wd
+
+    def read(self) -> list:
+        """Returns the pending (wd, mask, name) events."""
+        try:
+            data = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset + _INOTIFY_EVENT.size <= len(data):
+            wd, mask, _cookie, length = _INOTIFY_EVENT.unpack_from(data, offset)
+            offset += _INOTIFY_EVENT.size
+            name = data[offset : offset + length].rstrip(b"\0")
+            offset += length
+            events.append((wd, mask, os.fsdecode(name)))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PortMonitor:
+    """
+    Keeps track of the serial ports on the system. Changes are passed to
+    on_change(changed, removed) on the main loop, with a list of the
+    PortDetails of ports that appeared or changed, and a list of the
+    device paths of ports that disappeared.
+    """
+
+    def __init__(self, on_change):
+        self.on_change = on_change
+        #: PortDetails of the known ports, by device path.
+        self.ports = {}
+        self._thread = None
+        self._inotify = None
+        self._by_id_wd = None
+        self._wake_r = self._wake_w = None
+        self._stopping = False
+
+    _MASK = IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO
+
+    def start(self) -> list:
+        """
+        Looks for ports once, then starts watching for changes in the
+        background. Returns the PortDetails of the ports that were found.
+        """
+        try:
+            self._inotify = Inotify()
+            self._inotify.add_watch(DEV_DIR, self._MASK)
+        except (OSError, AttributeError):
+            # No inotify (AttributeError if libc does not have it)
+            if self._inotify is not None:
+                self._inotify.close()
+            self._inotify = None
+        self._watch_by_id()
+        self.ports = list_ports()
+
+        self._stopping = False
+        self._wake_r, self._wake_w = os.pipe2(os.O_CLOEXEC)
+        self._thread = threading.Thread(
+            target=self._run, name="port-monitor", daemon=True
+        )
+        self._thread.start()
+        return list(self.ports.values())
+
+    def stop(self):
+        """Stops watching for changes."""
+        if self._thread is None:
+            return
+        self._stopping = True
+        os.write(self._wake_w, b"\0")
+        self._thread.join()
+        self._thread = None
+        os.close(self._wake_r)
+        os.close(self._wake_w)
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
+            self._by_id_wd = None
+
+    @property
+    def is_polling(self) -> bool:
+        """Whether the monitor has to poll, as inotify is not available."""
+        return self._inotify is None
+
+    def _run(self):
+        poller = select.poll()
+        poller.register(self._wake_r, select.POLLIN)
+        if self._inotify is not None:
+            poller.register(self._inotify.fd, select.POLLIN)
+
+        # Time at which to look for ports after a change, if any
+        deadline = None
+        while not self._stopping:
+            if self._inotify is None:
+                timeout = POLL_INTERVAL * 1000
+            elif deadline is not None:
+                timeout = max(0, deadline - time.monotonic()) * 1000
+            else:
+                # Nothing to do until a device node comes or goes
+                timeout = None
+
+            try:
+                events = poller.poll(timeout)
+            except InterruptedError:
+                continue
+            if self._stopping:
+                break
+
+            if self._inotify is None:
+                if not events:
+                    self._rescan()
+                continue
+
+            if events and self._has_port_changes() and deadline is None:
+                deadline = time.monotonic() + SETTLE_TIME
+            if deadline is not None and time.monotonic() >= deadline:
+                deadline = None
+                self._rescan()
+
+    def _watch_by_id(self):
+        """
+        Watches BY_ID_DIR, which udev only creates along with the first link
+        in it (and removes along with the last one), if it exists.
+        """
+        if self._inotify is None or self._by_id_wd is not None:
+            return
+        try:
+            self._by_id_wd = self._inotify.add_watch(BY_ID_DIR, self._MASK)
+        except OSError:
+            pass
+
+    def _has_port_changes(self) -> bool:
+        changed = False
+        for wd, mask, name in self._inotify.read():
+            if wd == self._by_id_wd:
+                if mask & IN_IGNORED:
+                    self._by_id_wd = None
+                changed = True
+            elif mask & IN_Q_OVERFLOW or name.startswith(PORT_PREFIXES):
+                changed = True
+            elif name == "serial":
+                # BY_ID_DIR's parent was created
+                changed = True
+        return changed
+
+    def _rescan(self):
+        self._watch_by_id()
+        try:
+            ports = list_ports()
+        except Exception:
+            traceback.print_exc()
+            return
+        old = self.ports
+        if ports == old:
+            return
+        self.ports = ports
+        changed = [
+            details for device, details in ports.items() if old.get(device) != details
+        ]
+        removed = sorted(old.keys() - ports.keys())
+        GLib.idle_add(self.on_change, changed, removed)
+
+
+class DeviceWatcher:
+    """
+    Tells listeners from the reactor thread, as soon as it happens, that
+    device nodes or links were created or had their permissions changed
+    in the directories they are interested in.
+
+    Directories that don't exist (yet) are watched through their closest
+    existing parent until they are created, so that e.g. BY_ID_DIR, which
+    udev removes along with the last link in it, can be watched as well.
+
+    The inotify instance only exists while there are listeners, so this
+    costs nothing while no port is waiting to be reconnected.
+    """
+
+    _MASK = IN_CREATE | IN_MOVED_TO | IN_ATTRIB
+
+    def __init__(self):
+        self._inotify = None
+        self._listeners = []
+        # wd -> watched path
+        self._watches = {}
+
+    def add_listener(self, callback, directories) -> bool:
+        """
+        Calls callback() whenever something was created or changed in one
+        of the given directories. Must be called from the reactor thread.
+
+        Returns False if inotify is not available, in which case the
+        caller has to look for changes by itself.
+        """
+        if self._inotify is None:
+            try:
+                self._inotify = Inotify()
+            except (OSError, AttributeError):
+                return False
+            get_reactor().add_reader(self._inotify.fd, self._on_readable)
+        self._listeners.append((callback, tuple(directories)))
+        self._update_watches()
+        return True
+
+    def remove_listener(self, callback):
+        """Stops calling callback. Must be called from the reactor thread."""
+        self._listeners = [
+            listener for listener in self._listeners if listener[0] != callback
+        ]
+        if not self._listeners and self._inotify is not None:
+            get_reactor().remove_reader(self._inotify.fd)
+            self._inotify.close()
+            self._inotify = None
+            self._watches = {}
+
+    def _update_watches(self) -> bool:
+        """
+        Watches all wanted directories that aren't watched yet, or their
+        closest existing parent. Returns True if a new watch was added.
+        """
+        watched = set(self._watches.values())
+        added = False
+        for _callback, directories in self._listeners:
+            for path in directories:
+                while path not in watched:
+                    try:
+                        wd = self._inotify.add_watch(path, self._MASK)
+                    except OSError as e:
+                        parent = os.path.dirname(path)
+                        if e.errno not in (errno.ENOENT, errno.ENOTDIR) or (
+                            parent == path
+                        ):
+                            break
+                        path = parent
+                        continue
+                    self._watches[wd] = path
+                    watched.add(path)
+                    added = True
+        return added
+
+    def _on_readable(self):
+        events = self._inotify.read()
+        for wd, mask, _name in events:
+            if mask & IN_IGNORED:
+                # The directory was removed
+                self._watches.pop(wd, None)
+        # A directory we were waiting for might have been created; anything
+        # that was created in it before the watch was added would be missed,
+        # so let the listeners look in any case.
+        added = self._update_watches()
+        if events or added:
+            for callback, _directories in self._listeners:
+                try:
+                    callback()
+                except Exception:
+                    traceback.print_exc()
+
+
+_device_watcher = None
+
+
+def get_device_watcher() -> DeviceWatcher:
+    """Returns the shared device watcher. Must be called from the reactor thread."""
+    global _device_watcher
+    if _device_watcher is None:
+        _device_watcher = DeviceWatcher()
+    return _device_watcher
@@ -0,0 +1,129 @@
+"""
+Contains the serial port configuration model shared by the serial backends.
+"""
+
+import serial
+
+from .config import Parity, FlowControl
+
+DEFAULT_BAUD_RATE = 115200
+
+_DATA_BITS = {
+    5: serial.FIVEBITS,
+    6: serial.SIXBITS,
+    7: serial.SEVENBITS,
+    8: serial.EIGHTBITS,
+}
+
+_PARITIES = {
+    Parity.NONE: serial.PARITY_NONE,
+    Parity.EVEN: serial.PARITY_EVEN,
+    Parity.ODD: serial.PARITY_ODD,
+    Parity.MARK: serial.PARITY_MARK,
+    Parity.SPACE: serial.PARITY_SPACE,
+}
+
+_STOP_BITS = {
+    1: serial.STOPBITS_ONE,
+    2: serial.STOPBITS_TWO,
+}
+
+
+def _reverse_lookup(mapping: dict, value):
+    for key, mapped in mapping.items():
+        if mapped == value:
+            return key
+    return None
+
+
+def get_data_bits(device: serial.Serial) -> int:
+    return _reverse_lookup(_DATA_BITS, device.bytesize)
+
+
+def set_data_bits(device: serial.Serial, value: int):
+    try:
+        device.bytesize = _DATA_BITS[value]
+    except KeyError:
+        raise ValueError from None
+
+
+def get_parity(device: serial.Serial) -> Parity:
+    return _reverse_lookup(_PARITIES, device.parity)
+
+
+def set_parity(device: serial.Serial, value: int):
+    try:
+        device.parity = _PARITIES[Parity(int(value))]
+    except (KeyError, ValueError):
+        raise ValueError from None
+
+
+def get_stop_bits(device: serial.Serial) -> int:
+    return _reverse_lookup(_STOP_BITS, device.stopbits)
+
+
+def set_stop_bits(device: serial.Serial, value: int):
+    try:
+        device.stopbits = _STOP_BITS[value]
+    except KeyError:
+        raise ValueError from None
+
+
+def get_flow_control(device: serial.Serial) -> FlowControl:
+    if device.xonxoff:
+        return FlowControl.SOFTWARE
+    elif device.rtscts:
+        return FlowControl.HARDWARE_RTS_CTS
+    elif device.dsrdtr:
+        return FlowControl.HARDWARE_DSR_DTR
+    return FlowControl.NONE
+
+
+def set_flow_control(device: serial.Serial, value: int):
+    device.xonxoff = value == FlowControl.SOFTWARE
+    device.rtscts = value == FlowControl.HARDWARE_RTS_CTS
+    device.dsrdtr = value == FlowControl.HARDWARE_DSR_DTR
+
+
+class PortSettings:
+    """
+    Connection parameters for a serial port, using the same units and
+    enums as the config (and the matching SerialHandler properties).
+    """
+
+    def __init__(
+        self,
+        port: str = "",
+        baud_rate: int = DEFAULT_BAUD_RATE,
+        data_bits: int = 8,
+        parity: int = Parity.NONE,
+        stop_bits: int = 1,
+        flow_control: int = FlowControl.NONE,
+    ):
+        self.port = port
+        self.baud_rate = baud_rate
+        self.data_bits = data_bits
+        self.parity = Parity(parity)
+        self.stop_bits = stop_bits
+        self.flow_control = FlowControl(flow_control)
+
+    @classmethod
+    def from_config(cls, config):
+        """Creates port settings from the values stored in the config."""
+        return cls(
+            port=config["port"],
+            baud_rate=config["baud-rate"],
+            data_bits=config["data-bits"],
+            parity=config.get_enum("parity"),
+            stop_bits=config["stop-bits"],
+            flow_control=config.get_enum("flow-control"),
+        )
+
+    def apply(self, device: serial.Serial):
+        """Applies the settings to a (pyserial) serial device."""
+        device.port = self.port
+        device.baudrate = self.baud_rate
+        set_data_bits(device, self.data_bits)
+        set_parity(device, self.parity)
+        set_stop_bits(device, self.stop_bits)
+        set_flow_control(device, self.flow_control)
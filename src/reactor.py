@@ -0,0 +1,199 @@
+"""
+Contains the I/O reactor, which watches the file descriptors of all open
+serial devices from a single thread.
+"""
+
+import heapq
+import itertools
+import os
+import selectors
+import threading
+import time
+import traceback
+
+# Maximum time (in seconds) to wait for the reactor thread to run a
+# synchronous call.
+SYNC_CALL_TIMEOUT = 2
+
+
+class ReactorTimer:
+    """Handle for a call scheduled with SerialReactor.call_later."""
+
+    __slots__ = ("deadline", "func", "args", "cancelled")
+
+    def __init__(self, deadline: float, func, args):
+        self.deadline = deadline
+        self.func = func
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class SerialReactor:
+    """
+    Single-threaded event loop for serial I/O.
+
+    File descriptors are watched with the best selector available on the
+    platform (epoll on Linux); their callbacks, as well as scheduled calls,
+    are run in the reactor thread. Consumers which need to touch GTK have
+    to hop over to the main loop themselves.
+    """
+
+    def __init__(self):
+        self._selector = selectors.DefaultSelector()
+        self._lock = threading.Lock()
+        self._calls = []
+        self._timers = []
+        self._timer_counter = itertools.count()
+
+        self._wakeup_read, self._wakeup_write = os.pipe()
+        os.set_blocking(self._wakeup_read, False)
+        os.set_blocking(self._wakeup_write, False)
+        self._selector.register(self._wakeup_read, selectors.EVENT_READ, None)
+
+        self._thread = threading.Thread(
+            target=self._run, name="serial-reactor", daemon=True
+        )
+        self._thread.start()
+
+    def in_reactor_thread(self) -> bool:
+        """Returns True if called from the reactor thread."""
+        return threading.current_thread() is self._thread
+
+    def _wakeup(self):
+        try:
+            os.write(self._wakeup_write, b"\0")
+        except BlockingIOError:  # Wakeup is already pending
+            pass
+
+    def call_soon(self, func, *args):
+        """Schedules func to be called in the reactor thread."""
+        with self._lock:
+            self._calls.append((func, args))
+        self._wakeup()
+
+    def call_later(self, delay: float, func, *args) -> ReactorTimer:
+        """
+        Schedules func to be called in the reactor thread after delay
+        seconds. Returns a timer that can be used to cancel the call.
+        """
+        timer = ReactorTimer(time.monotonic() + delay, func, args)
+        with self._lock:
+            heapq.heappush(
+                self._timers, (timer.deadline, next(self._timer_counter), timer)
+            )
+        self._wakeup()
+        return timer
+
+    def run_sync(self, func, *args):
+        """
+        Calls func in the reactor thread and waits for it to finish.
+        Returns its return value.
+
+        Raises TimeoutError if the reactor thread does not get to it in time.
+        """
+        if self.in_reactor_thread():
+            return func(*args)
+
+        done = threading.Event()
+        result = [None, None]
+
+        def _call():
+            try:
+                result[0] = func(*args)
+            except Exception as e:
+                result[1] = e
+            finally:
+                done.set()
+
+        self.call_soon(_call)
+        if not done.wait(SYNC_CALL_TIMEOUT):
+            raise TimeoutError
+        if result[1] is not None:
+            raise result[1]
+        return result[0]
+
+    def add_reader(self, fd: int, callback):
+        """
+        Starts watching fd for readability; callback is called without
+        arguments in the reactor thread whenever the fd is readable or has
+        been hung up.
+        """
+        self.run_sync(self._selector.register, fd, selectors.EVENT_READ, callback)
+
+    def remove_reader(self, fd: int):
+        """
+        Stops watching fd. Once this returns, the callback for fd will not
+        be called anymore, so the fd can be safely closed.
+        """
+
+        def _remove():
+            try:
+                self._selector.unregister(fd)
+            except (KeyError, ValueError):
+                pass
+
+        self.run_sync(_remove)
+
+    def _next_timeout(self):
+        with self._lock:
+            while self._timers and self._timers[0][2].cancelled:
+                heapq.heappop(self._timers)
+            if self._calls:
+                return 0
+            if not self._timers:
+                return None
+            return max(0, self._timers[0][0] - time.monotonic())
+
+    def _run_callback(self, func, *args):
+        try:
+            func(*args)
+        except Exception:
+            traceback.print_exc()
+
+    def _run(self):
+        while True:
+            events = self._selector.select(self._next_timeout())
+
+            for key, _mask in events:
+                if key.data is None:
+                    try:
+                        while os.read(self._wakeup_read, 512):
+                            pass
+                    except BlockingIOError:
+                        pass
+                    continue
+                # The fd might have been removed by an earlier callback
+                if self._selector.get_map().get(key.fd) is not key:
+                    continue
+                self._run_callback(key.data)
+
+            with self._lock:
+                calls = self._calls
+                self._calls = []
+            for func, args in calls:
+                self._run_callback(func, *args)
+
+            now = time.monotonic()
+            due = []
+            with self._lock:
+                while self._timers and self._timers[0][0] <= now:
+                    due.append(heapq.heappop(self._timers)[2])
+            for timer in due:
+                if not timer.cancelled:
+                    self._run_callback(timer.func, *timer.args)
+
+
+_reactor = None
+_reactor_lock = threading.Lock()
+
+
+def get_reactor() -> SerialReactor:
+    """Returns the shared reactor, starting it on first use."""
+    global _reactor
+    with _reactor_lock:
+        if _reactor is None:
+            _reactor = SerialReactor()
+        return _reactor
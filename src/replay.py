@@ -0,0 +1,409 @@
+"""
+Contains the replay handler, which plays back a recorded capture or log
+as if it was being read from a serial device.
+"""
+
+from gi.repository import GLib, GObject
+import time
+
+from .capture import RecordKind, get_clock_offset, iter_records
+from .logindex import IndexFormat, LogIndex, iter_line_ends
+from .reactor import get_reactor
+from .serial import SerialHandler, SerialHandlerState
+
+# Size of the blocks read from the replayed file.
+REPLAY_BLOCK_SIZE = 64 * 1024
+# Maximum amount of data replayed in one go when replaying as fast as
+# possible, so that other ports handled by the reactor are not held up.
+REPLAY_BATCH_SIZE = 1024 * 1024
+# Time covered by one chunk of a replayed text log (in seconds).
+TEXT_CHUNK_INTERVAL = 0.01
+
+
+class ReplayHandler(SerialHandler):
+    """
+    Plays back a capture file (see capture.py) or a text log through the
+    same read path as a real device: data comes out of read_done, goes
+    through traffic listeners and the logger, and the handler is OPEN
+    while the replay runs.
+
+    Captures are replayed with their recorded timing, scaled by speed;
+    a speed of 0 replays as fast as the consumers can take the data, which
+    is never dropped. Text logs have no timing, so they are paced at the
+    baud rate instead.
+    """
+
+    path = GObject.Property(type=str)
+
+    # Playback speed relative to the recording; 0 means as fast as possible.
+    speed = GObject.Property(type=float, default=1.0, minimum=0, maximum=1000)
+
+    def __init__(self, path: str = ""):
+        super().__init__()
+        self.props.path = path
+        self.port = path
+        self.index = None
+
+        self._replaying = False
+        self._paused = False
+        self._file = None
+        self._records = None
+        self._next_record = None
+        self._seek = None
+        self._seek_timestamp = 0
+        self._timer = None
+        self._skip_lines = 0
+        self._line_column = 0
+        self._base_time = None
+        self._base_timestamp = None
+        self._clock_offset = 0
+        self._position = 0
+        self._offset = 0
+        self._position_notify_pending = False
+
+        self.connect("notify::speed", self._on_speed_changed)
+
+    def _get_state(self) -> int:
+        if self._replaying:
+            return SerialHandlerState.OPEN
+        return SerialHandlerState.CLOSED
+
+    @GObject.Property(type=bool, default=False)
+    def paused(self):
+        return self._paused
+
+    @paused.setter
+    def paused(self, value):
+        if value == self._paused:
+            return
+        self._paused = value
+        if self._replaying:
+            get_reactor().call_soon(self._rebase)
+
+    @GObject.Property(type=GObject.TYPE_INT64)
+    def position(self):
+        """
+        Wall-clock time (in nanoseconds since the epoch) at which the last
+        replayed data was recorded, or 0 if unknown (e.g. for text logs).
+        """
+        return self._position
+
+    @GObject.Property(type=float)
+    def progress(self):
+        """How much of the file has been replayed, from 0 to 1."""
+        if not self.index or not self.index.size:
+            return 0
+        return min(1, self._offset / self.index.size)
+
+    @GObject.Signal(arg_types=(str,))
+    def message(self, text: str):
+        """Passes on info messages and events recorded in a capture."""
+        pass
+
+    # Opening and closing
+
+    def open(self):
+        """Starts replaying the file from the beginning."""
+        if self._replaying:
+            return
+        try:
+            self.index = LogIndex(self.path)
+            self.index.load()
+            self._file = open(self.path, "rb")
+        except OSError as e:
+            self.emit("error", e.errno or 0, str(e))
+            return
+
+        self._read_buffer.reset()
+        self._read_backlog.clear()
+        self.stats.reset()
+        self.filters.reset()
+        self.filters.reset_stats()
+        self._replaying = True
+        self._seek = (0, 0, 0, 0)
+        get_reactor().call_soon(self._step)
+        self.notify("state")
+
+    def close(self):
+        """Stops the replay."""
+        if not self._replaying:
+            return
+        get_reactor().run_sync(self._stop_replay)
+        self._read_buffer.close()
+        if self._file:
+            self._file.close()
+            self._file = None
+        self.notify("state")
+
+    def _stop_replay(self):
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        self._replaying = False
+        self._records = None
+        self._next_record = None
+        self._reading_paused = False
+
+    def _finish(self):
+        if not self._replaying:
+            return False
+        self.close()
+        self.emit("message", _("Replay finished"))
+        return False
+
+    # Writing has nowhere to go.
+
+    def write(self, data: bytes) -> bool:
+        return False
+
+    def write_direct(self, data: bytes):
+        pass
+
+    # Seeking
+
+    def seek_time(self, timestamp: int):
+        """
+        Continues the replay from the first data recorded at or after the
+        given wall-clock time (in nanoseconds since the epoch). Only works
+        for captures.
+        """
+        if not self._replaying or self.index.format != IndexFormat.CAPTURE:
+            return
+        if not len(self.index):
+            return
+        entry = self.index.find_time(timestamp)
+        self._seek_to(entry, timestamp, 0)
+
+    def seek_line(self, line: int):
+        """Continues the replay from the start of the given line (from 0)."""
+        if not self._replaying or not len(self.index):
+            return
+        entry = self.index.find_line(line)
+        self._seek_to(entry, 0, line - self.index.lines[entry])
+
+    def _seek_to(self, entry: int, timestamp: int, skip_lines: int):
+        seek = (
+            self.index.offsets[entry],
+            self.index.skips[entry],
+            self.index.timestamps[entry],
+            timestamp,
+        )
+
+        def _seek():
+            self._seek = seek
+            self._skip_lines = skip_lines
+            self._line_column = 0
+            self._read_buffer.reset()
+            self._read_backlog.clear()
+            self.filters.reset()
+            if self._timer:
+                self._timer.cancel()
+                self._timer = None
+            self._step()
+
+        get_reactor().call_soon(_seek)
+
+    # Playback. Runs in the reactor thread.
+
+    def _open_records(self, offset: int, skip: int, entry_timestamp: int):
+        """Returns an iterator of (offset, kind, timestamp, payload) records."""
+        if self.index.format == IndexFormat.CAPTURE:
+            records = iter_records(self._file, offset, REPLAY_BLOCK_SIZE)
+            first = next(records, None)
+            if first is None:
+                return iter(())
+            record_offset, kind, timestamp, payload = first
+            if entry_timestamp:
+                self._clock_offset = entry_timestamp - timestamp
+            first = (record_offset, kind, timestamp, payload[skip:])
+
+            def _records():
+                yield first
+                yield from records
+
+            return _records()
+        return self._text_records(offset)
+
+    def _text_records(self, offset: int):
+        """Splits a text log into records paced at the baud rate."""
+        # Start, data and stop bits, plus parity (if any)
+        frame_bits = 2 + self.data_bits + (1 if self.parity else 0)
+        ns_per_byte = 1000000000 * frame_bits / max(1, self.baud_rate)
+        chunk_size = max(1, int(TEXT_CHUNK_INTERVAL * 1000000000 / ns_per_byte))
+        timestamp = 0
+        while True:
+            self._file.seek(offset)
+            data = self._file.read(min(chunk_size, REPLAY_BLOCK_SIZE))
+            if not data:
+                return
+            yield offset, RecordKind.RX, int(timestamp), data
+            offset += len(data)
+            timestamp += len(data) * ns_per_byte
+
+    def _rebase(self):
+        """Makes the next record due now, e.g. after a pause or speed change."""
+        self._base_time = None
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        if not self._paused:
+            self._step()
+
+    def _on_speed_changed(self, *args):
+        if self._replaying:
+            get_reactor().call_soon(self._rebase)
+
+    def _take_record(self):
+        record = self._next_record
+        if record is None:
+            record = next(self._records, None)
+        self._next_record = None
+        return record
+
+    def _skip_to_line(self, kind: int, payload: bytes):
+        """
+        Drops data until the line being sought to is reached. Returns the
+        part of the payload that should be replayed, or None.
+        """
+        if kind in (RecordKind.INFO, RecordKind.EVENT):
+            if self._line_column:
+                self._line_column = 0
+                self._skip_lines -= 1
+                if not self._skip_lines:
+                    return payload
+            self._skip_lines -= 1
+            return None
+
+        end = None
+        for end in iter_line_ends(payload, 0, self._line_column):
+            self._skip_lines -= 1
+            if not self._skip_lines:
+                self._line_column = 0
+                return payload[end:] or None
+        if end is None:
+            self._line_column += len(payload)
+        else:
+            self._line_column = len(payload) - end
+        return None
+
+    def _step(self):
+        """Replays all records that are due, then schedules the next step."""
+        self._timer = None
+        if not self._replaying or self._paused or self._reading_paused:
+            return
+
+        if self._seek is not None:
+            offset, skip, entry_timestamp, self._seek_timestamp = self._seek
+            self._seek = None
+            self._records = self._open_records(offset, skip, entry_timestamp)
+            self._next_record = None
+            self._base_time = None
+
+        speed = self.speed
+        replayed = 0
+        while True:
+            record = self._take_record()
+            if record is None:
+                self._offset = self.index.size
+                self._notify_position()
+                GLib.idle_add(self._finish)
+                return
+            offset, kind, timestamp, payload = record
+
+            if kind == RecordKind.CLOCK:
+                self._clock_offset = get_clock_offset(payload, timestamp)
+                # Timestamps before and after a clock record may come from
+                # different boots, so the timing starts over.
+                self._base_time = None
+                continue
+
+            wall_time = timestamp + self._clock_offset
+            if self._seek_timestamp:
+                if wall_time < self._seek_timestamp:
+                    continue
+                self._seek_timestamp = 0
+            if self._skip_lines:
+                if kind == RecordKind.TX:
+                    continue
+                payload = self._skip_to_line(kind, payload)
+                if payload is None:
+                    continue
+
+            now = time.monotonic_ns()
+            if speed:
+                if self._base_time is None:
+                    self._base_time = now
+                    self._base_timestamp = timestamp
+                due = self._base_time + (timestamp - self._base_timestamp) / speed
+                if due > now:
+                    self._next_record = record
+                    self._timer = get_reactor().call_later(
+                        (due - now) / 1e9, self._step
+                    )
+                    break
+            elif replayed >= REPLAY_BATCH_SIZE:
+                # Let the reactor handle other devices in the meantime
+                self._next_record = record
+                self._timer = get_reactor().call_later(0, self._step)
+                break
+
+            if kind == RecordKind.RX:
+                # Checked and paused under the delivery lock, like in
+                # SerialHandler._on_readable. Filters can still make the
+                # data larger than the free space; _replay_data() holds
+                # back what does not fit and pauses the replay.
+                with self._delivery_lock:
+                    free = self._read_buffer.free
+                    full = len(payload) > free
+                    if full:
+                        self._reading_paused = True
+                if full:
+                    # Wait for the main loop to catch up; _deliver_reads
+                    # resumes the replay through _resume_reading().
+                    if free:
+                        self._replay_data(payload[:free])
+                    self._next_record = (offset, kind, timestamp, payload[free:])
+                    break
+                self._replay_data(payload)
+                replayed += len(payload)
+            elif kind in (RecordKind.INFO, RecordKind.EVENT):
+                GLib.idle_add(
+                    self.emit, "message", payload.decode("utf-8", errors="replace")
+                )
+
+            self._offset = offset
+            if self.index.format == IndexFormat.CAPTURE:
+                self._position = wall_time
+            if self._reading_paused:
+                break
+
+        self._notify_position()
+
+    def _replay_data(self, data: bytes):
+        self.stats.add_read(len(data))
+        self._notify_traffic(RecordKind.RX, data)
+        # Replayed data is never dropped, whatever the overflow policy
+        self._queue_read(data, keep_all=True)
+
+    def _resume_reading(self):
+        if not self._flush_read_backlog():
+            return
+        with self._delivery_lock:
+            was_paused = self._reading_paused
+            self._reading_paused = False
+        if was_paused and self._replaying:
+            self._step()
+
+    def _notify_position(self):
+        with self._delivery_lock:
+            if self._position_notify_pending:
+                return
+            self._position_notify_pending = True
+        GLib.idle_add(self._emit_position, priority=GLib.PRIORITY_LOW)
+
+    def _emit_position(self):
+        with self._delivery_lock:
+            self._position_notify_pending = False
+        self.notify("position")
+        self.notify("progress")
+        return False
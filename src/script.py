@@ -0,0 +1,300 @@
+"""
+Contains the scripting API, which automates console sessions in the style
+of pexpect. A script is a Python file that drives the device through the
+console object it is given:
+
+    console.expect_exact("Hit any key to stop autoboot")
+    console.send("\\x03")
+    console.expect_exact("=> ")
+    console.sendline("version")
+    console.expect(r"U-Boot (\\S+)")
+    console.results["version"] = console.match.group(1).decode()
+
+Scripts run in a thread of their own, so they can block in expect() for as
+long as they like. Received data is fed to them by a traffic listener of
+the serial handler (see sessionscript.SessionScript) or by the headless
+capture loop, so it is still shown in the terminal and logged as usual.
+
+Only the data received since the last match is kept, up to max_buffer
+bytes, and every chunk is searched along with just enough of the data
+searched before to find matches split across reads (see SEARCH_WINDOW), so
+long scripts on chatty consoles run in bounded memory and time.
+
+This module does not use GObject, so that headless mode can run scripts
+without loading the GUI side of the app.
+"""
+
+import re
+import threading
+import time
+import traceback
+
+# Amount of received data kept for expect() (in bytes). Once there is more,
+# the oldest data is dropped.
+DEFAULT_MAX_BUFFER = 64 * 1024
+# Default time to wait for a pattern (in seconds).
+DEFAULT_TIMEOUT = 30
+# Amount of data searched before that is searched again along with new
+# data, for regular expressions (in bytes); matches longer than this may be
+# missed if they are split across reads.
+SEARCH_WINDOW = 4096
+
+
+class ScriptError(Exception):
+    pass
+
+
+class Timeout(ScriptError):
+    """Raised by expect() if none of the patterns show up in time."""
+
+    pass
+
+
+class EOF(ScriptError):
+    """Raised by expect() once the port is closed or lost."""
+
+    pass
+
+
+class ScriptCancelled(ScriptError):
+    pass
+
+
+class ScriptConsole:
+    """
+    The console object passed to scripts. Data is fed in from any thread
+    with feed(); the script thread waits for it in expect().
+
+    After a successful expect(), before holds the text received before the
+    match, after the matched text, and match the re.Match for it (over the
+    received bytes).
+    """
+
+    #: Sent after the line by sendline(); the same as the Enter key.
+    linesep = "\r"
+
+    def __init__(self, write_func, max_buffer: int = DEFAULT_MAX_BUFFER):
+        self._write = write_func
+        self.max_buffer = max_buffer
+        #: Default timeout of expect() (in seconds).
+        self.timeout = DEFAULT_TIMEOUT
+        #: Values to report once the script is done.
+        self.results = {}
+        #: Called with messages from log(); runs in the script thread.
+        self.on_log = None
+
+        self.before = ""
+        self.after = ""
+        self.match = None
+
+        self._buffer = bytearray()
+        # Amount of data dropped from the start of the buffer so far, so
+        # that search positions stay valid as data is dropped
+        self._dropped = 0
+        self._cond = threading.Condition()
+        self._eof = False
+        self._cancelled = False
+
+    # Called from other threads
+
+    def feed(self, data: bytes):
+        """Adds received data to the buffer."""
+        with self._cond:
+            buffer = self._buffer
+            buffer += data
+            # Drop old data in larger steps, so it is not moved every time
+            if len(buffer) > self.max_buffer * 2:
+                excess = len(buffer) - self.max_buffer
+                del buffer[:excess]
+                self._dropped += excess
+            self._cond.notify()
+
+    def close(self):
+        """Makes expect() raise EOF once the received data runs out."""
+        with self._cond:
+            self._eof = True
+            self._cond.notify()
+
+    def cancel(self):
+        """Makes pending and future calls from the script raise ScriptCancelled."""
+        with self._cond:
+            self._cancelled = True
+            self._cond.notify()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled
+
+    # Called from the script
+
+    def _check(self):
+        if self._cancelled:
+            raise ScriptCancelled(_("Script stopped"))
+
+    def send(self, data) -> int:
+        """Sends text or bytes to the device. Returns the amount of bytes sent."""
+        self._check()
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        if data:
+            self._write(data)
+        return len(data)
+
+    def sendline(self, line="") -> int:
+        """Sends a line of text to the device, followed by linesep."""
+        if isinstance(line, bytes):
+            return self.send(line + self.linesep.encode("utf-8"))
+        return self.send(line + self.linesep)
+
+    def sleep(self, seconds: float):
+        """Waits for the given time; unlike time.sleep(), it can be stopped."""
+        deadline = time.monotonic() + seconds
+        with self._cond:
+            self._check()
+            while (remaining := deadline - time.monotonic()) > 0:
+                self._cond.wait(remaining)
+                self._check()
+
+    def log(self, message: str):
+        """Shows a message next to the received data."""
+        if self.on_log is not None:
+            self.on_log(str(message))
+
+    def expect(self, pattern, timeout: float = -1) -> int:
+        """
+        Waits until a regular expression (or one of a list of them) is found
+        in the received data, and returns its index in the list.
+
+        Patterns are str or bytes, or compiled bytes patterns. TIMEOUT and
+        EOF may be given as patterns too, in which case their index is
+        returned instead of raising the exception. A timeout of -1 uses
+        the default timeout, and None waits forever.
+        """
+        return self._expect(pattern, timeout, exact=False)
+
+    def expect_exact(self, pattern, timeout: float = -1) -> int:
+        """Like expect(), but looks for literal text rather than patterns."""
+        return self._expect(pattern, timeout, exact=True)
+
+    def _compile(self, pattern, exact: bool):
+        if isinstance(pattern, str):
+            pattern = pattern.encode("utf-8")
+        if exact:
+            return re.compile(re.escape(pattern)), max(0, len(pattern) - 1)
+        if not isinstance(pattern, re.Pattern):
+            pattern = re.compile(pattern)
+        return pattern, SEARCH_WINDOW
+
+    def _expect(self, patterns, timeout: float, exact: bool) -> int:
+        if not isinstance(patterns, (list, tuple)):
+            patterns = [patterns]
+        searches = []
+        eof_index = timeout_index = None
+        for index, pattern in enumerate(patterns):
+            if pattern is EOF:
+                eof_index = index
+            elif pattern is Timeout:
+                timeout_index = index
+            else:
+                searches.append((index, *self._compile(pattern, exact)))
+
+        if timeout == -1:
+            timeout = self.timeout
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        with self._cond:
+            # The whole buffer is searched once, and after that only new
+            # data along with the window before it; searched is counted
+            # from the first byte ever received
+            searched = self._dropped
+            while True:
+                self._check()
+                found = self._search(searches, searched - self._dropped)
+                if found is not None:
+                    index, match = found
+                    self._consume(match)
+                    return index
+                searched = self._dropped + len(self._buffer)
+
+                if self._eof:
+                    self._consume(None)
+                    if eof_index is not None:
+                        return eof_index
+                    raise EOF(_("Connection closed"))
+
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    if timeout_index is not None:
+                        self._consume(None)
+                        return timeout_index
+                    raise Timeout(
+                        # TRANSLATORS: {timeout} is a placeholder for the
+                        # time in seconds; do not modify the string between
+                        # the braces!
+                        _("No match within {timeout} seconds").format(timeout=timeout)
+                    )
+                self._cond.wait(remaining)
+
+    def _search(self, searches: list, position: int):
+        """
+        Returns (index, match) for the earliest match of any of the
+        patterns, searching from the given buffer position (less the
+        window of every pattern), or None.
+        """
+        buffer = self._buffer
+        best = None
+        for index, regex, window in searches:
+            match = regex.search(buffer, max(0, position - window))
+            if match is not None and (best is None or match.start() < best[1].start()):
+                best = (index, match)
+        return best
+
+    def _consume(self, match):
+        """Sets before/after/match, and drops the data up to the match end."""
+        buffer = self._buffer
+        if match is None:
+            self.before = buffer.decode("utf-8", errors="replace")
+            self.after = ""
+            end = len(buffer)
+        else:
+            # The match refers to the buffer, which is about to change, so
+            # match again on a copy of it
+            match = match.re.match(bytes(buffer), match.start())
+            self.before = buffer[: match.start()].decode("utf-8", errors="replace")
+            self.after = match.group().decode("utf-8", errors="replace")
+            end = match.end()
+        self.match = match
+        del buffer[:end]
+        self._dropped += end
+
+
+def run_script(path: str, console: ScriptConsole):
+    """
+    Runs a script file in the calling thread. Exceptions raised by the
+    script are passed on, except for SystemExit with a zero status.
+    """
+    with open(path, "rb") as file:
+        code = compile(file.read(), path, "exec")
+    namespace = {
+        "__name__": "__main__",
+        "__file__": path,
+        "console": console,
+        "TIMEOUT": Timeout,
+        "EOF": EOF,
+    }
+    try:
+        exec(code, namespace)
+    except SystemExit as e:
+        if e.code not in (None, 0):
+            raise ScriptError(
+                # TRANSLATORS: {status} is a placeholder for the exit status,
+                # do not modify the string between the braces!
+                _("Script exited with status {status}").format(status=e.code)
+            ) from None
+
+
+def describe_error(e: BaseException) -> str:
+    """Returns a short description of an error raised by a script."""
+    if isinstance(e, ScriptError):
+        return str(e)
+    return "".join(traceback.format_exception_only(e)).strip()
@@ -4,13 +4,50 @@ Contains code for handling the serial device.
 
 from gi.repository import GLib, GObject
 import serial
+import errno
+import os
 import time
 import traceback
 import threading
 
-from .config import Parity, FlowControl
+from .buffer import RingBuffer, OverflowPolicy
+from .capture import RecordKind
+from .filters import FilterChain
+from .portsettings import (
+    PortSettings,
+    get_data_bits,
+    set_data_bits,
+    get_parity,
+    set_parity,
+    get_stop_bits,
+    set_stop_bits,
+    get_flow_control,
+    set_flow_control,
+)
+from .portmonitor import get_device_id, get_device_watcher, resolve_link
+from .reactor import get_reactor
+from .stats import IOStats
+from .transmit import TransmitQueue
+from .triggers import TriggerAction, TriggerEngine
 
 REFRESH_INTERVAL = 0.2  # in seconds
+# Time between attempts to reopen a lost port (in seconds). Normally, the
+# port is reopened as soon as its device node shows up again; this is the
+# fallback for when that goes unnoticed (or inotify is not available).
+RECONNECT_INTERVAL = 1
+# Maximum time to wait for the transmit thread to exit on close (in seconds).
+TX_JOIN_TIMEOUT = 1
+# Maximum time to wait on close for the device to take the data left in the
+# kernel's output buffer, before dropping it (in seconds).
+CLOSE_DRAIN_TIMEOUT = 0.05
+
+# Default maximum amount of bytes returned by a single read.
+DEFAULT_READ_CHUNK_SIZE = 4096
+# Default size of the buffer between the read loop and the main loop.
+DEFAULT_READ_BUFFER_SIZE = 4 * 1024 * 1024
+# Default minimum time between two read_done emissions (in milliseconds);
+# this roughly matches one frame on a 60Hz display.
+DEFAULT_READ_DELIVERY_INTERVAL = 16
 
 
 class SerialHandlerState:
@@ -27,15 +64,75 @@ class SerialHandler(GObject.Object):
 
     reconnect_automatically = GObject.Property(type=bool, default=False)
 
+    # Maximum amount of bytes passed on in a single read_done emission.
+    read_chunk_size = GObject.Property(
+        type=int, default=DEFAULT_READ_CHUNK_SIZE, minimum=1, maximum=1048576
+    )
+
+    # Time (in milliseconds) to wait for the line to go quiet before passing
+    # on a partially filled chunk. 0 passes on data as soon as it is read,
+    # which is best for interactive use; higher values trade latency for
+    # larger (and thus fewer) chunks on busy lines.
+    read_inter_chunk_timeout = GObject.Property(
+        type=int, default=0, minimum=0, maximum=1000
+    )
+
+    # Minimum time (in milliseconds) between two read_done emissions. Data
+    # read in the meantime is coalesced into a single emission.
+    read_delivery_interval = GObject.Property(
+        type=int, default=DEFAULT_READ_DELIVERY_INTERVAL, minimum=0, maximum=1000
+    )
+
     def __init__(self):
         super().__init__()
         self.serial = serial.Serial()
-        self._serial_loop_running = False
-        self._stop_serial_loop = False
+        self._fd = None
         self._is_reconnecting = False
+        self._reconnect_timer = None
+        # by-id link of the open device, for finding it again if it comes
+        # back under another name.
+        self._device_id = None
+        # time.monotonic() times at which the connection was lost, and at
+        # which the lost device showed up again.
+        self._lost_since = None
+        self._device_back_since = None
+        self._reading_paused = False
+        self._pending_chunk = bytearray()
+        # Filtered data that did not fit into the read buffer with the BLOCK
+        # policy; reading stays paused until it has been delivered.
+        self._read_backlog = bytearray()
+        self._chunk_timer = None
+        self._read_consumer = None
+        # Replaced rather than modified, so that it can be iterated from
+        # other threads without locking.
+        self._traffic_listeners = ()
+
+        self._read_buffer = RingBuffer(DEFAULT_READ_BUFFER_SIZE)
+        self._spilled = bytearray()
+        self._delivery_lock = threading.Lock()
+        self._delivery_pending = False
+        self._last_delivery = 0
+        self._read_since = 0
+
+        #: Traffic statistics, also available as properties (see below).
+        self.stats = IOStats()
+        #: Filters that read data goes through before reaching the main
+        #: loop (see filters.py).
+        self.filters = FilterChain()
+        #: Patterns that are reacted to as soon as they are read (see
+        #: triggers.py).
+        self.triggers = TriggerEngine()
+
+        self._tx = TransmitQueue(self.write_direct)
+        self._tx.on_progress = self._on_tx_progress
+        self._tx.on_error = self._on_tx_error
+        self._tx_notify_pending = False
 
     @GObject.Property(type=int)
     def state(self):
+        return self._get_state()
+
+    def _get_state(self) -> int:
         if self._is_reconnecting:
             return SerialHandlerState.RECONNECTING
         if self.serial.is_open:
@@ -60,103 +157,201 @@ class SerialHandler(GObject.Object):
 
     @GObject.Property(type=int)
     def data_bits(self):
-        bits = self.serial.bytesize
-        match bits:
-            case serial.FIVEBITS:
-                return 5
-            case serial.SIXBITS:
-                return 6
-            case serial.SEVENBITS:
-                return 7
-            case serial.EIGHTBITS:
-                return 8
+        return get_data_bits(self.serial)
 
     @data_bits.setter
     def data_bits(self, value):
-        match value:
-            case 5:
-                self.serial.bytesize = serial.FIVEBITS
-            case 6:
-                self.serial.bytesize = serial.SIXBITS
-            case 7:
-                self.serial.bytesize = serial.SEVENBITS
-            case 8:
-                self.serial.bytesize = serial.EIGHTBITS
-            case _:
-                raise ValueError
+        set_data_bits(self.serial, value)
 
     @GObject.Property(type=int)
     def parity(self):
-        match self.serial.parity:
-            case serial.PARITY_NONE:
-                p = Parity.NONE  # noqa: E241
-            case serial.PARITY_EVEN:
-                p = Parity.EVEN  # noqa: E241
-            case serial.PARITY_ODD:
-                p = Parity.ODD  # noqa: E241
-            case serial.PARITY_MARK:
-                p = Parity.MARK  # noqa: E241
-            case serial.PARITY_SPACE:
-                p = Parity.SPACE  # noqa: E241
-
-        return p
+        return get_parity(self.serial)
 
     @parity.setter
     def parity(self, value):
-        match int(value):
-            case Parity.NONE:
-                p = serial.PARITY_NONE  # noqa: E241
-            case Parity.EVEN:
-                p = serial.PARITY_EVEN  # noqa: E241
-            case Parity.ODD:
-                p = serial.PARITY_ODD  # noqa: E241
-            case Parity.MARK:
-                p = serial.PARITY_MARK  # noqa: E241
-            case Parity.SPACE:
-                p = serial.PARITY_SPACE  # noqa: E241
-
-        self.serial.parity = p
+        set_parity(self.serial, value)
 
     @GObject.Property(type=int)
     def stop_bits(self):
-        bits = self.serial.stopbits
-        match bits:
-            case serial.STOPBITS_ONE:
-                return 1
-            case serial.STOPBITS_TWO:
-                return 2
+        return get_stop_bits(self.serial)
 
     @stop_bits.setter
     def stop_bits(self, value):
-        match value:
-            case 1:
-                self.serial.stopbits = serial.STOPBITS_ONE
-            case 2:
-                self.serial.stopbits = serial.STOPBITS_TWO
-            case _:
-                raise ValueError
+        set_stop_bits(self.serial, value)
 
     @GObject.Property(type=int)
     def flow_control(self):
-        if self.serial.xonxoff:
-            return FlowControl.SOFTWARE
-        elif self.serial.rtscts:
-            return FlowControl.HARDWARE_RTS_CTS
-        elif self.serial.dsrdtr:
-            return FlowControl.HARDWARE_DSR_DTR
-        return FlowControl.NONE
+        return get_flow_control(self.serial)
 
     @flow_control.setter
     def flow_control(self, value):
-        self.serial.xonxoff = value == FlowControl.SOFTWARE
-        self.serial.rtscts = value == FlowControl.HARDWARE_RTS_CTS
-        self.serial.dsrdtr = value == FlowControl.HARDWARE_DSR_DTR
+        set_flow_control(self.serial, value)
+
+    @property
+    def port_settings(self) -> PortSettings:
+        """The current connection parameters, as a PortSettings object."""
+        return PortSettings(
+            port=self.port,
+            baud_rate=self.baud_rate,
+            data_bits=self.data_bits,
+            parity=self.parity,
+            stop_bits=self.stop_bits,
+            flow_control=self.flow_control,
+        )
+
+    @GObject.Property(type=int)
+    def read_buffer_size(self):
+        """
+        Maximum amount of read data (in bytes) that can be waiting for
+        delivery to the main loop.
+        """
+        return self._read_buffer.size
+
+    @read_buffer_size.setter
+    def read_buffer_size(self, value):
+        self._read_buffer.resize(value)
+
+    @GObject.Property(type=int)
+    def read_overflow_policy(self):
+        """
+        What to do when the read buffer is full (see buffer.OverflowPolicy).
+        """
+        return self._read_buffer.policy
+
+    @read_overflow_policy.setter
+    def read_overflow_policy(self, value):
+        self._read_buffer.policy = OverflowPolicy(value)
+
+    @GObject.Property(type=GObject.TYPE_UINT64)
+    def read_dropped_bytes(self):
+        """Amount of read bytes that were discarded because the read buffer was full."""
+        return self._read_buffer.dropped
+
+    # Statistics.
+    # These change all the time, so they are not notified; read them when
+    # needed instead, e.g. on a timer like the statistics panel does.
+    # Counting starts over when the port is opened.
+
+    @GObject.Property(type=GObject.TYPE_UINT64, flags=GObject.ParamFlags.READABLE)
+    def rx_bytes(self):
+        """Amount of bytes read from the device."""
+        return self.stats.rx_bytes
+
+    @GObject.Property(type=GObject.TYPE_UINT64, flags=GObject.ParamFlags.READABLE)
+    def tx_bytes(self):
+        """Amount of bytes written to the device."""
+        return self.stats.tx_bytes
+
+    @GObject.Property(type=float, flags=GObject.ParamFlags.READABLE)
+    def rx_rate(self):
+        """Bytes read per second, averaged over the last few seconds."""
+        return self.stats.rx_rate
+
+    @GObject.Property(type=float, flags=GObject.ParamFlags.READABLE)
+    def tx_rate(self):
+        """Bytes written per second, averaged over the last few seconds."""
+        return self.stats.tx_rate
+
+    @GObject.Property(type=GObject.TYPE_PYOBJECT, flags=GObject.ParamFlags.READABLE)
+    def rx_chunk_histogram(self):
+        """
+        Tuple with the amount of reads per size; item n counts reads of
+        2**n to 2**(n+1) - 1 bytes, and the last one everything larger.
+        """
+        return tuple(self.stats.chunk_histogram)
+
+    @GObject.Property(type=GObject.TYPE_UINT64, flags=GObject.ParamFlags.READABLE)
+    def read_pending_bytes(self):
+        """Amount of read bytes waiting to be delivered to the main loop."""
+        return len(self._read_buffer)
+
+    @GObject.Property(type=GObject.TYPE_UINT64, flags=GObject.ParamFlags.READABLE)
+    def read_spilled_bytes(self):
+        """
+        Amount of read bytes that were only passed on to read_spilled since
+        the read buffer was full.
+        """
+        return self.stats.spilled_bytes
+
+    @GObject.Property(type=int, flags=GObject.ParamFlags.READABLE)
+    def reconnect_count(self):
+        """Amount of times the lost connection was restored."""
+        return self.stats.reconnects
+
+    @GObject.Property(type=float, flags=GObject.ParamFlags.READABLE)
+    def reconnect_latency(self):
+        """
+        Time (in milliseconds) from the lost device showing up again to
+        the port having been reopened, for the last reconnection; -1 if
+        there was none yet. Notified on every reconnection.
+
+        The device counts as back from when its device node was created or
+        set up by udev, going by the node's ctime, so the time it takes to
+        notice it is included (see _get_device_back_time).
+        """
+        if self.stats.reconnect_latency is None:
+            return -1
+        return self.stats.reconnect_latency * 1000
+
+    @GObject.Property(type=float, flags=GObject.ParamFlags.READABLE)
+    def read_latency(self):
+        """
+        Time (in milliseconds) from reading data to read_done having been
+        handled, i.e. the data being shown; averaged over recent reads.
+        """
+        return self.stats.read_latency * 1000
+
+    @GObject.Property(type=float, flags=GObject.ParamFlags.READABLE)
+    def read_latency_max(self):
+        """Highest read latency (in milliseconds)."""
+        return self.stats.read_latency_max * 1000
+
+    def reset_stats(self):
+        """Starts counting the statistics over."""
+        self.stats.reset()
+        self.filters.reset_stats()
+        self._read_buffer.dropped = 0
+
+    @GObject.Property(type=int)
+    def tx_char_delay(self):
+        """Delay after every sent character (in milliseconds)."""
+        return round(self._tx.char_delay * 1000)
+
+    @tx_char_delay.setter
+    def tx_char_delay(self, value):
+        self._tx.char_delay = value / 1000
+
+    @GObject.Property(type=int)
+    def tx_line_delay(self):
+        """Delay after every sent line (in milliseconds)."""
+        return round(self._tx.line_delay * 1000)
+
+    @tx_line_delay.setter
+    def tx_line_delay(self, value):
+        self._tx.line_delay = value / 1000
+
+    @GObject.Property(type=bool, default=False)
+    def tx_wait_for_echo(self):
+        """
+        Whether to wait for every sent character (or line, if no character
+        delay is set) to be echoed back before sending the next one.
+        """
+        return self._tx.wait_for_echo
+
+    @tx_wait_for_echo.setter
+    def tx_wait_for_echo(self, value):
+        self._tx.wait_for_echo = value
+
+    @GObject.Property(type=GObject.TYPE_UINT64, flags=GObject.ParamFlags.READABLE)
+    def tx_queued_bytes(self):
+        """Amount of bytes waiting to be sent."""
+        return self._tx.queued
 
     @GObject.Signal
     def error(self, errno: int, message: str):
         pass
 
-    def _open(self) -> bool:
+    def _open(self, report_errors: bool = True) -> bool:
         """
         Raw port open call, without state notify wrapper.
 
@@ -178,8 +373,13 @@ class SerialHandler(GObject.Object):
 
             if errno == 2:  # Happens with symlinked ports sometimes
                 return True
+            if not report_errors:
+                return False
             traceback.print_exc()
-            self.emit("error", errno, str(e))
+            if get_reactor().in_reactor_thread():
+                GLib.idle_add(self.emit, "error", errno, str(e))
+            else:
+                self.emit("error", errno, str(e))
             return False
         return True
 
@@ -187,108 +387,541 @@ class SerialHandler(GObject.Object):
         """Opens the serial port."""
         if self._open() is False:
             return
+        self.stats.reset()
+        self.filters.reset_stats()
+        self._device_id = get_device_id(self.port)
         self.serial_loop_start()
+        self._notify_traffic(RecordKind.EVENT, f"Opened {self.port}")
         self.notify("state")
 
     def close(self):
-        """Closes the serial port."""
-        self.serial.close()
+        """
+        Closes the serial port. Data that is still waiting to be sent is
+        dropped, so that this never waits for the device.
+        """
+        self.cancel_write()
+        self._tx.join(TX_JOIN_TIMEOUT)
         self.serial_loop_stop()
+        was_open = self.serial.is_open
+        if was_open:
+            self._discard_output()
+        self.serial.close()
+        if was_open:
+            self._notify_traffic(RecordKind.EVENT, f"Closed {self.port}")
         self.notify("state")
 
+    # Traffic listeners.
+    # These see everything that goes over the port, timestamped at the
+    # moment it was read or written, without going through the main loop.
+
+    def add_traffic_listener(self, callback):
+        """
+        Calls callback(kind, timestamp, payload) for all data read from and
+        written to the device, and for connection events. kind is one of
+        capture.RecordKind.RX, TX or EVENT, and timestamp is the
+        time.monotonic_ns() value at the time of the read or write; event
+        payloads are strings.
+
+        The callback is called from the reactor thread for reads and
+        reconnections, and from the thread doing the write for writes, so
+        it must be thread-safe and return quickly.
+        """
+        self._traffic_listeners = self._traffic_listeners + (callback,)
+
+    def remove_traffic_listener(self, callback):
+        self._traffic_listeners = tuple(
+            listener for listener in self._traffic_listeners if listener != callback
+        )
+
+    def _notify_traffic(self, kind: RecordKind, payload, timestamp: int = None):
+        listeners = self._traffic_listeners
+        if not listeners:
+            return
+        if timestamp is None:
+            timestamp = time.monotonic_ns()
+        for listener in listeners:
+            try:
+                listener(kind, timestamp, payload)
+            except Exception:
+                traceback.print_exc()
+
+    # Write handlers.
+    # Writes are queued and sent by a background thread (see transmit.py),
+    # so that large pastes or flow control do not block the main loop.
+
+    def write(self, data: bytes) -> bool:
+        """
+        Queues data to be written to the serial device.
+
+        Returns False if the port is not open or the transmit queue is full.
+        """
+        if self.props.state != SerialHandlerState.OPEN:
+            return False
+        if self._read_consumer is not None:
+            # A file transfer owns the port
+            return False
+        if not self._tx.put(data):
+            self.emit("error", errno.ENOBUFS, _("Transmit queue is full"))
+            return False
+        return True
+
     def write_text(self, text: str):
         """
         Writes UTF-8 text (as returned by VteTerminal::commit) to the
         serial device.
         """
-        if self.props.state != SerialHandlerState.OPEN:
-            return
-        self.serial.write(text.encode("utf-8"))
+        self.write(text.encode("utf-8"))
+
+    def write_direct(self, data: bytes):
+        """
+        Writes data to the device right away, blocking the calling thread.
+        Used by the transmit queue and file transfers; everything else
+        should use write().
+        """
+        self.serial.write(data)
+        self.stats.add_write(len(data))
+        if self._traffic_listeners:
+            self._notify_traffic(RecordKind.TX, bytes(data))
+
+    def _discard_output(self):
+        """
+        Gives the device up to CLOSE_DRAIN_TIMEOUT to take what is left in
+        the kernel's output buffer, then drops the rest. Otherwise, closing
+        the port waits for all of it to be sent, which takes seconds at low
+        baud rates, and up to the tty's closing_wait (30 seconds by
+        default) when flow control holds the line.
+        """
+        deadline = time.monotonic() + CLOSE_DRAIN_TIMEOUT
+        try:
+            while self.serial.out_waiting and time.monotonic() < deadline:
+                time.sleep(0.001)
+            self.serial.reset_output_buffer()
+        except (OSError, serial.SerialException):
+            pass
+
+    def cancel_write(self):
+        """Drops all data that is waiting to be sent."""
+        self._tx.cancel()
+        if self.serial.is_open:
+            self.serial.cancel_write()
+
+    def _on_tx_progress(self, queued: int):
+        with self._delivery_lock:
+            if self._tx_notify_pending:
+                return
+            self._tx_notify_pending = True
+        GLib.idle_add(self._notify_tx_progress)
+
+    def _notify_tx_progress(self):
+        with self._delivery_lock:
+            self._tx_notify_pending = False
+        self.notify("tx-queued-bytes")
+        return False
+
+    def _on_tx_error(self, e: Exception):
+        GLib.idle_add(self.emit, "error", getattr(e, "errno", None) or 0, str(e))
 
-    # Read loop handlers.
-    # pyserial has no async handler, so reads must be done sequentially
-    # every few seconds.
+    # Triggers.
+    # Responses are queued for sending right from the reactor thread; the
+    # triggered signal, and everything else, goes through the main loop.
+
+    @GObject.Signal(arg_types=(GObject.TYPE_PYOBJECT, str))
+    def triggered(self, trigger, text: str):
+        """
+        Notifies consumers that a trigger (triggers.Trigger) has matched
+        the given text. Sending and closing are done by the handler itself.
+        """
+        pass
+
+    def _run_triggers(self, data: bytes):
+        """Reacts to the triggers in read data. Runs in the reactor thread."""
+        for trigger, matched in self.triggers.feed(data):
+            if trigger.action == TriggerAction.SEND:
+                if not self._tx.put(trigger.data):
+                    GLib.idle_add(
+                        self.emit, "error", errno.ENOBUFS, _("Transmit queue is full")
+                    )
+            elif trigger.action == TriggerAction.CLOSE:
+                GLib.idle_add(self.close)
+            GLib.idle_add(
+                self.emit,
+                "triggered",
+                trigger,
+                matched.decode("utf-8", errors="replace"),
+            )
+
+    # Read handlers.
+    # pyserial has no async handler, so instead the file descriptors of all
+    # open devices are watched by a single reactor thread (see reactor.py),
+    # which reads from them as soon as data is available.
 
     @GObject.Signal(arg_types=(GLib.Bytes,))
     def read_done(self, data: GLib.Bytes):
         """Notifies consumer about a read on the serial device."""
         pass
 
-    def serial_loop(self):
-        self._serial_loop_running = True
-        data = None
-        while not self._stop_serial_loop:
-            while not self._stop_serial_loop:
-                try:
-                    data = self.serial.read()
-                except TypeError:  # Serial was closed
-                    break
-                except serial.serialutil.SerialException as e:
-                    err = e.errno
-                    if err == 9:  # Serial was closed mid-read
-                        break
-                    elif err == 16:  # Resource busy
-                        break
-                    # Connection has been lost
-                    break
-
-                if data:
-                    GLib.idle_add(self.emit, "read_done", GLib.Bytes.new_take(data))
-
-            if self.props.reconnect_automatically:
-                if self.serial.is_open:
-                    self.serial.close()
-                reconnect_result = self._wait_for_reconnect()
-                if reconnect_result is not True:
-                    break
+    @GObject.Signal(arg_types=(GLib.Bytes,))
+    def read_spilled(self, data: GLib.Bytes):
+        """
+        Passes on read data that did not fit into the read buffer when the
+        overflow policy is SPILL. Meant to be consumed by the logger only.
+        """
+        pass
+
+    def _queue_read(self, data: bytes, keep_all: bool = False):
+        """
+        Adds data from the reactor thread to the read buffer and schedules its
+        delivery on the main loop, unless a delivery is already pending.
+        Data goes through the filters first.
+
+        If keep_all is set, data that does not fit is held back as with the
+        BLOCK policy, whatever the overflow policy is.
+        """
+        if self.filters:
+            data = self.filters.process(data)
+            if not data:
+                return
+
+        spilled = b""
+        if keep_all or self._read_buffer.policy == OverflowPolicy.BLOCK:
+            # Reads are sized to the free space, but filters can make data
+            # larger, and the reactor thread must never wait for the main
+            # loop; keep what does not fit until the next delivery.
+            if self._read_backlog:
+                self._read_backlog += data
             else:
-                break
+                self._read_backlog += self._read_buffer.write_available(data)
+            if self._read_backlog:
+                self._pause_reading()
+        else:
+            spilled = self._read_buffer.write(data)
+        self._schedule_delivery(spilled)
+
+    def _schedule_delivery(self, spilled: bytes = b""):
+        """Schedules the delivery of the read buffer on the main loop."""
+        with self._delivery_lock:
+            if spilled:
+                self._spilled += spilled
+                self.stats.spilled_bytes += len(spilled)
+            if self._delivery_pending:
+                return
+            self._delivery_pending = True
+
+            now = time.monotonic()
+            self._read_since = now
+            delay = self._last_delivery + self.props.read_delivery_interval / 1000 - now
+
+        if delay > 0:
+            GLib.timeout_add(
+                int(delay * 1000) + 1,
+                self._deliver_reads,
+                priority=GLib.PRIORITY_DEFAULT_IDLE,
+            )
+        else:
+            GLib.idle_add(self._deliver_reads)
+
+    def _deliver_reads(self):
+        """Emits everything accumulated in the read buffer as one read_done."""
+        with self._delivery_lock:
+            self._delivery_pending = False
+            self._last_delivery = time.monotonic()
+            spilled = bytes(self._spilled)
+            self._spilled.clear()
+            read_since = self._read_since
+            data = self._read_buffer.read_all()
+            paused = self._reading_paused
+        if paused:
+            get_reactor().call_soon(self._resume_reading)
+
+        if data:
+            self.emit("read_done", GLib.Bytes.new_take(data))
+            self.stats.add_delivery(time.monotonic() - read_since)
+        if spilled:
+            self.emit("read_spilled", GLib.Bytes.new_take(spilled))
 
-        if self.serial.is_open:
-            self.serial.close()
+        return False
 
-        GLib.idle_add(self.notify, "state")
-        self._serial_loop_running = False
+    def take_over_reads(self, consumer):
+        """
+        Passes all data read from the device to consumer.data_received()
+        instead of the read buffer, until release_reads() is called. This
+        lets protocol engines (e.g. file transfers) read without going
+        through the main loop.
 
-    def _wait_for_reconnect(self) -> bool:
+        consumer.data_received(data) and consumer.connection_lost() are
+        called from the reactor thread. Queued writes are dropped.
         """
-        Meant to be used within serial_loop to await a reconnect.
+        self.cancel_write()
+
+        def _take_over():
+            if self._chunk_timer:
+                self._chunk_timer.cancel()
+            self._flush_pending_chunk()
+            self._read_consumer = consumer
 
-        Returns True if the reconnect succeeded, False if it was stopped
-        (either by "close" button or by the reconnect option being switched
-        off).
+        get_reactor().run_sync(_take_over)
+
+    def release_reads(self):
+        """Hands reads back to the read buffer after take_over_reads()."""
+
+        def _release():
+            self._read_consumer = None
+
+        get_reactor().run_sync(_release)
+
+    def _on_readable(self):
         """
-        self._is_reconnecting = True
+        Reads available data from the device. Called by the reactor thread
+        whenever the device is readable or has been hung up.
+        """
+        size = self.props.read_chunk_size
+        if (
+            self._read_buffer.policy == OverflowPolicy.BLOCK
+            and self._read_consumer is None
+        ):
+            # Checked and paused under the delivery lock, so that a delivery
+            # either makes space before the check or sees the pause after it
+            with self._delivery_lock:
+                size = min(size, self._read_buffer.free - len(self._pending_chunk))
+                full = size <= 0 or bool(self._read_backlog)
+                if full:
+                    self._reading_paused = True
+            if full:
+                # Stop reading until the main loop catches up; the kernel
+                # buffer (and flow control, if enabled) takes over from here.
+                get_reactor().remove_reader(self._fd)
+                return
+
+        try:
+            data = os.read(self._fd, size)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b""
+
+        if not data:  # Connection has been lost
+            self._connection_lost()
+            return
+        self.stats.add_read(len(data))
+
+        if self._traffic_listeners:
+            self._notify_traffic(RecordKind.RX, data)
+
+        if self._read_consumer is not None:
+            self._read_consumer.data_received(data)
+            return
+
+        if self.triggers:
+            self._run_triggers(data)
+
+        if self._tx.wait_for_echo:
+            self._tx.feed_echo(data)
+
+        timeout = self.props.read_inter_chunk_timeout
+        if not timeout:
+            self._queue_read(data)
+            return
+
+        # Hold on to the data until the line goes quiet or a full chunk
+        # has been collected.
+        self._pending_chunk += data
+        if self._chunk_timer:
+            self._chunk_timer.cancel()
+            self._chunk_timer = None
+        if len(self._pending_chunk) >= self.props.read_chunk_size:
+            self._flush_pending_chunk()
+        else:
+            self._chunk_timer = get_reactor().call_later(
+                timeout / 1000, self._flush_pending_chunk
+            )
+
+    def _flush_pending_chunk(self):
+        self._chunk_timer = None
+        if self._pending_chunk:
+            self._queue_read(bytes(self._pending_chunk))
+            self._pending_chunk.clear()
+
+    def _pause_reading(self):
+        """Stops reading until the next delivery. Runs in the reactor thread."""
+        with self._delivery_lock:
+            was_paused = self._reading_paused
+            self._reading_paused = True
+        if not was_paused and self._fd is not None:
+            get_reactor().remove_reader(self._fd)
+
+    def _flush_read_backlog(self) -> bool:
+        """
+        Moves held back data into the read buffer, as far as it fits.
+        Returns True once there is none left. Runs in the reactor thread.
+        """
+        if self._read_backlog:
+            self._read_backlog[:] = self._read_buffer.write_available(
+                self._read_backlog
+            )
+            self._schedule_delivery()
+        return not self._read_backlog
+
+    def _resume_reading(self):
+        """Resumes reading after it was paused due to a full read buffer."""
+        if not self._flush_read_backlog():
+            return
+        with self._delivery_lock:
+            was_paused = self._reading_paused
+            self._reading_paused = False
+        if was_paused and self._fd is not None:
+            get_reactor().add_reader(self._fd, self._on_readable)
+
+    def _watch(self):
+        """Registers the open device with the reactor."""
+        self._fd = self.serial.fileno()
+        self._reading_paused = False
+        self.filters.reset()
+        self.triggers.reset()
+        get_reactor().add_reader(self._fd, self._on_readable)
+
+    def _unwatch(self):
+        """Unregisters the device from the reactor and flushes pending data."""
+        if self._fd is None:
+            return
+        get_reactor().remove_reader(self._fd)
+        self._fd = None
+        self._reading_paused = False
+        if self._chunk_timer:
+            self._chunk_timer.cancel()
+        self._flush_pending_chunk()
+
+    def _connection_lost(self):
+        """Handles the device going away. Runs in the reactor thread."""
+        self._tx.cancel()
+        if self._read_consumer is not None:
+            self._read_consumer.connection_lost()
+        self._unwatch()
+        self.serial.close()
+        self._notify_traffic(RecordKind.EVENT, f"Lost connection to {self.port}")
+
+        if self.props.reconnect_automatically:
+            self._start_reconnecting()
+
         GLib.idle_add(self.notify, "state")
 
-        while self.props.reconnect_automatically and not self._stop_serial_loop:
-            for port in serial.tools.list_ports.comports():
-                if self.port == port[0]:
-                    if self._open() is False:
-                        return False
-                    self._is_reconnecting = False
-                    GLib.idle_add(self.notify, "state")
-                    return True
+    def _start_reconnecting(self):
+        """
+        Waits for the lost device to come back. Runs in the reactor thread.
 
-            time.sleep(1)
+        The port is reopened as soon as its device node (or by-id link) is
+        created or has its permissions set up by udev, and otherwise every
+        RECONNECT_INTERVAL seconds.
+        """
+        self._is_reconnecting = True
+        self._lost_since = time.monotonic()
+        self._device_back_since = None
+        directories = [os.path.dirname(os.path.abspath(self.port))]
+        if self._device_id:
+            directories.append(os.path.dirname(self._device_id))
+        get_device_watcher().add_listener(self._try_reconnect, directories)
+        self._reconnect_timer = get_reactor().call_later(
+            RECONNECT_INTERVAL, self._on_reconnect_timer
+        )
 
+    def _stop_reconnecting(self):
+        if self._reconnect_timer:
+            self._reconnect_timer.cancel()
+            self._reconnect_timer = None
+        if self._is_reconnecting:
+            get_device_watcher().remove_listener(self._try_reconnect)
         self._is_reconnecting = False
-        # state notify is done in serial_loop
-        return False
+
+    def _on_reconnect_timer(self):
+        self._reconnect_timer = None
+        self._try_reconnect()
+        if self._is_reconnecting:
+            self._reconnect_timer = get_reactor().call_later(
+                RECONNECT_INTERVAL, self._on_reconnect_timer
+            )
+
+    def _find_lost_device(self):
+        """
+        Returns the path to reopen the lost device at, or None if it is not
+        back yet.
+
+        Devices with a by-id link are only found through it, as they might
+        come back under another name (e.g. ttyUSB1 as ttyUSB2), and their
+        old name might be taken by another device in the meantime.
+        """
+        device_id = self._device_id
+        if not device_id:
+            return self.port if os.path.exists(self.port) else None
+        if self.port == device_id:
+            return self.port if os.path.exists(device_id) else None
+        try:
+            port = resolve_link(device_id)
+        except OSError:
+            return None
+        return port if os.path.exists(port) else None
+
+    def _get_device_back_time(self, port: str) -> float:
+        """
+        Returns the time.monotonic() time at which the lost device at port
+        showed up again: the last status change (ctime) of its node, i.e.
+        when it was created or had its permissions set up, but not earlier
+        than the connection was lost.
+        """
+        now = time.monotonic()
+        try:
+            ctime = os.lstat(port).st_ctime
+        except OSError:
+            return now
+        # ctime is wall clock time, so convert it
+        back = now - max(0, time.time() - ctime)
+        return max(back, self._lost_since)
+
+    def _try_reconnect(self):
+        """
+        Attempts to reopen the port after the connection was lost. Runs in
+        the reactor thread; keeps waiting for the device if it isn't back
+        or can't be opened yet, e.g. as udev hasn't given us access to it.
+        """
+        if not self._is_reconnecting:
+            return
+        if not self.props.reconnect_automatically:
+            self._stop_reconnecting()
+            GLib.idle_add(self.notify, "state")
+            return
+
+        port = self._find_lost_device()
+        if port is None:
+            return
+        if self._device_back_since is None:
+            self._device_back_since = self._get_device_back_time(port)
+        if port != self.serial.port:
+            self.serial.port = port
+            GLib.idle_add(self.notify, "port")
+        if not (self._open(report_errors=False) is True and self.serial.is_open):
+            return
+
+        self.stats.reconnects += 1
+        self.stats.reconnect_latency = time.monotonic() - self._device_back_since
+        self._stop_reconnecting()
+        self._watch()
+        self._notify_traffic(RecordKind.EVENT, f"Reconnected to {self.port}")
+        GLib.idle_add(self.notify, "state")
+        GLib.idle_add(self.notify, "reconnect-latency")
+
+    def _stop(self):
+        """Stops reading and reconnecting. Runs in the reactor thread."""
+        self._stop_reconnecting()
+        self._unwatch()
+        if self._read_consumer is not None:
+            self._read_consumer.connection_lost()
 
     def serial_loop_start(self):
-        if self._serial_loop_running:
+        if self._fd is not None or not self.serial.is_open:
             return False
 
-        self._loop_read_queue = []
-        self._serial_loop_thread = threading.Thread(
-            target=self.serial_loop, daemon=True
-        )
-        self._serial_loop_thread.start()
+        self._read_buffer.reset()
+        self._read_backlog.clear()
+        self._watch()
 
     def serial_loop_stop(self):
-        self._stop_serial_loop = True
-        while self._serial_loop_running:
-            time.sleep(0.1)
-        self._stop_serial_loop = False
-        self._serial_loop_thread = None
+        get_reactor().run_sync(self._stop)
+        self._read_buffer.close()
@@ -0,0 +1,442 @@
+"""
+Contains the widget for a single serial console session.
+"""
+
+from gi.repository import Gio, GLib, GObject, Gtk
+import os
+
+from .config import config
+from .filters import ControlCharFilter, NewlineFilter, TimestampFilter, load_plugin
+from .hexview import ByteStore, SerialConsoleHexView  # noqa: F401
+from .history import HistoryStore
+from .logger import SerialLogger
+from .logviewer import format_timestamp, parse_time
+from .portsettings import PortSettings
+from .replay import ReplayHandler
+from .serial import SerialHandler, SerialHandlerState
+from .sessionscript import SessionScript
+from .terminal import SerialTerminal  # noqa: F401
+from .transfer import FileTransfer, TransferProtocol
+from .triggers import Trigger, TriggerAction
+
+# Config keys that the filters of a session are set up from.
+FILTER_CONFIG_KEYS = (
+    "filter-plugins",
+    "filter-control-chars",
+    "filter-newlines",
+    "filter-timestamps",
+)
+
+# Speeds offered in the replay bar, in the order of its speed selector;
+# 0 replays as fast as possible.
+REPLAY_SPEEDS = (0.25, 0.5, 1, 2, 10, 100, 0)
+
+
+@Gtk.Template(resource_path="/com/github/knuxify/SerialConsole/ui/session.ui")
+class SerialSession(Gtk.Box):
+    """
+    A single serial console: a terminal, along with the serial handler
+    and logger that feed it. Every tab in a window holds one session.
+    """
+
+    __gtype_name__ = "SerialSession"
+
+    reconnecting_banner = Gtk.Template.Child()
+    transmit_banner = Gtk.Template.Child()
+    transfer_banner = Gtk.Template.Child()
+    script_banner = Gtk.Template.Child()
+    replay_bar = Gtk.Template.Child()
+    replay_pause_button = Gtk.Template.Child()
+    replay_speed_selector = Gtk.Template.Child()
+    replay_position_label = Gtk.Template.Child()
+    replay_go_to_entry = Gtk.Template.Child()
+    view_stack = Gtk.Template.Child()
+    terminal = Gtk.Template.Child()
+    hex_view = Gtk.Template.Child()
+
+    def __init__(
+        self,
+        settings: PortSettings,
+        log_index: int = 0,
+        serial: SerialHandler = None,
+    ):
+        super().__init__()
+        self.log_index = log_index
+        self.transfer = None
+        self.script = None
+
+        # Set up serial handler; sessions can be given a handler of their
+        # own, e.g. a ReplayHandler, in which case the port settings are
+        # left alone.
+        if serial is None:
+            serial = SerialHandler()
+            for prop in ("port", "baud_rate", "data_bits", "stop_bits"):
+                serial.set_property(prop, getattr(settings, prop))
+            serial.parity = settings.parity
+            serial.flow_control = settings.flow_control
+        self.serial = serial
+
+        for key in (
+            "reconnect-automatically",
+            "tx-char-delay",
+            "tx-line-delay",
+            "tx-wait-for-echo",
+        ):
+            config.bind(key, self.serial, key, flags=Gio.SettingsBindFlags.GET)
+        self.serial.connect("read_done", self.terminal_read)
+        self.serial.connect("notify::state", self.handle_state_change)
+        self.serial.connect("notify::port", lambda *args: self.notify("title"))
+        self.serial.connect("notify::state", lambda *args: self.notify("title"))
+        self.serial.connect("notify::tx-queued-bytes", self.update_transmit_banner)
+        self.serial.connect("triggered", self.on_triggered)
+        if self.is_replay:
+            self.setup_replay()
+
+        # Set up logger
+        self.logger = SerialLogger(self.serial, log_index)
+
+        # Set up session history, which keeps what has left the scrollback
+        self.history = HistoryStore()
+        self.history.attach(self.serial)
+
+        # Set up hex view; data is kept for it even while it is hidden
+        self.byte_store = ByteStore()
+        self.byte_store.attach(self.serial)
+        self.hex_view.set_store(self.byte_store)
+
+        # Set up terminal
+        self._config_handlers = [
+            config.connect("changed::scrollback", self.update_scrollback),
+            config.connect("changed::unlimited-scrollback", self.update_scrollback),
+        ]
+        self.update_scrollback()
+
+        # Set up filters
+        for key in FILTER_CONFIG_KEYS:
+            self._config_handlers.append(
+                config.connect(f"changed::{key}", self.update_filters)
+            )
+        self.update_filters()
+
+        # Set up triggers
+        self._config_handlers.append(
+            config.connect("changed::triggers", self.update_triggers)
+        )
+        self.update_triggers()
+
+        self.handle_state_change(self.serial)
+
+    @property
+    def is_replay(self) -> bool:
+        """Whether the session replays a capture instead of using a device."""
+        return isinstance(self.serial, ReplayHandler)
+
+    @GObject.Property(type=str)
+    def title(self):
+        """Title of the session, as shown in the tab and window title."""
+        if self.is_replay:
+            # TRANSLATORS: {name} is the name of the replayed file, do not
+            # modify the string between the braces!
+            return _("Replay of {name}").format(name=os.path.basename(self.serial.path))
+        if self.serial.state != SerialHandlerState.CLOSED:
+            return self.serial.port
+
+        # TRANSLATORS: Default window caption when no console is connected
+        return _("(Not connected)")
+
+    @GObject.Property(type=bool, default=False)
+    def show_hex(self):
+        """Whether received data is shown as a hex dump instead of the terminal."""
+        return self.view_stack.get_visible_child_name() == "hex"
+
+    @show_hex.setter
+    def show_hex(self, value: bool):
+        self.view_stack.set_visible_child_name("hex" if value else "terminal")
+        if not value:
+            self.terminal.grab_focus()
+
+    def close(self):
+        """Closes the serial port and log, and releases the session."""
+        if self.transfer is not None:
+            self.transfer.cancel()
+        if self.script is not None:
+            self.script.cancel()
+        self.serial.close()
+        self.logger.shutdown()
+        self.history.close()
+        self.byte_store.close()
+        for handler in self._config_handlers:
+            config.disconnect(handler)
+        self._config_handlers = []
+
+    def handle_state_change(self, serial, *args):
+        state = serial.props.state
+
+        # Toggle "reconnecting" banner
+        self.reconnecting_banner.set_revealed(state == SerialHandlerState.RECONNECTING)
+        # Update terminal's connection status
+        self.terminal.props.connected = state == SerialHandlerState.OPEN
+
+    def update_transmit_banner(self, serial, *args):
+        queued = serial.props.tx_queued_bytes
+        if queued:
+            # TRANSLATORS: {size} is the amount of data, e.g. "1.2 MB"
+            self.transmit_banner.set_title(
+                _("Sending… ({size} left)").format(size=GLib.format_size(queued))
+            )
+        self.transmit_banner.set_revealed(queued > 0)
+
+    @Gtk.Template.Callback()
+    def cancel_write(self, *args):
+        self.serial.cancel_write()
+
+    # File transfers
+
+    def send_files(self, protocol: TransferProtocol, paths: list) -> FileTransfer:
+        """Starts sending the given files to the device."""
+        transfer = FileTransfer(self.serial, protocol, paths)
+        transfer.connect("notify::bytes-sent", self.update_transfer_banner)
+        transfer.connect("done", self.on_transfer_done)
+        self.transfer = transfer
+
+        self.terminal_write_message(
+            # TRANSLATORS: {protocol} is a placeholder for the protocol name,
+            # do not modify the string between the braces!
+            _("Starting {protocol} transfer").format(
+                protocol=transfer.protocol.name.replace("_", "-")
+            )
+        )
+        transfer.start()
+        self.update_transfer_banner(transfer)
+        self.transfer_banner.set_revealed(True)
+        return transfer
+
+    def update_transfer_banner(self, transfer, *args):
+        if not transfer.props.file_size:
+            self.transfer_banner.set_title(_("Waiting for receiver…"))
+            return
+        self.transfer_banner.set_title(
+            # TRANSLATORS: Do not modify the strings between the braces!
+            _("Sending {name}: {percent}% ({rate}/s)").format(
+                name=transfer.props.file_name,
+                percent=transfer.props.bytes_sent * 100 // transfer.props.file_size,
+                rate=GLib.format_size(int(transfer.props.rate)),
+            )
+        )
+
+    def on_transfer_done(self, transfer, success: bool, message: str):
+        self.transfer = None
+        self.transfer_banner.set_revealed(False)
+        if success:
+            self.terminal_write_message(_("Transfer complete"))
+        else:
+            self.terminal_write_message(
+                # TRANSLATORS: {msg} is a placeholder for the error message,
+                # do not modify the string between the braces!
+                _("Transfer failed: {msg}").format(msg=message)
+            )
+
+    @Gtk.Template.Callback()
+    def cancel_transfer(self, *args):
+        if self.transfer is not None:
+            self.transfer.cancel()
+
+    # Scripts
+
+    def run_script(self, path: str) -> SessionScript:
+        """Starts running a script file (see script.py) on the device."""
+        script = SessionScript(self.serial, path)
+        script.connect("log", lambda script, message: self.write_marker(message))
+        script.connect("done", self.on_script_done)
+        self.script = script
+
+        name = os.path.basename(path)
+        # TRANSLATORS: {name} is a placeholder for the file name of the
+        # script, do not modify the string between the braces!
+        self.terminal_write_message(_("Running script {name}").format(name=name))
+        # TRANSLATORS: Do not modify the string between the braces!
+        self.script_banner.set_title(_("Running {name}…").format(name=name))
+        self.script_banner.set_revealed(True)
+        script.start()
+        return script
+
+    def on_script_done(self, script, success: bool, message: str):
+        self.script = None
+        self.script_banner.set_revealed(False)
+        for name, value in script.results.items():
+            self.write_marker(f"{name}: {value}")
+        if success:
+            self.terminal_write_message(_("Script finished"))
+        else:
+            self.terminal_write_message(
+                # TRANSLATORS: {msg} is a placeholder for the error message,
+                # do not modify the string between the braces!
+                _("Script failed: {msg}").format(msg=message)
+            )
+
+    @Gtk.Template.Callback()
+    def stop_script(self, *args):
+        if self.script is not None:
+            self.script.cancel()
+
+    # Replay
+
+    def setup_replay(self):
+        self.serial.connect(
+            "message", lambda serial, text: self.terminal_write_message(text)
+        )
+        self.serial.connect("notify::progress", self.update_replay_position)
+        self.replay_pause_button.bind_property(
+            "active",
+            self.serial,
+            "paused",
+            GObject.BindingFlags.BIDIRECTIONAL | GObject.BindingFlags.SYNC_CREATE,
+        )
+        self.replay_speed_selector.set_selected(REPLAY_SPEEDS.index(1))
+        self.replay_speed_selector.connect(
+            "notify::selected", self.set_replay_speed_from_selector
+        )
+        self.replay_bar.set_revealed(True)
+        self.update_replay_position(self.serial)
+
+    def set_replay_speed_from_selector(self, selector, *args):
+        self.serial.speed = REPLAY_SPEEDS[selector.get_selected()]
+
+    def update_replay_position(self, serial, *args):
+        percent = int(serial.progress * 100)
+        if serial.position:
+            self.replay_position_label.set_label(
+                f"{format_timestamp(serial.position)} ({percent}%)"
+            )
+        else:
+            self.replay_position_label.set_label(f"{percent}%")
+
+    @Gtk.Template.Callback()
+    def replay_go_to_changed(self, *args):
+        self.replay_go_to_entry.remove_css_class("error")
+
+    @Gtk.Template.Callback()
+    def replay_go_to(self, *args):
+        index = self.serial.index
+        if index is None or self.serial.state != SerialHandlerState.OPEN:
+            return
+        query = self.replay_go_to_entry.get_text().strip()
+
+        if query.isdigit():
+            self.serial.seek_line(max(int(query), 1) - 1)
+            return
+        timestamp = parse_time(query, index.timestamps)
+        if timestamp is None:
+            self.replay_go_to_entry.add_css_class("error")
+            return
+        self.serial.seek_time(timestamp)
+
+    def update_scrollback(self, *args):
+        if config["unlimited-scrollback"]:
+            self.terminal.set_scrollback_lines(-1)
+        else:
+            self.terminal.set_scrollback_lines(config["scrollback"])
+
+    @property
+    def first_terminal_line(self) -> int:
+        """
+        Number of the oldest line of the history that is still in the
+        terminal (roughly; lines wrapped by the terminal are not counted).
+        """
+        if config["unlimited-scrollback"]:
+            return 0
+        return max(
+            0,
+            self.history.line_count
+            - config["scrollback"]
+            - self.terminal.get_row_count(),
+        )
+
+    def update_filters(self, *args):
+        """
+        Sets up the filters that read data goes through: plugins first,
+        then the built-in ones.
+        """
+        stages = []
+        for path in config["filter-plugins"]:
+            try:
+                stages.append(load_plugin(path))
+            except Exception as e:
+                self.terminal_write_message(
+                    # TRANSLATORS: Do not modify the strings between the braces!
+                    _("Failed to load filter plugin {path}: {error}").format(
+                        path=path, error=e
+                    )
+                )
+        if config["filter-control-chars"]:
+            stages.append(ControlCharFilter())
+        if config["filter-newlines"]:
+            stages.append(NewlineFilter())
+        if config["filter-timestamps"]:
+            stages.append(TimestampFilter())
+        self.serial.filters.set_stages(stages)
+
+    def update_triggers(self, *args):
+        """Passes the triggers from the config on to the serial handler."""
+        triggers = [Trigger.from_config(value) for value in config["triggers"]]
+        for trigger, error in self.serial.triggers.set_triggers(triggers):
+            self.terminal_write_message(
+                # TRANSLATORS: Do not modify the strings between the braces!
+                _("Invalid trigger pattern {pattern}: {error}").format(
+                    pattern=trigger.pattern, error=error
+                )
+            )
+
+    def on_triggered(self, serial, trigger: Trigger, text: str):
+        if trigger.action == TriggerAction.MARK:
+            self.write_marker(
+                # TRANSLATORS: Default log marker for triggers; do not modify
+                # the string between the braces!
+                trigger.argument or _("Matched {text}").format(text=text)
+            )
+
+    def write_marker(self, text: str):
+        """
+        Writes a marker to the log and history, and to the terminal unless
+        informational messages are disabled.
+        """
+        if config["disable-info-messages"]:
+            self.logger.write_message(text)
+            self.history.write_message(text)
+        else:
+            self.terminal_write_message(text)
+
+    # Console handling functions
+
+    @Gtk.Template.Callback()
+    def terminal_commit(self, terminal, text, size, *args):
+        """Get input from the terminal and send it over serial."""
+        if not self.terminal.props.connected:
+            self.terminal.feed(bytes("\a", "utf-8"))
+            return
+        if config["echo"]:
+            self.terminal.feed(bytes(text, "utf-8"))
+            self.logger.write_text(text)
+            self.history.write(bytes(text, "utf-8"))
+        self.serial.write_text(text)
+
+    def terminal_read(self, serial, data, *args):
+        self.terminal.feed(data.get_data())
+
+    def terminal_write_message(self, text):
+        """Writes an info message to the terminal."""
+        if config["disable-info-messages"]:
+            return
+
+        if (
+            self.terminal.get_text()[0] is None
+            or not self.terminal.get_text()[0].strip()
+        ):
+            self.terminal.feed(bytes(f"\r\033[0;90m--- {text} ---\r\n\033[0m", "utf-8"))
+        else:
+            self.terminal.feed(
+                bytes(f"\r\n\033[0;90m--- {text} ---\r\n\033[0m", "utf-8")
+            )
+
+        self.logger.write_message(text)
+        self.history.write_message(text)
@@ -0,0 +1,109 @@
+"""
+Contains SessionScript, which runs a script (see script.py) on the device
+of a serial handler in the GUI.
+"""
+
+from gi.repository import GLib, GObject
+import threading
+import traceback
+
+from .capture import RecordKind
+from .script import (
+    ScriptCancelled,
+    ScriptConsole,
+    ScriptError,
+    describe_error,
+    run_script,
+)
+from .serial import SerialHandlerState
+
+
+class SessionScript(GObject.Object):
+    """
+    Runs a script file against the device of a SerialHandler.
+
+    The script sees everything read from the device (as it was read, before
+    any filters), and its writes go through the handler's transmit queue
+    like typed text. It ends with EOF once the port is closed.
+    """
+
+    running = GObject.Property(type=bool, default=False)
+
+    @GObject.Signal(arg_types=(str,))
+    def log(self, message: str):
+        """Emitted on the main loop for every message from console.log()."""
+        pass
+
+    @GObject.Signal
+    def done(self, success: bool, message: str):
+        pass
+
+    def __init__(self, handler, path: str):
+        super().__init__()
+        self.handler = handler
+        self.path = path
+        self.console = ScriptConsole(self._write)
+        self.console.on_log = lambda message: GLib.idle_add(self.emit, "log", message)
+        self._state_handler = None
+        self._thread = None
+
+    @property
+    def results(self) -> dict:
+        return self.console.results
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self.handler.add_traffic_listener(self._on_traffic)
+        self._state_handler = self.handler.connect(
+            "notify::state", self._on_state_change
+        )
+        self.props.running = True
+        self._thread = threading.Thread(
+            target=self._run, name="serial-script", daemon=True
+        )
+        self._thread.start()
+
+    def cancel(self):
+        self.console.cancel()
+
+    def _on_traffic(self, kind: int, timestamp: int, payload):
+        if kind == RecordKind.RX:
+            self.console.feed(payload)
+
+    def _on_state_change(self, handler, *args):
+        # Reconnecting is not the end of the connection, closing is
+        if handler.props.state == SerialHandlerState.CLOSED:
+            self.console.close()
+
+    def _write(self, data: bytes):
+        """Writes data from the script thread, through the main loop."""
+        written = threading.Event()
+        result = []
+
+        def write():
+            result.append(self.handler.write(data))
+            written.set()
+            return False
+
+        GLib.idle_add(write)
+        written.wait()
+        if not result[0]:
+            raise ScriptError(_("Could not send data to the device"))
+
+    def _run(self):
+        try:
+            run_script(self.path, self.console)
+        except BaseException as e:
+            if not isinstance(e, ScriptCancelled):
+                traceback.print_exc()
+            GLib.idle_add(self._finish, False, describe_error(e))
+        else:
+            GLib.idle_add(self._finish, True, "")
+
+    def _finish(self, success: bool, message: str):
+        self.handler.remove_traffic_listener(self._on_traffic)
+        self.handler.disconnect(self._state_handler)
+        self.props.running = False
+        self.emit("done", success, message)
+        return False
@@ -0,0 +1,114 @@
+"""
+Contains the I/O statistics kept by serial handlers.
+
+Every counter is only ever updated by one thread (reads by the reactor
+thread, writes by the thread doing the write, deliveries by the main
+loop), so updating them is just an addition and needs no locking. Rates
+are only worked out when they are read.
+"""
+
+import collections
+import time
+
+# Amount of buckets in the read size histogram; bucket n counts reads of
+# 2**n to 2**(n+1) - 1 bytes, and the last one everything larger.
+CHUNK_HISTOGRAM_BUCKETS = 14
+# Time span that rates are averaged over (in seconds).
+RATE_WINDOW = 2
+# Minimum time between two samples kept for working out a rate (in seconds).
+RATE_SAMPLE_INTERVAL = 0.25
+# Weight of a new value in the moving average of the read latency.
+LATENCY_SMOOTHING = 0.1
+
+
+class RateMeter:
+    """Works out the rate of change of a counter over a sliding window."""
+
+    def __init__(self, window: float = RATE_WINDOW):
+        self.window = window
+        self._samples = collections.deque()
+
+    def reset(self):
+        self._samples.clear()
+
+    def sample(self, value: int, now: float = None) -> float:
+        """Adds a sample of the counter and returns its rate per second."""
+        if now is None:
+            now = time.monotonic()
+        samples = self._samples
+        if not samples or now - samples[-1][0] >= RATE_SAMPLE_INTERVAL:
+            samples.append((now, value))
+        # Keep one sample from before the window, so that the rate always
+        # covers the whole window.
+        while len(samples) > 2 and samples[1][0] <= now - self.window:
+            samples.popleft()
+
+        then, old_value = samples[0]
+        if now <= then:
+            return 0.0
+        return (value - old_value) / (now - then)
+
+
+class IOStats:
+    """Counters for the traffic going through a serial handler."""
+
+    def __init__(self):
+        self._rx_rate = RateMeter()
+        self._tx_rate = RateMeter()
+        self.reset()
+
+    def reset(self):
+        #: Total amount of read and written bytes.
+        self.rx_bytes = 0
+        self.tx_bytes = 0
+        #: Amount of reads from the device, and their sizes (see
+        #: CHUNK_HISTOGRAM_BUCKETS).
+        self.rx_chunks = 0
+        self.chunk_histogram = [0] * CHUNK_HISTOGRAM_BUCKETS
+        #: Read bytes that skipped the main loop due to a full read buffer
+        #: (OverflowPolicy.SPILL).
+        self.spilled_bytes = 0
+        #: Amount of times the connection was restored after being lost.
+        self.reconnects = 0
+        #: Time from the lost device showing up again to it having been
+        #: reopened, for the last reconnection (in seconds; None if there
+        #: was none).
+        self.reconnect_latency = None
+        #: Amount of read_done emissions.
+        self.deliveries = 0
+        #: Time from reading data to read_done having been handled, i.e.
+        #: the data being shown (in seconds): moving average and maximum.
+        self.read_latency = 0.0
+        self.read_latency_max = 0.0
+        self._rx_rate.reset()
+        self._tx_rate.reset()
+
+    def add_read(self, size: int):
+        """Counts a read from the device. Called from the reactor thread."""
+        self.rx_bytes += size
+        self.rx_chunks += 1
+        self.chunk_histogram[min(size.bit_length(), CHUNK_HISTOGRAM_BUCKETS) - 1] += 1
+
+    def add_write(self, size: int):
+        """Counts a write to the device."""
+        self.tx_bytes += size
+
+    def add_delivery(self, latency: float):
+        """Counts a read_done emission. Called from the main loop."""
+        self.deliveries += 1
+        if self.deliveries == 1:
+            self.read_latency = latency
+        else:
+            self.read_latency += (latency - self.read_latency) * LATENCY_SMOOTHING
+        if latency > self.read_latency_max:
+            self.read_latency_max = latency
+
+    @property
+    def rx_rate(self) -> float:
+        """Bytes read per second, averaged over RATE_WINDOW."""
+        return self._rx_rate.sample(self.rx_bytes)
+
+    @property
+    def tx_rate(self) -> float:
+        """Bytes written per second, averaged over RATE_WINDOW."""
+        return self._tx_rate.sample(self.tx_bytes)
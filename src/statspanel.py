@@ -0,0 +1,199 @@
+"""
+Contains the statistics panel shown in the settings sidebar.
+"""
+
+from gi.repository import Adw, GLib, Gtk
+
+# Time between two updates of the panel (in milliseconds).
+STATS_UPDATE_INTERVAL = 500
+
+_BARS = " ▁▂▃▄▅▆▇█"
+
+
+def format_histogram(histogram: tuple) -> str:
+    """Draws a histogram as a row of bars, scaled to its largest value."""
+    peak = max(histogram, default=0)
+    if not peak:
+        return _BARS[0] * len(histogram)
+    return "".join(
+        _BARS[(count * (len(_BARS) - 1) + peak - 1) // peak] for count in histogram
+    )
+
+
+def _bucket_name(bucket: int, last: bool) -> str:
+    low = 1 << bucket
+    if last:
+        return f"{GLib.format_size(low)}+"
+    if bucket == 0:
+        return GLib.format_size(1)
+    return f"{GLib.format_size(low)}–{GLib.format_size(low * 2 - 1)}"
+
+
+@Gtk.Template(resource_path="/com/github/knuxify/SerialConsole/ui/stats-panel.ui")
+class SerialConsoleStatsPanel(Adw.PreferencesGroup):
+    """
+    Shows the traffic statistics of a session. The statistics are only
+    read while the panel is on screen, a couple of times per second.
+    """
+
+    __gtype_name__ = "SerialConsoleStatsPanel"
+
+    rx_row = Gtk.Template.Child()
+    tx_row = Gtk.Template.Child()
+    chunks_row = Gtk.Template.Child()
+    chunk_histogram_label = Gtk.Template.Child()
+    latency_row = Gtk.Template.Child()
+    filters_row = Gtk.Template.Child()
+    pending_row = Gtk.Template.Child()
+    dropped_row = Gtk.Template.Child()
+    reconnects_row = Gtk.Template.Child()
+    log_lag_row = Gtk.Template.Child()
+
+    def __init__(self):
+        super().__init__()
+        self.session = None
+        self._timer = None
+        self.connect("map", self.start_updates)
+        self.connect("unmap", self.stop_updates)
+
+    def set_session(self, session):
+        """Makes the panel show the statistics of the given session."""
+        self.session = session
+        self.update()
+
+    def start_updates(self, *args):
+        if self._timer is None:
+            self._timer = GLib.timeout_add(STATS_UPDATE_INTERVAL, self.update)
+        self.update()
+
+    def stop_updates(self, *args):
+        if self._timer is not None:
+            GLib.source_remove(self._timer)
+            self._timer = None
+
+    @Gtk.Template.Callback()
+    def reset(self, *args):
+        if self.session is not None:
+            self.session.serial.reset_stats()
+            self.update()
+
+    def update(self, *args):
+        if self.session is None:
+            return True
+        serial = self.session.serial.props
+        logger = self.session.logger.props
+
+        for row, total, rate in (
+            (self.rx_row, serial.rx_bytes, serial.rx_rate),
+            (self.tx_row, serial.tx_bytes, serial.tx_rate),
+        ):
+            row.set_subtitle(
+                # TRANSLATORS: {total} and {rate} are amounts of data, e.g.
+                # "1.2 MB"; do not modify the strings between the braces!
+                _("{total} ({rate}/s)").format(
+                    total=GLib.format_size(total), rate=GLib.format_size(int(rate))
+                )
+            )
+
+        histogram = serial.rx_chunk_histogram
+        reads = sum(histogram)
+        if reads:
+            self.chunks_row.set_subtitle(
+                # TRANSLATORS: Do not modify the strings between the braces!
+                _("{count} reads, {size} on average").format(
+                    count=f"{reads:,}",
+                    size=GLib.format_size(serial.rx_bytes // reads),
+                )
+            )
+        else:
+            self.chunks_row.set_subtitle(_("None"))
+        self.chunk_histogram_label.set_label(format_histogram(histogram))
+        self.chunk_histogram_label.set_tooltip_text(
+            "\n".join(
+                f"{_bucket_name(i, i == len(histogram) - 1)}: {count:,}"
+                for i, count in enumerate(histogram)
+                if count
+            )
+            or None
+        )
+
+        self.latency_row.set_subtitle(
+            # TRANSLATORS: {average} and {max} are times in milliseconds,
+            # do not modify the strings between the braces!
+            _("{average} ms on average, {max} ms at most").format(
+                average=f"{serial.read_latency:.1f}",
+                max=f"{serial.read_latency_max:.1f}",
+            )
+        )
+        self.update_filters()
+        self.pending_row.set_subtitle(GLib.format_size(serial.read_pending_bytes))
+        self.dropped_row.set_subtitle(
+            # TRANSLATORS: {shown} and {logged} are amounts of data, e.g.
+            # "1.2 MB"; do not modify the strings between the braces!
+            _("{shown} not shown, {logged} not logged").format(
+                shown=GLib.format_size(
+                    serial.read_dropped_bytes + serial.read_spilled_bytes
+                ),
+                logged=GLib.format_size(logger.write_dropped_bytes),
+            )
+        )
+        if serial.reconnect_latency >= 0:
+            self.reconnects_row.set_subtitle(
+                # TRANSLATORS: {latency} is a time in milliseconds; do not
+                # modify the strings between the braces!
+                _("{count} (last one after {latency} ms)").format(
+                    count=serial.reconnect_count,
+                    latency=f"{serial.reconnect_latency:.0f}",
+                )
+            )
+        else:
+            self.reconnects_row.set_subtitle(str(serial.reconnect_count))
+
+        if self.session.logger.is_logging:
+            self.log_lag_row.set_subtitle(
+                # TRANSLATORS: {lag} is a time in milliseconds and {queued} an
+                # amount of data; do not modify the strings between the braces!
+                _("{lag} ms ({queued} queued)").format(
+                    lag=f"{logger.write_lag:.0f}",
+                    queued=GLib.format_size(logger.write_queued_bytes),
+                )
+            )
+        else:
+            self.log_lag_row.set_subtitle(_("Not logging"))
+        return True
+
+    def update_filters(self):
+        stats = self.session.serial.filters.stats
+        self.filters_row.set_visible(bool(stats))
+        if not stats:
+            return
+        self.filters_row.set_subtitle(
+            "\n".join(
+                # TRANSLATORS: {name} is the name of a filter and {time} a
+                # time in milliseconds; do not modify the strings between
+                # the braces!
+                _("{name}: {time} ms").format(
+                    name=stage.name, time=f"{stage.time / 1e6:.1f}"
+                )
+                + (
+                    # TRANSLATORS: Do not modify the string between the braces!
+                    _(" ({count} errors)").format(count=stage.errors)
+                    if stage.errors
+                    else ""
+                )
+                for stage in stats
+            )
+        )
+        self.filters_row.set_tooltip_text(
+            "\n".join(
+                # TRANSLATORS: {input} and {output} are amounts of data, e.g.
+                # "1.2 MB"; do not modify the strings between the braces!
+                _("{name}: {chunks} chunks, {input} in, {output} out").format(
+                    name=stage.name,
+                    chunks=f"{stage.chunks:,}",
+                    input=GLib.format_size(stage.bytes_in),
+                    output=GLib.format_size(stage.bytes_out),
+                )
+                for stage in stats
+            )
+        )
@@ -0,0 +1,831 @@
+"""
+Contains the file transfer engine, which sends files to the device over
+XMODEM, XMODEM-1K, YMODEM (batch) or ZMODEM.
+
+Transfers run in their own thread. While a transfer is running, data read
+from the device is passed straight to it from the reactor thread instead of
+going through the read buffer and main loop (see
+SerialHandler.take_over_reads), and packets are written to the device with
+one write call each.
+"""
+
+from gi.repository import GLib, GObject
+import binascii
+import enum
+import os
+import re
+import threading
+import time
+import traceback
+import zlib
+
+import serial
+
+# Maximum amount of retries for a single packet.
+MAX_ERRORS = 10
+# Time to wait for the receiver to start the transfer (in seconds).
+START_TIMEOUT = 60
+# Time to wait for a reply to a packet (in seconds).
+REPLY_TIMEOUT = 10
+# Minimum time between two progress reports (in seconds).
+PROGRESS_INTERVAL = 0.1
+
+
+class TransferProtocol(enum.IntEnum):
+    XMODEM = 0
+    XMODEM_1K = 1
+    YMODEM = 2
+    ZMODEM = 3
+
+
+class TransferError(Exception):
+    pass
+
+
+class TransferCancelled(TransferError):
+    pass
+
+
+def crc16(data: bytes, crc: int = 0) -> int:
+    """CRC-16/XMODEM, as used by XMODEM-CRC, YMODEM and ZMODEM."""
+    return binascii.crc_hqx(data, crc)
+
+
+def crc32(data: bytes, crc: int = 0) -> int:
+    """CRC-32, as used by ZMODEM."""
+    return zlib.crc32(data, crc)
+
+
+class TransferChannel:
+    """
+    Connection between a transfer thread and the serial device.
+
+    Read data is fed in by the reactor thread through data_received(), and
+    consumed by the transfer thread with read()/read_byte().
+    """
+
+    def __init__(self, write_func):
+        self._write = write_func
+        self._buffer = bytearray()
+        self._cond = threading.Condition()
+        self._lost = False
+        self._cancelled = False
+
+    # Called from the reactor thread
+
+    def data_received(self, data: bytes):
+        with self._cond:
+            self._buffer += data
+            self._cond.notify()
+
+    def connection_lost(self):
+        with self._cond:
+            self._lost = True
+            self._cond.notify()
+
+    # Called from other threads
+
+    def cancel(self):
+        """Makes pending and future reads raise TransferCancelled."""
+        with self._cond:
+            self._cancelled = True
+            self._cond.notify()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled
+
+    # Called from the transfer thread
+
+    def _check(self):
+        if self._cancelled:
+            raise TransferCancelled(_("Transfer cancelled"))
+        if self._lost:
+            raise TransferError(_("Connection lost"))
+
+    def available(self) -> int:
+        """Returns the amount of bytes that can be read without waiting."""
+        with self._cond:
+            self._check()
+            return len(self._buffer)
+
+    def read(self, size: int, timeout: float) -> bytes:
+        """
+        Reads up to size bytes, waiting up to timeout seconds for at least
+        one byte to arrive. Returns an empty bytes object on timeout.
+        """
+        with self._cond:
+            self._check()
+            if not self._buffer and timeout:
+                deadline = time.monotonic() + timeout
+                while not self._buffer:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                    self._check()
+            data = bytes(self._buffer[:size])
+            del self._buffer[:size]
+            return data
+
+    def read_byte(self, timeout: float):
+        """Reads a single byte; returns None on timeout."""
+        data = self.read(1, timeout)
+        return data[0] if data else None
+
+    def flush_input(self):
+        """Drops all data that was received but not read yet."""
+        with self._cond:
+            self._check()
+            self._buffer.clear()
+
+    def write(self, data: bytes):
+        if self._cancelled:
+            raise TransferCancelled(_("Transfer cancelled"))
+        self._write(data)
+
+
+class _FileInfo:
+    """File to be sent, along with the metadata sent in batch headers."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.name = os.path.basename(path)
+        stat = os.stat(path)
+        self.size = stat.st_size
+        self.mtime = int(stat.st_mtime)
+        self.mode = stat.st_mode
+
+
+class _Sender:
+    """Base class for the protocol senders."""
+
+    def __init__(self, channel: TransferChannel, on_progress=None):
+        self.channel = channel
+        #: Called with (file name, bytes sent, file size, bytes per second).
+        self.on_progress = on_progress
+        self._file = None
+        self._file_start = 0
+        self._last_report = 0
+
+    def send(self, paths: list):
+        raise NotImplementedError
+
+    def _start_file(self, file: _FileInfo):
+        self._file = file
+        self._file_start = time.monotonic()
+        self._last_report = 0
+        self._report(0, force=True)
+
+    def _report(self, sent: int, force: bool = False):
+        if not self.on_progress:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_report < PROGRESS_INTERVAL:
+            return
+        self._last_report = now
+        elapsed = now - self._file_start
+        rate = sent / elapsed if elapsed > 0 else 0
+        self.on_progress(self._file.name, sent, self._file.size, rate)
+
+
+#
+# XMODEM/YMODEM
+#
+
+SOH = 0x01
+STX = 0x02
+EOT = 0x04
+ACK = 0x06
+NAK = 0x15
+CAN = 0x18
+CRC_REQUEST = ord("C")
+CPMEOF = 0x1A
+
+
+class XModemSender(_Sender):
+    """
+    XMODEM sender, with support for CRC and 1K blocks. Also serves as the
+    base for the YMODEM sender.
+    """
+
+    def __init__(self, channel: TransferChannel, on_progress=None, one_k=False):
+        super().__init__(channel, on_progress)
+        self.one_k = one_k
+        self._crc_mode = True
+
+    def send(self, paths: list):
+        if len(paths) != 1:
+            raise TransferError(_("XMODEM can only send a single file"))
+        file = _FileInfo(paths[0])
+        self._crc_mode = self._wait_for_start()
+        self._send_file(file, 1)
+
+    def _wait_for_start(self) -> bool:
+        """
+        Waits for the receiver to request the transfer. Returns True if the
+        receiver asked for CRC mode, False for checksum mode.
+        """
+        deadline = time.monotonic() + START_TIMEOUT
+        while time.monotonic() < deadline:
+            byte = self.channel.read_byte(1)
+            if byte == CRC_REQUEST:
+                return True
+            if byte == NAK:
+                return False
+            if byte == CAN and self.channel.read_byte(1) == CAN:
+                raise TransferCancelled(_("Transfer cancelled by receiver"))
+        raise TransferError(_("Timed out waiting for the receiver"))
+
+    def _make_block(self, number: int, data: bytes, size: int) -> bytes:
+        data = data.ljust(size, bytes((CPMEOF,)))
+        number &= 0xFF
+        header = bytes((STX if size == 1024 else SOH, number, 0xFF - number))
+        if self._crc_mode:
+            trailer = crc16(data).to_bytes(2, "big")
+        else:
+            trailer = bytes((sum(data) & 0xFF,))
+        return header + data + trailer
+
+    def _send_packet(self, packet: bytes):
+        """Sends a packet and waits for it to be acknowledged."""
+        for _i in range(MAX_ERRORS):
+            self.channel.flush_input()
+            self.channel.write(packet)
+
+            deadline = time.monotonic() + REPLY_TIMEOUT
+            while time.monotonic() < deadline:
+                byte = self.channel.read_byte(deadline - time.monotonic())
+                if byte == ACK:
+                    return
+                if byte == CAN:
+                    if self.channel.read_byte(1) == CAN:
+                        raise TransferCancelled(_("Transfer cancelled by receiver"))
+                elif byte in (NAK, None):
+                    break
+                # Anything else (including leftover "C" start requests) is
+                # line noise; keep waiting for a reply.
+
+        raise TransferError(_("Too many errors; the receiver is not responding"))
+
+    def _send_file(self, file: _FileInfo, first_block: int):
+        self._start_file(file)
+        block_size = 1024 if self.one_k and self._crc_mode else 128
+        number = first_block
+        sent = 0
+
+        with open(file.path, "rb") as f:
+            while True:
+                data = f.read(block_size)
+                if not data:
+                    break
+                # Send the tail end in short blocks to save on padding.
+                size = block_size if len(data) > 128 else 128
+                self._send_packet(self._make_block(number, data, size))
+                number += 1
+                sent += len(data)
+                self._report(sent)
+
+        self._send_packet(bytes((EOT,)))
+        self._report(sent, force=True)
+
+
+class YModemSender(XModemSender):
+    """YMODEM batch sender."""
+
+    def __init__(self, channel: TransferChannel, on_progress=None):
+        super().__init__(channel, on_progress, one_k=True)
+
+    def send(self, paths: list):
+        files = [_FileInfo(path) for path in paths]
+        for file in files:
+            self._crc_mode = self._wait_for_start()
+            header = b"%s\0%d %o %o" % (
+                file.name.encode("utf-8"),
+                file.size,
+                file.mtime,
+                file.mode,
+            )
+            self._send_packet(self._make_header_block(header))
+            self._crc_mode = self._wait_for_start()
+            self._send_file(file, 1)
+
+        # An empty header block ends the batch.
+        self._crc_mode = self._wait_for_start()
+        self._send_packet(self._make_header_block(b""))
+
+    def _make_header_block(self, header: bytes) -> bytes:
+        """Header blocks are padded with NULs rather than CPMEOF."""
+        if len(header) > 1024:
+            raise TransferError(_("File name is too long"))
+        size = 128 if len(header) <= 128 else 1024
+        return self._make_block(0, header.ljust(size, b"\0"), size)
+
+
+#
+# ZMODEM
+#
+
+ZPAD = 0x2A
+ZDLE = 0x18
+ZBIN = 0x41
+ZHEX = 0x42
+ZBIN32 = 0x43
+
+# Frame types
+ZRQINIT = 0
+ZRINIT = 1
+ZACK = 3
+ZFILE = 4
+ZSKIP = 5
+ZNAK = 6
+ZABORT = 7
+ZFIN = 8
+ZRPOS = 9
+ZDATA = 10
+ZEOF = 11
+ZFERR = 12
+ZCRC = 13
+ZCHALLENGE = 14
+ZCAN = 16
+
+# Subpacket ends
+ZCRCE = 0x68  # end of frame, header follows
+ZCRCG = 0x69  # frame continues, no reply expected
+ZCRCQ = 0x6A  # frame continues, ZACK expected
+ZCRCW = 0x6B  # end of frame, ZACK expected
+ZRUB0 = 0x6C
+ZRUB1 = 0x6D
+
+# ZRINIT capability flags
+CANFC32 = 0x20
+ESCCTL = 0x40
+# ZFILE conversion option: binary transfer
+ZCBIN = 1
+
+# Size of a ZMODEM data subpacket.
+ZMODEM_SUBPACKET_SIZE = 1024
+# Maximum amount of unacknowledged data in flight, for receivers that can
+# stream without limits.
+ZMODEM_WINDOW_SIZE = 32768
+
+# Sent to make the receiver give up on a failed or cancelled transfer.
+ABORT_SEQUENCE = bytes((CAN,)) * 8 + b"\b" * 8
+
+_ZDLE_ESCAPES = {bytes((c,)): bytes((ZDLE, c ^ 0x40)) for c in range(256)}
+# Characters that must always be escaped: ZDLE, XON/XOFF and DLE (with and
+# without the high bit set), and CR, so that "@\r" can not trip up telnet.
+_ZDLE_ESCAPE_RE = re.compile(rb"[\x10\x11\x13\x18\x90\x91\x93\r\x8d]")
+# Used when the receiver asks for all control characters to be escaped.
+_ZDLE_ESCAPE_CTL_RE = re.compile(rb"[\x00-\x1f\x80-\x9f]")
+
+
+def _escape_match(match) -> bytes:
+    return _ZDLE_ESCAPES[match.group()]
+
+
+def _pos(offset: int) -> bytes:
+    return (offset & 0xFFFFFFFF).to_bytes(4, "little")
+
+
+def _get_pos(args: bytes) -> int:
+    return int.from_bytes(args, "little")
+
+
+class _HeaderTimeout(Exception):
+    pass
+
+
+class ZModemSender(_Sender):
+    """
+    ZMODEM sender.
+
+    File data is streamed without waiting for replies; the receiver is
+    asked to acknowledge the data every quarter window, and sending pauses
+    while a full window is unacknowledged. Receivers that report a limited
+    buffer size get a full stop at every buffer's worth of data instead.
+    """
+
+    def __init__(self, channel: TransferChannel, on_progress=None):
+        super().__init__(channel, on_progress)
+        self._crc32 = False
+        self._escape_re = _ZDLE_ESCAPE_RE
+        self._rx_buffer_size = 0
+
+    # Encoding
+
+    def _escape(self, data: bytes) -> bytes:
+        return self._escape_re.sub(_escape_match, data)
+
+    def _hex_header(self, type: int, args: bytes = bytes(4)) -> bytes:
+        header = bytes((type,)) + args
+        data = b"**\x18B" + binascii.hexlify(header + crc16(header).to_bytes(2, "big"))
+        data += b"\r\x8a"
+        if type not in (ZACK, ZFIN):
+            data += b"\x11"
+        return data
+
+    def _bin_header(self, type: int, args: bytes) -> bytes:
+        header = bytes((type,)) + args
+        if self._crc32:
+            crc = crc32(header).to_bytes(4, "little")
+            return b"*\x18C" + self._escape(header + crc)
+        crc = crc16(header).to_bytes(2, "big")
+        return b"*\x18A" + self._escape(header + crc)
+
+    def _subpacket(self, data: bytes, end: int) -> bytes:
+        if self._crc32:
+            crc = crc32(bytes((end,)), crc32(data)).to_bytes(4, "little")
+        else:
+            crc = crc16(bytes((end,)), crc16(data)).to_bytes(2, "big")
+        packet = self._escape(data) + bytes((ZDLE, end)) + self._escape(crc)
+        if end == ZCRCW:
+            packet += b"\x11"
+        return packet
+
+    # Decoding
+
+    def _read_header(self, timeout: float, poll: bool = False):
+        """
+        Reads the next valid header from the receiver and returns it as
+        a (type, args) tuple, or None on timeout. If poll is set, returns
+        None right away if no header has started to arrive yet.
+        """
+        deadline = time.monotonic() + timeout
+
+        def read() -> int:
+            byte = self.channel.read_byte(max(0, deadline - time.monotonic()))
+            if byte is None:
+                raise _HeaderTimeout()
+            return byte
+
+        cans = 0
+        try:
+            while True:
+                if poll and not self.channel.available():
+                    return None
+
+                byte = read()
+                if byte == CAN:
+                    cans += 1
+                    if cans >= 5:
+                        raise TransferCancelled(_("Transfer cancelled by receiver"))
+                    continue
+                cans = 0
+                if byte != ZPAD:
+                    continue
+
+                byte = read()
+                while byte == ZPAD:
+                    byte = read()
+                if byte != ZDLE:
+                    continue
+
+                format = read()
+                if format == ZHEX:
+                    header = self._read_hex_header(read)
+                elif format == ZBIN:
+                    header = self._read_bin_header(read, 2)
+                elif format == ZBIN32:
+                    header = self._read_bin_header(read, 4)
+                else:
+                    continue
+
+                if header is not None:
+                    return header
+        except _HeaderTimeout:
+            return None
+
+    def _read_hex_header(self, read):
+        try:
+            raw = binascii.unhexlify(bytes(read() for _i in range(14)))
+        except binascii.Error:
+            return None
+        header, crc = raw[:5], raw[5:]
+        if crc16(header).to_bytes(2, "big") != crc:
+            return None
+        return header[0], header[1:]
+
+    def _read_bin_header(self, read, crc_size: int):
+        raw = bytearray()
+        while len(raw) < 5 + crc_size:
+            byte = read()
+            if byte == ZDLE:
+                byte = read()
+                if byte == ZRUB0:
+                    byte = 0x7F
+                elif byte == ZRUB1:
+                    byte = 0xFF
+                else:
+                    byte ^= 0x40
+            raw.append(byte)
+
+        header, crc = bytes(raw[:5]), bytes(raw[5:])
+        if crc_size == 4:
+            expected = crc32(header).to_bytes(4, "little")
+        else:
+            expected = crc16(header).to_bytes(2, "big")
+        if crc != expected:
+            return None
+        return header[0], header[1:]
+
+    def _check_abort(self, type: int):
+        if type in (ZABORT, ZFERR, ZCAN, ZFIN):
+            raise TransferError(_("Transfer aborted by receiver"))
+
+    def _wait_for(self, types: tuple, timeout: float):
+        """
+        Waits for a header of one of the given types. Returns None on
+        timeout; unrelated headers are ignored.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            header = self._read_header(remaining)
+            if header is None:
+                return None
+            if header[0] in types:
+                return header
+            self._check_abort(header[0])
+
+    # Protocol
+
+    def send(self, paths: list):
+        files = [_FileInfo(path) for path in paths]
+        self.channel.write(b"rz\r")
+        self._init_receiver()
+
+        bytes_left = sum(file.size for file in files)
+        for index, file in enumerate(files):
+            self._send_file(file, len(files) - index, bytes_left)
+            bytes_left -= file.size
+
+        self._finish()
+
+    def _init_receiver(self):
+        for _i in range(MAX_ERRORS):
+            self.channel.write(self._hex_header(ZRQINIT))
+            header = self._wait_for((ZRINIT, ZCHALLENGE), REPLY_TIMEOUT)
+            if header is None:
+                continue
+
+            type, args = header
+            if type == ZCHALLENGE:
+                self.channel.write(self._hex_header(ZACK, args))
+                continue
+
+            flags = args[3]
+            self._crc32 = bool(flags & CANFC32)
+            if flags & ESCCTL:
+                self._escape_re = _ZDLE_ESCAPE_CTL_RE
+            self._rx_buffer_size = int.from_bytes(args[:2], "little")
+            return
+
+        raise TransferError(_("Timed out waiting for the receiver"))
+
+    def _send_file(self, file: _FileInfo, files_left: int, bytes_left: int):
+        self._start_file(file)
+        info = b"%s\0%d %o %o 0 %d %d\0" % (
+            file.name.encode("utf-8"),
+            file.size,
+            file.mtime,
+            file.mode,
+            files_left,
+            bytes_left,
+        )
+        zfile = self._bin_header(ZFILE, bytes((0, 0, 0, ZCBIN))) + self._subpacket(
+            info, ZCRCW
+        )
+
+        errors = 0
+        self.channel.write(zfile)
+        while True:
+            header = self._wait_for((ZRPOS, ZSKIP, ZCRC, ZRINIT, ZNAK), REPLY_TIMEOUT)
+            if header is None or header[0] in (ZRINIT, ZNAK):
+                errors += 1
+                if errors >= MAX_ERRORS:
+                    raise TransferError(
+                        _("Too many errors; the receiver is not responding")
+                    )
+                self.channel.write(zfile)
+                continue
+
+            type, args = header
+            if type == ZSKIP:
+                return
+            if type == ZCRC:
+                self.channel.write(self._hex_header(ZCRC, _pos(_file_crc(file.path))))
+                continue
+            break
+
+        self._send_data(file, _get_pos(args))
+
+    def _send_data(self, file: _FileInfo, offset: int):
+        errors = 0
+        with open(file.path, "rb") as f:
+            while True:
+                offset, done = self._stream(f, file, offset)
+                if done:
+                    # Wait for the receiver to confirm the end of the file.
+                    self.channel.write(self._bin_header(ZEOF, _pos(offset)))
+                    header = self._wait_for((ZRINIT, ZRPOS), REPLY_TIMEOUT)
+                    if header is not None and header[0] == ZRINIT:
+                        self._report(offset, force=True)
+                        return
+                    if header is not None:
+                        offset = _get_pos(header[1])
+
+                errors += 1
+                if errors >= MAX_ERRORS:
+                    raise TransferError(
+                        _("Too many errors; the receiver is not responding")
+                    )
+
+    def _stream(self, f, file: _FileInfo, offset: int) -> tuple:
+        """
+        Streams file data from offset onwards. Returns a tuple of the offset
+        to continue from and whether the end of the file was reached.
+        """
+        f.seek(offset)
+        window = ZMODEM_WINDOW_SIZE
+        acked = offset
+        since_ack_request = 0
+
+        self.channel.write(self._bin_header(ZDATA, _pos(offset)))
+        while True:
+            data = f.read(ZMODEM_SUBPACKET_SIZE)
+            eof = f.tell() >= file.size or len(data) < ZMODEM_SUBPACKET_SIZE
+            since_ack_request += len(data)
+
+            if eof:
+                end = ZCRCE
+            elif self._rx_buffer_size:
+                if since_ack_request >= self._rx_buffer_size:
+                    end = ZCRCW
+                else:
+                    end = ZCRCG
+            elif since_ack_request >= window // 4:
+                end = ZCRCQ
+            else:
+                end = ZCRCG
+
+            self.channel.write(self._subpacket(data, end))
+            offset += len(data)
+            self._report(offset)
+            if end in (ZCRCQ, ZCRCW):
+                since_ack_request = 0
+            if eof:
+                return offset, True
+
+            if end == ZCRCW:
+                header = self._wait_for((ZACK, ZRPOS), REPLY_TIMEOUT)
+                if header is None:
+                    return offset, False
+                if header[0] == ZRPOS:
+                    return _get_pos(header[1]), False
+                acked = offset
+                self.channel.write(self._bin_header(ZDATA, _pos(offset)))
+                continue
+
+            # Handle replies that came in while sending, without waiting.
+            while True:
+                header = self._read_header(REPLY_TIMEOUT, poll=True)
+                if header is None:
+                    break
+                type, args = header
+                if type == ZACK:
+                    acked = max(acked, _get_pos(args))
+                elif type == ZRPOS:
+                    return _get_pos(args), False
+                else:
+                    self._check_abort(type)
+
+            # Keep the amount of unacknowledged data within the window.
+            while offset - acked > window:
+                header = self._wait_for((ZACK, ZRPOS), REPLY_TIMEOUT)
+                if header is None:
+                    return acked, False
+                if header[0] == ZRPOS:
+                    return _get_pos(header[1]), False
+                acked = max(acked, _get_pos(header[1]))
+
+    def _finish(self):
+        for _i in range(MAX_ERRORS):
+            self.channel.write(self._hex_header(ZFIN))
+            if self._wait_for((ZFIN,), REPLY_TIMEOUT) is not None:
+                self.channel.write(b"OO")
+                return
+        raise TransferError(_("Timed out waiting for the receiver"))
+
+
+def _file_crc(path: str) -> int:
+    crc = 0
+    with open(path, "rb") as f:
+        while data := f.read(65536):
+            crc = crc32(data, crc)
+    return crc
+
+
+_SENDERS = {
+    TransferProtocol.XMODEM: lambda channel, cb: XModemSender(channel, cb),
+    TransferProtocol.XMODEM_1K: lambda channel, cb: XModemSender(
+        channel, cb, one_k=True
+    ),
+    TransferProtocol.YMODEM: YModemSender,
+    TransferProtocol.ZMODEM: ZModemSender,
+}
+
+
+class FileTransfer(GObject.Object):
+    """
+    Sends files to the device of a SerialHandler.
+
+    The transfer takes over the handler's read path while it runs, and
+    hands it back once it is done. Progress is reported through properties,
+    which are updated on the main loop.
+    """
+
+    file_name = GObject.Property(type=str)
+    bytes_sent = GObject.Property(type=GObject.TYPE_UINT64)
+    file_size = GObject.Property(type=GObject.TYPE_UINT64)
+    # Throughput of the current file, in bytes per second.
+    rate = GObject.Property(type=float)
+    running = GObject.Property(type=bool, default=False)
+
+    @GObject.Signal
+    def done(self, success: bool, message: str):
+        pass
+
+    def __init__(self, handler, protocol: TransferProtocol, paths: list):
+        super().__init__()
+        self.handler = handler
+        self.protocol = TransferProtocol(protocol)
+        self.paths = list(paths)
+
+        self._channel = None
+        self._thread = None
+        self._progress = None
+        self._progress_lock = threading.Lock()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._channel = TransferChannel(self.handler.write_direct)
+        self.handler.take_over_reads(self._channel)
+        self.props.running = True
+        self._thread = threading.Thread(
+            target=self._run, name="serial-transfer", daemon=True
+        )
+        self._thread.start()
+
+    def cancel(self):
+        if self._channel is None:
+            return
+        self._channel.cancel()
+        if self.handler.serial.is_open:
+            self.handler.serial.cancel_write()
+
+    def _run(self):
+        sender = _SENDERS[self.protocol](self._channel, self._on_progress)
+        try:
+            sender.send(self.paths)
+        except (TransferError, OSError, serial.SerialException) as e:
+            if not isinstance(e, TransferCancelled):
+                traceback.print_exc()
+            try:
+                self.handler.write_direct(ABORT_SEQUENCE)
+            except (OSError, serial.SerialException):
+                pass
+            GLib.idle_add(self._finish, False, str(e))
+        else:
+            GLib.idle_add(self._finish, True, "")
+
+    def _on_progress(self, file_name: str, sent: int, size: int, rate: float):
+        with self._progress_lock:
+            pending = self._progress is not None
+            self._progress = (file_name, sent, size, rate)
+        if not pending:
+            GLib.idle_add(self._update_progress)
+
+    def _update_progress(self):
+        with self._progress_lock:
+            progress = self._progress
+            self._progress = None
+        if progress is not None:
+            file_name, sent, size, rate = progress
+            self.freeze_notify()
+            self.props.file_name = file_name
+            self.props.file_size = size
+            self.props.bytes_sent = sent
+            self.props.rate = rate
+            self.thaw_notify()
+        return False
+
+    def _finish(self, success: bool, message: str):
+        self._update_progress()
+        self.handler.release_reads()
+        self.props.running = False
+        self.emit("done", success, message)
+        return False
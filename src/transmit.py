@@ -0,0 +1,167 @@
+"""
+Contains the transmit queue, which writes data to a serial device from
+a background thread.
+"""
+
+import collections
+import re
+import threading
+import traceback
+
+# Default maximum amount of bytes that can be waiting to be sent.
+DEFAULT_TX_QUEUE_SIZE = 16 * 1024 * 1024
+# Size of the pieces unpaced data is written in; this bounds how long it
+# takes for a cancellation or progress update to be noticed.
+WRITE_CHUNK_SIZE = 4096
+# How long to wait for an echo before moving on anyway (in seconds).
+ECHO_TIMEOUT = 1
+
+_LINE_RE = re.compile(rb"[^\r\n]*(?:\r\n|\r|\n)|[^\r\n]+")
+
+
+class TransmitQueue:
+    """
+    Bounded queue of data to be written to a serial device.
+
+    Data is written by a background thread, which is started when data is
+    queued and exits once the queue is empty. Writes can optionally be
+    paced for slow targets, by waiting between characters and/or lines, or
+    by waiting for each character/line to be echoed back by the device.
+    """
+
+    def __init__(self, write_func, capacity: int = DEFAULT_TX_QUEUE_SIZE):
+        """
+        write_func is called with the data to write, from the writer thread;
+        it may block (e.g. when flow control is asserted).
+        """
+        self._write = write_func
+        self.capacity = capacity
+
+        self._chunks = collections.deque()
+        self._queued = 0
+        self._lock = threading.Lock()
+        self._thread = None
+        self._generation = 0
+        self._cancel_event = threading.Event()
+
+        self._echo_expected = None
+        self._echo_event = threading.Event()
+
+        #: Delay after every character, in seconds.
+        self.char_delay = 0
+        #: Delay after every line, in seconds.
+        self.line_delay = 0
+        #: Whether to wait for every character/line to be echoed back.
+        self.wait_for_echo = False
+
+        #: Called from the writer thread with the amount of queued bytes
+        #: whenever it changes.
+        self.on_progress = None
+        #: Called from the writer thread with the exception if a write fails.
+        self.on_error = None
+
+    @property
+    def queued(self) -> int:
+        """Amount of bytes waiting to be sent."""
+        return self._queued
+
+    def put(self, data: bytes) -> bool:
+        """
+        Queues data for writing. Returns False if it does not fit into
+        the queue, in which case nothing is queued.
+        """
+        if not data:
+            return True
+
+        with self._lock:
+            if self._queued + len(data) > self.capacity:
+                return False
+            self._chunks.append(bytes(data))
+            self._queued += len(data)
+            self._cancel_event.clear()
+
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="serial-transmit", daemon=True
+                )
+                self._thread.start()
+
+        self._report_progress()
+        return True
+
+    def cancel(self):
+        """Drops all queued data and interrupts pacing delays."""
+        with self._lock:
+            self._generation += 1
+            self._chunks.clear()
+            self._queued = 0
+            self._cancel_event.set()
+            self._echo_event.set()
+        self._report_progress()
+
+    def join(self, timeout: float = None):
+        """Waits for the writer thread to exit."""
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+
+    def feed_echo(self, data: bytes):
+        """Passes received data on, for waiting for echoes."""
+        expected = self._echo_expected
+        if expected is not None and expected in data:
+            self._echo_expected = None
+            self._echo_event.set()
+
+    def _report_progress(self):
+        if self.on_progress:
+            self.on_progress(self._queued)
+
+    def _split(self, data: bytes) -> list:
+        """Splits data into the units that are written at once."""
+        if self.char_delay:
+            return [data[i : i + 1] for i in range(len(data))]
+        if self.line_delay or self.wait_for_echo:
+            return _LINE_RE.findall(data)
+        return [
+            data[i : i + WRITE_CHUNK_SIZE]
+            for i in range(0, len(data), WRITE_CHUNK_SIZE)
+        ]
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._chunks:
+                    self._thread = None
+                    return
+                chunk = self._chunks.popleft()
+                generation = self._generation
+
+            for unit in self._split(chunk):
+                if self._generation != generation:
+                    break
+
+                if self.wait_for_echo:
+                    self._echo_event.clear()
+                    self._echo_expected = unit[-1:]
+
+                try:
+                    self._write(unit)
+                except Exception as e:
+                    traceback.print_exc()
+                    self.cancel()
+                    if self.on_error:
+                        self.on_error(e)
+                    break
+
+                with self._lock:
+                    if self._generation == generation:
+                        self._queued -= len(unit)
+                self._report_progress()
+
+                if self.wait_for_echo:
+                    self._echo_event.wait(ECHO_TIMEOUT)
+                    self._echo_expected = None
+                if self.char_delay:
+                    self._cancel_event.wait(self.char_delay)
+                if self.line_delay and unit[-1:] in (b"\r", b"\n"):
+                    self._cancel_event.wait(self.line_delay)
@@ -0,0 +1,192 @@
+"""
+Contains the trigger engine, which reacts to patterns in the data read
+from a device: sending a response, marking the log, showing a
+notification or closing the port.
+
+All triggers are matched at once: their patterns (literal text, or
+regular expressions) are joined into a single regular expression, so
+every chunk is scanned once no matter how many triggers there are. The
+end of the previous chunk is kept and scanned again along with the next
+one, so that matches split across reads are found, but reported only
+once. Matches are reported as soon as they are found, so a pattern like
+"error \\d+" may match only part of a number that is split across reads.
+
+Matching runs in the reactor thread, right after the data is read (see
+SerialHandler._on_readable), so responses do not wait for the main loop.
+"""
+
+from enum import IntEnum
+from typing import NamedTuple
+import codecs
+import re
+
+# Amount of data from the end of the previous chunk that is scanned again
+# with the next one (in bytes); matches longer than this may be missed if
+# they are split across reads.
+TRIGGER_WINDOW = 1024
+
+
+class TriggerAction(IntEnum):
+    SEND = 0
+    MARK = 1
+    NOTIFY = 2
+    CLOSE = 3
+
+
+# Names of actions in the "triggers" config key.
+ACTION_NICKS = ("send", "mark", "notify", "close")
+
+
+class Trigger(NamedTuple):
+    """A pattern to look for in read data, and what to do when it is found."""
+
+    pattern: str
+    regex: bool
+    action: TriggerAction
+    #: Data to send (with backslash escapes, e.g. "\r" or "\x03"), or
+    #: text of the log marker or notification.
+    argument: str = ""
+
+    @classmethod
+    def from_config(cls, value: tuple) -> "Trigger":
+        pattern, regex, action, argument = value
+        return cls(pattern, regex, TriggerAction(ACTION_NICKS.index(action)), argument)
+
+    def to_config(self) -> tuple:
+        return (self.pattern, self.regex, ACTION_NICKS[self.action], self.argument)
+
+    @property
+    def data(self) -> bytes:
+        """Data to send for TriggerAction.SEND, with escapes resolved."""
+        return codecs.escape_decode(self.argument.encode("utf-8"))[0]
+
+    def compile(self) -> bytes:
+        """
+        Returns the pattern as a regular expression. Raises re.error if it
+        is not a valid one.
+        """
+        pattern = self.pattern.encode("utf-8")
+        if not self.regex:
+            return re.escape(pattern)
+        re.compile(pattern)
+        return pattern
+
+
+class TriggerEngine:
+    """
+    Matches the triggers of a serial handler against read data.
+
+    Triggers are replaced all at once, so they can be changed from the
+    main loop while the reactor thread is matching.
+    """
+
+    def __init__(self):
+        # List of [pattern, (trigger, pattern) for all triggers joined into
+        # it, end of last match, amount of the tail to scan again]
+        self._groups = ()
+        self._tail = b""
+        # Amount of data fed so far
+        self._offset = 0
+
+    def __bool__(self) -> bool:
+        return bool(self._groups)
+
+    def set_triggers(self, triggers: list) -> list:
+        """
+        Sets the triggers to look for. Returns (trigger, re.error) for all
+        triggers with invalid patterns, which are left out.
+        """
+        errors = []
+        compiled = []
+        for trigger in triggers:
+            try:
+                compiled.append((trigger, trigger.compile()))
+            except re.error as e:
+                errors.append((trigger, e))
+
+        # Patterns are joined without a group per trigger, which would keep
+        # the regex engine from skipping ahead to possible matches (making
+        # it over 20 times slower with a few triggers); which trigger
+        # matched is found out afterwards. Patterns with groups (which
+        # joining would renumber) or global inline flags are matched on
+        # their own. Literal text is joined separately from regular
+        # expressions, as only its length has to be scanned again.
+        groups = []
+        literals = []
+        regexes = []
+        for trigger, pattern in compiled:
+            regex = re.compile(pattern)
+            try:
+                if regex.groups:
+                    raise re.error("pattern has groups")
+                re.compile(b"(?:" + pattern + b")")
+            except re.error:
+                groups.append(
+                    [regex, ((trigger, regex),), self._offset, TRIGGER_WINDOW]
+                )
+                continue
+            (regexes if trigger.regex else literals).append((trigger, regex))
+
+        for joined in (literals, regexes):
+            if not joined:
+                continue
+            if len(joined) == 1:
+                regex = joined[0][1]
+            else:
+                regex = re.compile(
+                    b"|".join(b"(?:" + regex.pattern + b")" for _t, regex in joined)
+                )
+            if joined is literals:
+                lookback = max(len(trigger.pattern.encode()) for trigger, _r in joined)
+            else:
+                lookback = TRIGGER_WINDOW
+            groups.insert(0, [regex, tuple(joined), self._offset, lookback])
+
+        self._groups = tuple(groups)
+        return errors
+
+    def reset(self):
+        """Forgets the end of the previous chunk, e.g. after reconnecting."""
+        self._tail = b""
+        for group in self._groups:
+            group[2] = self._offset
+
+    def feed(self, data: bytes) -> list:
+        """
+        Looks for triggers in a chunk of read data. Returns (trigger,
+        matched data) for all matches, in order.
+        """
+        groups = self._groups
+        tail = self._tail
+        text = tail + data if tail else data
+        # Offset of the start of text in the data fed so far
+        base = self._offset - len(tail)
+
+        matches = []
+        for group in groups:
+            pattern, triggers, scanned, lookback = group
+            position = max(0, scanned - base, len(tail) - lookback)
+            for match in pattern.finditer(text, position):
+                end = match.end()
+                # Matches within the tail were reported with the last chunk
+                if end <= len(tail) or end == match.start():
+                    continue
+                start = match.start()
+                if len(triggers) == 1:
+                    trigger = triggers[0][0]
+                else:
+                    # Alternatives are tried in order, so the first one
+                    # that matches here is the one that was found
+                    trigger = next(
+                        trigger
+                        for trigger, regex in triggers
+                        if regex.match(text, start)
+                    )
+                matches.append((start, trigger, match.group()))
+                group[2] = base + end
+        if len(groups) > 1:
+            matches.sort(key=lambda match: match[0])
+
+        self._offset += len(data)
+        self._tail = text[-TRIGGER_WINDOW:]
+        return [(trigger, matched) for _start, trigger, matched in matches]
@@ -0,0 +1,150 @@
+"""
+Contains the triggers panel shown in the settings sidebar, which lists the
+triggers in the config and lets them be added and removed.
+"""
+
+from gi.repository import Adw, Gtk
+import re
+
+from .config import config
+from .triggers import Trigger, TriggerAction
+
+# Translatable names of trigger actions, in the order of TriggerAction.
+ACTION_NAMES = (
+    # TRANSLATORS: Trigger action
+    _("Send data"),
+    # TRANSLATORS: Trigger action
+    _("Mark the log"),
+    # TRANSLATORS: Trigger action
+    _("Show a notification"),
+    # TRANSLATORS: Trigger action
+    _("Close the port"),
+)
+
+# Titles of the argument entry, for every action (None if it has none).
+ARGUMENT_TITLES = (
+    _("Data to send, e.g. \\r or \\x03"),
+    _("Marker text (optional)"),
+    _("Notification text (optional)"),
+    None,
+)
+
+
+def describe_trigger(trigger: Trigger) -> str:
+    """Returns what a trigger does, as shown in the panel."""
+    if trigger.action == TriggerAction.SEND:
+        # TRANSLATORS: {data} is the data sent by a trigger; do not modify
+        # the string between the braces!
+        return _("Send {data}").format(data=trigger.argument)
+    return ACTION_NAMES[trigger.action]
+
+
+@Gtk.Template(resource_path="/com/github/knuxify/SerialConsole/ui/triggers-panel.ui")
+class SerialConsoleTriggersPanel(Adw.PreferencesGroup):
+    """Lists the triggers, which are shared by all sessions."""
+
+    __gtype_name__ = "SerialConsoleTriggersPanel"
+
+    def __init__(self):
+        super().__init__()
+        self._rows = []
+        config.connect("changed::triggers", self.update)
+        self.update()
+
+    def update(self, *args):
+        for row in self._rows:
+            self.remove(row)
+        self._rows = []
+
+        for position, value in enumerate(config["triggers"]):
+            trigger = Trigger.from_config(value)
+            row = Adw.ActionRow(
+                title=trigger.pattern,
+                subtitle=describe_trigger(trigger),
+                use_markup=False,
+            )
+            if trigger.regex:
+                row.add_css_class("monospace")
+
+            button = Gtk.Button(
+                icon_name="user-trash-symbolic",
+                tooltip_text=_("Remove Trigger"),
+                valign=Gtk.Align.CENTER,
+            )
+            button.add_css_class("flat")
+            button.connect("clicked", self.remove_trigger, position)
+            row.add_suffix(button)
+
+            self.add(row)
+            self._rows.append(row)
+
+        self.set_description(
+            None
+            if self._rows
+            else _("React to received text, e.g. to stop a bootloader's autoboot")
+        )
+
+    def remove_trigger(self, button, position: int):
+        triggers = list(config["triggers"])
+        del triggers[position]
+        config["triggers"] = triggers
+
+    @Gtk.Template.Callback()
+    def add_trigger(self, *args):
+        """Asks for a new trigger and adds it to the config."""
+        pattern_row = Adw.EntryRow(title=_("Text to look for"))
+        regex_row = Adw.SwitchRow(title=_("Regular expression"))
+        action_row = Adw.ComboRow(
+            title=_("Action"), model=Gtk.StringList.new(list(ACTION_NAMES))
+        )
+        argument_row = Adw.EntryRow()
+
+        fields = Gtk.ListBox(selection_mode=Gtk.SelectionMode.NONE)
+        fields.add_css_class("boxed-list")
+        for row in (pattern_row, regex_row, action_row, argument_row):
+            fields.append(row)
+
+        dialog = Adw.AlertDialog(heading=_("Add Trigger"), extra_child=fields)
+        dialog.add_response("cancel", _("Cancel"))
+        dialog.add_response("add", _("Add"))
+        dialog.set_response_appearance("add", Adw.ResponseAppearance.SUGGESTED)
+        dialog.set_default_response("add")
+        dialog.set_close_response("cancel")
+
+        def get_trigger() -> Trigger:
+            action = TriggerAction(action_row.get_selected())
+            return Trigger(
+                pattern_row.get_text(),
+                regex_row.get_active(),
+                action,
+                argument_row.get_text() if ARGUMENT_TITLES[action] else "",
+            )
+
+        def validate(*args):
+            action = action_row.get_selected()
+            argument_row.set_visible(ARGUMENT_TITLES[action] is not None)
+            argument_row.set_title(ARGUMENT_TITLES[action] or "")
+            valid = bool(pattern_row.get_text())
+            if valid:
+                try:
+                    get_trigger().compile()
+                except re.error:
+                    valid = False
+            if valid or not pattern_row.get_text():
+                pattern_row.remove_css_class("error")
+            else:
+                pattern_row.add_css_class("error")
+            dialog.set_response_enabled("add", valid)
+
+        def on_response(dialog, response):
+            if response == "add":
+                config["triggers"] = list(config["triggers"]) + [
+                    get_trigger().to_config()
+                ]
+
+        pattern_row.connect("changed", validate)
+        regex_row.connect("notify::active", validate)
+        action_row.connect("notify::selected", validate)
+        dialog.connect("response", on_response)
+        validate()
+        dialog.present(self)
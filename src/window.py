@@ -2,10 +2,11 @@
 Main code for the application window.
 """
 
-from gi.repository import Adw, Gio, GLib, GObject, Gtk, Vte  # noqa: F401
-import serial.tools.list_ports
+from gi.repository import Adw, Gio, GLib, GObject, Gtk, Pango, Vte  # noqa: F401
 from typing import Optional
+import bisect
 import os.path
+import re
 
 from . import DEVEL
 from .config import (
@@ -19,13 +20,26 @@ from .config import (
 from .common import (
     disallow_nonnumeric,
     find_in_stringlist,
-    copy_list_to_stringlist,
     BoolPropertyAction,
 )
+from .history import HistorySearch
+from .portlist import PortInfo
 from .serial import SerialHandler, SerialHandlerState
-from .terminal import SerialTerminal  # noqa: F401
-from .logger import SerialLogger, DEFAULT_LOG_FILENAME
-
+from .session import SerialSession
+from .transfer import TransferProtocol
+from .triggers import Trigger, TriggerAction
+from .capture import get_capture_path
+from .logfile import get_session_log_path
+from .logger import DEFAULT_LOG_FILENAME
+from .logviewer import SerialConsoleLogViewer
+from .replay import ReplayHandler
+from .statspanel import SerialConsoleStatsPanel  # noqa: F401
+from .triggerspanel import SerialConsoleTriggersPanel  # noqa: F401
+
+
+# Serial handler properties that are stored in the config as-is. Parity
+# and flow control are enums, and are synced through the settings pane.
+SERIAL_CONFIG_PROPERTIES = ("port", "baud-rate", "data-bits", "stop-bits")
 
 # PCRE flags for search regex:
 PCRE2_CASELESS = 0x00000008
@@ -38,13 +52,12 @@ class SerialConsoleWindow(Adw.ApplicationWindow):
 
     split_view = Gtk.Template.Child()
     sidebar = Gtk.Template.Child()
-    terminal = Gtk.Template.Child()
+    tab_view = Gtk.Template.Child()
 
     open_button_switcher = Gtk.Template.Child()
     open_button = Gtk.Template.Child()
     close_button = Gtk.Template.Child()
 
-    reconnecting_banner = Gtk.Template.Child()
     toast_overlay = Gtk.Template.Child()
 
     console_header = Gtk.Template.Child()
@@ -55,6 +68,8 @@ class SerialConsoleWindow(Adw.ApplicationWindow):
     search_settings_menu = Gtk.Template.Child()
     search_next_button = Gtk.Template.Child()
     search_previous_button = Gtk.Template.Child()
+    search_count_label = Gtk.Template.Child()
+    search_history_button = Gtk.Template.Child()
 
     # Search properties
 
@@ -63,17 +78,20 @@ class SerialConsoleWindow(Adw.ApplicationWindow):
 
     @GObject.Property(type=bool, default=True)
     def search_wrap_around(self):
-        return self.terminal.search_get_wrap_around()
+        return self._search_wrap_around
 
     @search_wrap_around.setter
     def search_wrap_around(self, search_wrap_around: bool):
-        return self.terminal.search_set_wrap_around(search_wrap_around)
+        self._search_wrap_around = search_wrap_around
+        for session in self.sessions:
+            session.terminal.search_set_wrap_around(search_wrap_around)
 
     # Search properties end
 
     def __init__(self, *args, **kwargs):
+        self._search_wrap_around = True
+        self._title_binding = None
         super().__init__(*args, **kwargs)
-        self.reconnect_thread = None
 
         if DEVEL:
             self.add_css_class("devel")
@@ -84,13 +102,12 @@ class SerialConsoleWindow(Adw.ApplicationWindow):
         application.get_style_manager().connect(
             "notify::dark", self.theme_change_callback
         )
-        self.set_terminal_color_scheme()
 
         # Set up search bar
         self.search_bar.connect_entry(self.search_entry)
         self.install_action("win.find", None, self.toggle_search_bar)
-        self.terminal.search_set_wrap_around(True)
         self.prev_search_query: Optional[str] = None
+        self._history_search: Optional[HistorySearch] = None
 
         for cfg in ("search-wrap-around", "search-case-sensitive", "search-regex"):
             config.bind(cfg, self, cfg, flags=Gio.SettingsBindFlags.DEFAULT)
@@ -104,33 +121,41 @@ class SerialConsoleWindow(Adw.ApplicationWindow):
 
             self.connect(f"notify::{cfg}", self.search_changed)
 
-        # Set up serial handler
-        self.serial = SerialHandler()
-        self.serial.connect("read_done", self.terminal_read)
-        self.serial.connect("notify::state", self.handle_state_change)
-        self.serial.connect("error", self.handle_error)
-        self.sidebar.reconnect_automatically.bind_property(
-            "active",
-            self.serial,
-            "reconnect-automatically",
-            GObject.BindingFlags.BIDIRECTIONAL | GObject.BindingFlags.SYNC_CREATE,
-        )
+        # Set up hex view toggle
+        self.add_action(BoolPropertyAction("show-hex", self, "show-hex"))
+
+        # Set up tabs
+        self.install_action("win.new-tab", None, lambda *args: self.new_session())
+        self.install_action("win.close-tab", None, self.close_current_session)
+        self.tab_view.connect("notify::selected-page", self.on_session_changed)
+        self.tab_view.connect("close-page", self.on_close_page)
+
+        # Set up file transfers
+        self.install_action("win.send-file", "s", self.send_file)
+        self._send_file_dialog = Gtk.FileDialog.new()
+        self._send_file_dialog.props.modal = True
 
-        self.ports = Gtk.StringList()
-        self.get_available_ports()
-        GLib.timeout_add(1000, self.get_available_ports)
+        # Set up scripts
+        self.install_action("win.run-script", None, self.run_script)
+        self._script_dialog = Gtk.FileDialog.new()
+        self._script_dialog.props.modal = True
 
-        # Set up logger
-        self.logger = SerialLogger(self.serial)
-        self.logger.connect("log-open-failure", self.on_log_open_failure)
+        # Set up capture replay
+        self.install_action("win.replay-capture", None, self.replay_capture)
+        self._replay_dialog = Gtk.FileDialog.new()
+        self._replay_dialog.props.modal = True
+
+        # The port list is shared between all windows
+        self.ports = application.ports
+
+        self.sidebar.setup(self)
+        self.new_session()
 
         # Miscelaneous app setup
         self.set_icon_name(application.get_application_id())
 
         self.connect("close-request", self.on_close)
 
-        self.handle_state_change(self.serial)
-
     def on_maximize_toggle(self, action, value):
         action.set_value(value)
         if value.get_boolean():
@@ -139,8 +164,9 @@ class SerialConsoleWindow(Adw.ApplicationWindow):
             self.unmaximize()
 
     def on_close(self, *args):
-        self.serial.close()
-        self.logger.close_log()
+        for session in self.sessions:
+            self.get_application().release_session(session)
+            session.close()
 
     def on_log_open_failure(self, *args):
         self.sidebar.log_enable_toggle.set_active(False)
@@ -150,35 +176,157 @@ class SerialConsoleWindow(Adw.ApplicationWindow):
             )
         )
 
+    def on_log_write_failure(self, *args):
+        self.toast_overlay.add_toast(
+            Adw.Toast.new(
+                _(
+                    "Failed to write to log file; check the free disk space and try again"
+                )
+            )
+        )
+
+    @GObject.Property(type=bool, default=False)
+    def show_hex(self):
+        """Whether the current session shows received data as a hex dump."""
+        session = self.session
+        return session is not None and session.show_hex
+
+    @show_hex.setter
+    def show_hex(self, value: bool):
+        session = self.session
+        if session is not None and session.show_hex != value:
+            session.show_hex = value
+
+    # Session handling functions
+
+    @property
+    def sessions(self) -> list:
+        """All sessions open in this window."""
+        pages = self.tab_view.get_pages()
+        return [pages.get_item(i).get_child() for i in range(pages.get_n_items())]
+
+    @property
+    def session(self) -> Optional[SerialSession]:
+        """The currently selected session."""
+        page = self.tab_view.get_selected_page()
+        if page is None:
+            return None
+        return page.get_child()
+
+    @property
+    def serial(self) -> Optional[SerialHandler]:
+        """Serial handler of the currently selected session."""
+        session = self.session
+        if session is None:
+            return None
+        return session.serial
+
+    @property
+    def terminal(self):
+        """Terminal of the currently selected session."""
+        session = self.session
+        if session is None:
+            return None
+        return session.terminal
+
+    def new_session(self, serial: SerialHandler = None) -> SerialSession:
+        """
+        Opens a new session in a new tab and switches to it. If a serial
+        handler is given, the session uses it instead of creating its own.
+        """
+        application = self.get_application()
+        session = SerialSession(
+            application.get_new_session_settings(),
+            application.acquire_session_index(),
+            serial,
+        )
+        session.serial.connect("notify::state", self.handle_state_change)
+        session.serial.connect("error", self.handle_error)
+        session.serial.connect("triggered", self.handle_trigger)
+        session.logger.connect("log-open-failure", self.on_log_open_failure)
+        session.logger.connect("log-write-failure", self.on_log_write_failure)
+        session.terminal.search_set_wrap_around(self.props.search_wrap_around)
+        self.set_terminal_color_scheme(session=session)
+
+        page = self.tab_view.append(session)
+        session.bind_property("title", page, "title", GObject.BindingFlags.SYNC_CREATE)
+        self.tab_view.set_selected_page(page)
+        return session
+
+    def close_current_session(self, *args):
+        page = self.tab_view.get_selected_page()
+        if page is not None:
+            self.tab_view.close_page(page)
+
+    def on_close_page(self, tab_view, page):
+        session = page.get_child()
+        self.get_application().release_session(session)
+        session.close()
+        tab_view.close_page_finish(page, True)
+
+        if tab_view.get_n_pages() == 0:
+            self.close()
+        return True
+
+    def on_session_changed(self, *args):
+        session = self.session
+        if session is None:
+            return
+
+        if self._title_binding:
+            self._title_binding.unbind()
+        self._title_binding = session.bind_property(
+            "title",
+            self.console_header.get_title_widget(),
+            "subtitle",
+            GObject.BindingFlags.SYNC_CREATE,
+        )
+
+        self.sidebar.set_session(session)
+        self.handle_state_change(session.serial)
+        self.notify("show-hex")
+        self.prev_search_query = None
+        if self.search_bar.props.search_mode_enabled:
+            self.search_changed()
+        session.terminal.grab_focus()
+
     # Port update functions
 
-    def get_available_ports(self, *args):
-        ports = sorted([port[0] for port in serial.tools.list_ports.comports()])
-        self.sidebar._ignore_port_change = True
-        copy_list_to_stringlist(ports, self.ports)
-        self.sidebar._ignore_port_change = False
+    def update_port_selection(self):
+        """Updates the port selector and open button after a port list update."""
+        serial = self.serial
+        if serial is None:
+            return
+
         try:
-            self.sidebar.port_selector.set_selected(
-                find_in_stringlist(self.ports, self.serial.port)
-            )
+            self.sidebar.port_selector.set_selected(self.ports.find(serial.port))
         except (TypeError, ValueError, OverflowError):
             pass
 
-        if not self.serial.port and ports:
-            self.serial.port = ports[0]
+        if not serial.port and self.ports.get_n_items():
+            serial.port = self.ports.get_item(0).device
 
-        if self.serial.state == SerialHandlerState.CLOSED:
-            self.open_button.set_sensitive(bool(ports))
+        if serial.state == SerialHandlerState.CLOSED:
+            self.open_button.set_sensitive(self.can_open(serial))
 
-        return True
+    def can_open(self, serial: SerialHandler) -> bool:
+        """Whether the open button should be usable for the handler."""
+        # Replays can always be restarted
+        return isinstance(serial, ReplayHandler) or bool(self.ports.get_n_items())
 
     def handle_state_change(self, serial, *args):
+        if serial is not self.serial:
+            return
         state = serial.props.state
 
-        # Toggle "reconnecting" banner
-        self.reconnecting_banner.set_revealed(state == SerialHandlerState.RECONNECTING)
-        # Update terminal's connection status
-        self.terminal.props.connected = state == SerialHandlerState.OPEN
+        self.action_set_enabled(
+            "win.send-file",
+            state == SerialHandlerState.OPEN and not isinstance(serial, ReplayHandler),
+        )
+        self.action_set_enabled(
+            "win.run-script",
+            state == SerialHandlerState.OPEN and not isinstance(serial, ReplayHandler),
+        )
 
         # Update open button
         if state != SerialHandlerState.CLOSED:
@@ -186,7 +334,7 @@ class SerialConsoleWindow(Adw.ApplicationWindow):
             self.close_button.set_sensitive(True)
             self.open_button_switcher.set_visible_child(self.close_button)
         else:
-            self.open_button.set_sensitive(bool(self.ports.get_n_items()))
+            self.open_button.set_sensitive(self.can_open(serial))
             self.close_button.set_sensitive(False)
             self.open_button_switcher.set_visible_child(self.open_button)
 
@@ -210,6 +358,20 @@ class SerialConsoleWindow(Adw.ApplicationWindow):
 
         self.toast_overlay.add_toast(Adw.Toast.new(error_message))
 
+    def handle_trigger(self, serial, trigger: Trigger, text: str):
+        if trigger.action != TriggerAction.NOTIFY:
+            return
+        # TRANSLATORS: Default notification for triggers; do not modify the
+        # strings between the braces!
+        message = trigger.argument or _("{port}: received {text}").format(
+            port=serial.port, text=text
+        )
+        self.toast_overlay.add_toast(Adw.Toast.new(message))
+        if not self.is_active():
+            notification = Gio.Notification.new(_("Serial Console"))
+            notification.set_body(message)
+            self.get_application().send_notification("trigger", notification)
+
     @Gtk.Template.Callback()
     def open_serial(self, *args):
         self.open_button.set_sensitive(False)
@@ -221,6 +383,75 @@ class SerialConsoleWindow(Adw.ApplicationWindow):
         self.close_button.set_sensitive(False)
         self.serial.close()
 
+    # File transfer functions
+
+    def send_file(self, window, action_name, parameter):
+        """Asks for the files to send with the protocol in parameter."""
+        protocol = TransferProtocol[parameter.get_string().upper().replace("-", "_")]
+        if self.session.transfer is not None:
+            return
+
+        if protocol in (TransferProtocol.XMODEM, TransferProtocol.XMODEM_1K):
+            # XMODEM has no file names, so it can only send one file
+            self._send_file_dialog.open(
+                self, None, self.send_file_from_chooser, protocol
+            )
+        else:
+            self._send_file_dialog.open_multiple(
+                self, None, self.send_file_from_chooser, protocol
+            )
+
+    def send_file_from_chooser(
+        self, dialog: Gtk.FileDialog, result: Gio.AsyncResult, protocol
+    ):
+        try:
+            if protocol in (TransferProtocol.XMODEM, TransferProtocol.XMODEM_1K):
+                files = [dialog.open_finish(result)]
+            else:
+                files = list(dialog.open_multiple_finish(result))
+        except GLib.Error:
+            return
+
+        paths = [file.get_path() for file in files if file is not None]
+        if paths and self.session.transfer is None:
+            self.session.send_files(protocol, paths)
+
+    # Script functions
+
+    def run_script(self, *args):
+        """Asks for a script file and runs it in the current session."""
+        if self.session.script is not None:
+            return
+        self._script_dialog.open(self, None, self.run_script_from_chooser)
+
+    def run_script_from_chooser(self, dialog: Gtk.FileDialog, result: Gio.AsyncResult):
+        try:
+            file = dialog.open_finish(result)
+        except GLib.Error:
+            return
+        if file is not None and self.session.script is None:
+            self.session.run_script(file.get_path())
+
+    # Capture replay functions
+
+    def replay_capture(self, *args):
+        """Asks for a capture or log file and replays it in a new tab."""
+        self._replay_dialog.open(self, None, self.replay_capture_from_chooser)
+
+    def replay_capture_from_chooser(
+        self, dialog: Gtk.FileDialog, result: Gio.AsyncResult
+    ):
+        try:
+            file = dialog.open_finish(result)
+        except GLib.Error:
+            return
+        if file is None:
+            return
+
+        serial = ReplayHandler(file.get_path())
+        self.new_session(serial=serial)
+        serial.open()
+
     # Console handling functions
 
     @Gtk.Template.Callback()
@@ -231,44 +462,18 @@ class SerialConsoleWindow(Adw.ApplicationWindow):
     def close_sidebar(self, *args):
         self.split_view.props.show_sidebar = False
 
-    @Gtk.Template.Callback()
-    def terminal_commit(self, terminal, text, size, *args):
-        """Get input from the terminal and send it over serial."""
-        if not self.terminal.props.connected:
-            self.terminal.feed(bytes("\a", "utf-8"))
-            return
-        if config["echo"]:
-            self.terminal.feed(bytes(text, "utf-8"))
-            self.logger.write_text(text)
-        self.serial.write_text(text)
-
-    def terminal_read(self, serial, data, *args):
-        self.terminal.feed(data.get_data())
-
     def terminal_write_message(self, text):
-        """Writes an info message to the terminal."""
-        if config["disable-info-messages"]:
-            return
-
-        if (
-            self.terminal.get_text()[0] is None
-            or not self.terminal.get_text()[0].strip()
-        ):
-            self.terminal.feed(bytes(f"\r\033[0;90m--- {text} ---\r\n\033[0m", "utf-8"))
-        else:
-            self.terminal.feed(
-                bytes(f"\r\n\033[0;90m--- {text} ---\r\n\033[0m", "utf-8")
-            )
-
-        self.logger.write_text(f"\r\n--- {text} ---")
+        """Writes an info message to the terminal of the current session."""
+        self.session.terminal_write_message(text)
 
-    def set_terminal_color_scheme(self, *args):
+    def set_terminal_color_scheme(self, *args, session=None):
         """Sets up a terminal color scheme from the default colors."""
         style = self.get_style_context()
         bg = style.lookup_color("view_bg_color")[1]
         fg = style.lookup_color("view_fg_color")[1]
-        self.terminal.set_color_background(bg)
-        self.terminal.set_color_foreground(fg)
+        for _session in [session] if session else self.sessions:
+            _session.terminal.set_color_background(bg)
+            _session.terminal.set_color_foreground(fg)
 
     # When the 'dark' property on the style manager is changed, the
     # stylesheet for the new mode has not yet been loaded. Turns out,
@@ -286,9 +491,12 @@ class SerialConsoleWindow(Adw.ApplicationWindow):
 
     @Gtk.Template.Callback()
     def search_changed(self, *args):
+        if self.terminal is None:
+            return
+
         flags = PCRE2_MULTILINE
 
-        query = self.search_entry.get_text()
+        query = text = self.search_entry.get_text()
         self.search_next_button.props.sensitive = not not query
         self.search_previous_button.props.sensitive = not not query
 
@@ -304,6 +512,7 @@ class SerialConsoleWindow(Adw.ApplicationWindow):
         except GLib.Error:
             self.search_entry.add_css_class("error")
             self.prev_search_query = query
+            self.search_history(None)
             return
         else:
             self.search_entry.remove_css_class("error")
@@ -320,14 +529,85 @@ class SerialConsoleWindow(Adw.ApplicationWindow):
         self.terminal.search_find_next()
 
         self.prev_search_query = query
+        self.search_history(text)
+
+    def search_history(self, query: Optional[str]):
+        """
+        Searches the whole history of the current session for the query,
+        including what has already left the scrollback, in the background.
+        """
+        if self._history_search is not None:
+            self._history_search.cancel()
+            self._history_search = None
+        self.search_history_button.set_sensitive(False)
+
+        if not query or self.session is None:
+            self.search_count_label.set_visible(False)
+            return
+
+        try:
+            search = HistorySearch(
+                self.session.history.snapshot(),
+                query,
+                self.props.search_regex,
+                self.props.search_case_sensitive,
+                self.update_search_count,
+                self.update_search_count,
+            )
+        except re.error:
+            self.search_count_label.set_visible(False)
+            return
+        self._history_search = search
+        search.start()
+        self.update_search_count(search)
+
+    def update_search_count(self, search: HistorySearch):
+        count = f"{search.count:,}"
+        if not search.done:
+            # TRANSLATORS: {count} is the amount of matches found so far; do
+            # not modify the string between the braces!
+            label = _("Searching… {count} matches").format(count=count)
+        elif search.count == 0:
+            label = _("No matches")
+        elif search.count == 1:
+            label = _("1 match")
+        else:
+            # TRANSLATORS: {count} is the amount of matches; do not modify
+            # the string between the braces!
+            label = _("{count} matches").format(count=count)
+        self.search_count_label.set_label(label)
+        self.search_count_label.set_visible(True)
+        self.search_history_button.set_sensitive(search.done and bool(search.lines))
+
+    @Gtk.Template.Callback()
+    def show_search_in_history(self, *args):
+        """
+        Opens the history of the session in the log viewer, at the newest
+        match that is no longer in the terminal (or the newest match if all
+        of them still are).
+        """
+        search = self._history_search
+        session = self.session
+        if search is None or session is None or not search.lines:
+            return
+        position = bisect.bisect_left(search.lines, session.first_terminal_line) - 1
+        if position < 0:
+            position = len(search.lines) - 1
+        viewer = SerialConsoleLogViewer(
+            history=session.history, application=self.get_application()
+        )
+        viewer.set_matches(search.lines, position)
+        viewer.present()
 
     @Gtk.Template.Callback()
     def search_previous(self, *args):
-        self.terminal.search_find_previous()
+        if self.terminal is not None:
+            self.terminal.search_find_previous()
 
     @Gtk.Template.Callback()
     def search_next(self, *args):
-        self.terminal.search_find_next()
+        if self.terminal is not None:
+            self.terminal.search_find_next()
 
 
 @Gtk.Template(resource_path="/com/github/knuxify/SerialConsole/ui/settings-pane.ui")
@@ -349,9 +629,19 @@ class SerialConsoleSettingsPane(Gtk.Box):
     unlimited_scrollback_toggle = Gtk.Template.Child()
     disable_info_messages_toggle = Gtk.Template.Child()
     local_echo_toggle = Gtk.Template.Child()
+    filter_timestamps_toggle = Gtk.Template.Child()
+    filter_newlines_toggle = Gtk.Template.Child()
+    filter_control_chars_toggle = Gtk.Template.Child()
+
+    tx_char_delay_spinbutton = Gtk.Template.Child()
+    tx_line_delay_spinbutton = Gtk.Template.Child()
+    tx_wait_for_echo_toggle = Gtk.Template.Child()
 
     log_enable_toggle = Gtk.Template.Child()
     log_path_row = Gtk.Template.Child()
+    log_capture_toggle = Gtk.Template.Child()
+
+    stats_panel = Gtk.Template.Child()
 
     def __init__(self):
         super().__init__()
@@ -359,6 +649,12 @@ class SerialConsoleSettingsPane(Gtk.Box):
         self._needs_setup = True
         self.custom_scrollback_spinbutton.set_range(0, 10000000)
         self.custom_scrollback_spinbutton.set_increments(100, 1000)
+        for spinbutton in (
+            self.tx_char_delay_spinbutton,
+            self.tx_line_delay_spinbutton,
+        ):
+            spinbutton.set_range(0, 10000)
+            spinbutton.set_increments(1, 10)
 
         # Only allow numbers to be typed into custom baud rate field
         self.custom_baudrate.set_input_purpose(Gtk.InputPurpose.DIGITS)
@@ -380,42 +676,150 @@ class SerialConsoleSettingsPane(Gtk.Box):
                 DEFAULT_LOG_FILENAME,
             )
 
-        self.connect("realize", self._setup)
+        self.serial = None
+        self._serial_bindings = []
+        self._serial_handlers = []
 
-    def _setup(self, *args):
-        """
-        get_native returns NULL before the window is fully displayed,
-        so we need to do setup then.
-        """
+    def setup(self, window):
+        """Sets up the pane for the window it is in."""
         if not self._needs_setup:
             return
 
-        self.serial = self.get_native().serial
+        self.ports = window.ports
+        self.setup_port_selector()
 
-        self.ports = self.get_native().ports
-        self.port_selector.set_model(self.ports)
+        self.setup_settings_bindings()
 
-        title = self.get_native().console_header.get_title_widget()
-        self.bind_property(
-            "port_display",
-            title,
-            "subtitle",
-            GObject.BindingFlags.BIDIRECTIONAL | GObject.BindingFlags.SYNC_CREATE,
+        self._needs_setup = False
+
+    def setup_port_selector(self):
+        """
+        Sets up the port selector to show ports by their description, with
+        their device path and USB identity in the dropdown, and to search
+        them by all of these.
+        """
+        self.port_selector.set_model(self.ports)
+        self.port_selector.set_expression(
+            Gtk.PropertyExpression.new(PortInfo, None, "search-text")
         )
-        self.serial.connect("notify::port", lambda *args: self.notify("port-display"))
-        self.serial.connect("notify::state", lambda *args: self.notify("port-display"))
+        self.port_selector.set_enable_search(True)
+        if Adw.get_minor_version() >= 6:
+            self.port_selector.set_search_match_mode(
+                Gtk.StringFilterMatchMode.SUBSTRING
+            )
 
-        self.setup_settings_bindings()
+        factory = Gtk.SignalListItemFactory()
+        factory.connect("setup", self.setup_port_item, False)
+        factory.connect("bind", self.bind_port_item)
+        self.port_selector.set_factory(factory)
+
+        list_factory = Gtk.SignalListItemFactory()
+        list_factory.connect("setup", self.setup_port_item, True)
+        list_factory.connect("bind", self.bind_port_item)
+        self.port_selector.set_list_factory(list_factory)
+
+    def setup_port_item(self, factory, item, with_subtitle):
+        box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL)
+        title = Gtk.Label(xalign=0, ellipsize=Pango.EllipsizeMode.END)
+        box.append(title)
+        if with_subtitle:
+            subtitle = Gtk.Label(xalign=0, ellipsize=Pango.EllipsizeMode.END)
+            subtitle.add_css_class("caption")
+            subtitle.add_css_class("dim-label")
+            box.append(subtitle)
+        item.set_child(box)
+
+    def bind_port_item(self, factory, item):
+        port = item.get_item()
+        title = item.get_child().get_first_child()
+        title.set_label(port.title)
+        subtitle = title.get_next_sibling()
+        if subtitle is not None:
+            subtitle.set_label(port.subtitle)
+        item.get_child().set_tooltip_text(port.by_id or None)
+
+    def set_session(self, session):
+        """Makes the pane show and edit the settings of the given session."""
+        if self.serial is not None:
+            for binding in self._serial_bindings:
+                binding.unbind()
+            for handler in self._serial_handlers:
+                self.serial.disconnect(handler)
+            for property in SERIAL_CONFIG_PROPERTIES:
+                Gio.Settings.unbind(self.serial, property)
+        self._serial_bindings = []
+        self._serial_handlers = []
+
+        self.serial = session.serial
+        self.stats_panel.set_session(session)
+
+        # Update the selectors to match the session's settings
+        self._ignore_port_change = True
+        i = self.ports.find(self.serial.port)
+        if i >= 0:
+            self.port_selector.set_selected(i)
+        self._ignore_port_change = False
 
-        self._needs_setup = False
+        self.set_baudrate_selector(self.serial.baud_rate)
 
-    @GObject.Property(type=str)
-    def port_display(self):
-        if self.serial.state != SerialHandlerState.CLOSED:
-            return self.serial.port
+        selectors = {
+            "data-bits": self.data_bits_selector,
+            "stop-bits": self.stop_bits_selector,
+        }
+        for property, selector in selectors.items():
+            i = find_in_stringlist(
+                selector.get_model(), str(self.serial.get_property(property))
+            )
+            if i < 0:
+                i = 0
+            selector.set_selected(i)
 
-        # TRANSLATORS: Default window caption when no console is connected
-        return _("(Not connected)")
+        # Enum properties need to be handled separately, else they
+        # end up syncing the *strings*, not the *IDs*:
+        enums = {
+            "parity": self.parity_selector,
+            "flow-control": self.flow_control_selector,
+        }
+        for property, selector in enums.items():
+            self._serial_bindings.append(
+                self.serial.bind_property(
+                    property,
+                    selector,
+                    "selected",
+                    GObject.BindingFlags.BIDIRECTIONAL
+                    | GObject.BindingFlags.SYNC_CREATE,
+                )
+            )
+            self._serial_handlers.append(
+                self.serial.connect(
+                    "notify::" + property,
+                    lambda *args, prop=property: self.notify(prop + "-str"),
+                )
+            )
+            self.notify(property + "-str")
+
+        # The settings of the current session are stored in the config,
+        # so that new sessions (and the next launch) start with them.
+        # Replays have no port worth remembering.
+        if isinstance(self.serial, ReplayHandler):
+            return
+        for property in SERIAL_CONFIG_PROPERTIES:
+            config.bind(
+                property, self.serial, property, flags=Gio.SettingsBindFlags.SET
+            )
+
+    def set_baudrate_selector(self, baud_rate: int):
+        """Selects the given baud rate in the baud rate selector."""
+        baudrate_model = self.baudrate_selector.get_model()
+        for i in range(baudrate_model.get_n_items()):
+            rate = baudrate_model.get_item(i).get_string()
+            try:
+                if int(rate) == baud_rate:
+                    self.baudrate_selector.set_selected(i)
+                    break
+            except ValueError:  # custom
+                self.custom_baudrate.set_text(str(baud_rate))
+                self.baudrate_selector.set_selected(i)
 
     def setup_settings_bindings(self):
         config.bind(
@@ -425,84 +829,20 @@ class SerialConsoleSettingsPane(Gtk.Box):
             flags=Gio.SettingsBindFlags.DEFAULT,
         )
 
-        # baud-rate is not included here, as its selector is set up separately.
-        # We don't do bindings here since each selector has its own "set from
-        # selector" function (and it wouldn't be possible since we need to
-        # convert from string to int first anyways).
-        params = {
-            "port": ("selector", self.port_selector),
-            "data-bits": ("selector", self.data_bits_selector),
-            "stop-bits": ("selector", self.stop_bits_selector),
-        }
-
-        # Serial parameters are directly synced to config:
-        for property in ("port", "baud-rate", "data-bits", "stop-bits"):
-            if property == "port":
-                # For ports, there is no guarantee that the last used
-                # port will be available, so we set the available port
-                # if and only if it's actually available; otherwise we
-                # get the first item in the model.
-                ports = [p.get_string() for p in self.get_native().ports]
-                if config["port"] in ports:
-                    port = config["port"]
-                elif ports:
-                    port = ports[0]
-                    config["port"] = port
-                else:
-                    port = ""
-                    config["port"] = port
-                self.serial.port = port
-            else:
-                self.serial.set_property(property, config[property])
-
-            config.bind(
-                property, self.serial, property, flags=Gio.SettingsBindFlags.DEFAULT
-            )
-
-            if property in params:
-                if params[property][0] == "selector":
-                    selector = params[property][1]
-                    i = find_in_stringlist(selector.get_model(), str(config[property]))
-                    if i < 0:
-                        i = 0
-                    selector.set_selected(i)
-
-        # Enum properties need to be handled separately, else they
-        # end up syncing the *strings*, not the *IDs*:
+        # Serial parameters are synced to the config in set_session; enum
+        # selectors get their items and string conversion wrappers here.
         enums = {
             "parity": (Parity, self.parity_selector),
             "flow-control": (FlowControl, self.flow_control_selector),
         }
 
         for property in ("parity", "flow-control"):
-            self.serial.set_property(property, config.get_enum(property))
-
             config.bind(
                 property, self, property + "-str", flags=Gio.SettingsBindFlags.DEFAULT
             )
 
             selector = enums[property][1]
             selector.set_model(enum_to_stringlist(enums[property][0]))
-            selector.bind_property(
-                "selected", self.serial, property, GObject.BindingFlags.BIDIRECTIONAL
-            )
-            selector.set_selected(config.get_enum(property))
-            self.serial.connect(
-                "notify::" + property,
-                lambda *args, prop=property: self.notify(prop + "-str"),
-            )
-
-        # Set up baud rate selector
-        baudrate_model = self.baudrate_selector.get_model()
-        for i in range(baudrate_model.get_n_items()):
-            rate = baudrate_model.get_item(i).get_string()
-            try:
-                if int(rate) == config["baud-rate"]:
-                    self.baudrate_selector.set_selected(i)
-                    break
-            except ValueError:  # custom
-                self.custom_baudrate.set_text(str(config["baud-rate"]))
-                self.baudrate_selector.set_selected(i)
 
         # Terminal settings
         config.bind(
@@ -517,13 +857,6 @@ class SerialConsoleSettingsPane(Gtk.Box):
             "active",
             flags=Gio.SettingsBindFlags.DEFAULT,
         )
-        self.custom_scrollback_spinbutton.connect(
-            "value-changed", self.update_scrollback_from_pane
-        )
-        self.unlimited_scrollback_toggle.connect(
-            "notify::active", self.update_scrollback_from_pane
-        )
-        self.update_scrollback_from_pane()
 
         config.bind(
             "disable-info-messages",
@@ -539,6 +872,34 @@ class SerialConsoleSettingsPane(Gtk.Box):
             flags=Gio.SettingsBindFlags.DEFAULT,
         )
 
+        for key in ("timestamps", "newlines", "control-chars"):
+            config.bind(
+                f"filter-{key}",
+                getattr(self, f"filter_{key.replace('-', '_')}_toggle"),
+                "active",
+                flags=Gio.SettingsBindFlags.DEFAULT,
+            )
+
+        # Transmit settings
+        config.bind(
+            "tx-char-delay",
+            self.tx_char_delay_spinbutton,
+            "value",
+            flags=Gio.SettingsBindFlags.DEFAULT,
+        )
+        config.bind(
+            "tx-line-delay",
+            self.tx_line_delay_spinbutton,
+            "value",
+            flags=Gio.SettingsBindFlags.DEFAULT,
+        )
+        config.bind(
+            "tx-wait-for-echo",
+            self.tx_wait_for_echo_toggle,
+            "active",
+            flags=Gio.SettingsBindFlags.DEFAULT,
+        )
+
         # Logging settings
         config.bind(
             "log-enable",
@@ -556,29 +917,36 @@ class SerialConsoleSettingsPane(Gtk.Box):
 
         self.log_path_row.set_subtitle(config["log-path"])
 
-    def update_scrollback_from_pane(self, *args):
-        if config["unlimited-scrollback"]:
-            self.get_native().terminal.set_scrollback_lines(-1)
-        else:
-            self.get_native().terminal.set_scrollback_lines(config["scrollback"])
+        config.bind(
+            "log-capture",
+            self.log_capture_toggle,
+            "active",
+            flags=Gio.SettingsBindFlags.DEFAULT,
+        )
 
     @GObject.Property(type=str)
     def parity_str(self):
         """Workaround to allow us to sync settings."""
+        if self.serial is None:
+            return to_enum_str(Parity, Parity.NONE)
         return to_enum_str(Parity, self.serial.parity)
 
     @parity_str.setter
     def parity_str(self, value):
-        self.serial.parity = from_enum_str(Parity, value)
+        if self.serial is not None:
+            self.serial.parity = from_enum_str(Parity, value)
 
     @GObject.Property(type=str)
     def flow_control_str(self):
         """Workaround to allow us to sync settings."""
+        if self.serial is None:
+            return to_enum_str(FlowControl, FlowControl.NONE)
         return to_enum_str(FlowControl, self.serial.flow_control)
 
     @flow_control_str.setter
     def flow_control_str(self, value):
-        self.serial.flow_control = from_enum_str(FlowControl, value)
+        if self.serial is not None:
+            self.serial.flow_control = from_enum_str(FlowControl, value)
 
     @Gtk.Template.Callback()
     def set_port_from_selector(self, selector, *args):
@@ -586,10 +954,14 @@ class SerialConsoleSettingsPane(Gtk.Box):
             return
 
         try:
-            port = selector.get_selected_item().get_string()
+            port = selector.get_selected_item().device
         except AttributeError:
             return
-        if port == self.serial.port:
+        if self.serial is None or self.ports.find(self.serial.port) == (
+            selector.get_selected()
+        ):
+            return
+        if isinstance(self.serial, ReplayHandler):
             return
         self.serial.port = port
 
@@ -598,6 +970,8 @@ class SerialConsoleSettingsPane(Gtk.Box):
 
     @Gtk.Template.Callback()
     def set_baudrate_from_selector(self, *args):
+        if self.serial is None:
+            return
         # This is called for both the selector and updates on the custom
         # baudrate, so we ignore the passed selector value.
         try:
@@ -613,10 +987,14 @@ class SerialConsoleSettingsPane(Gtk.Box):
 
     @Gtk.Template.Callback()
     def set_data_bits_from_selector(self, selector, *args):
+        if self.serial is None:
+            return
         self.serial.data_bits = int(selector.get_selected_item().get_string())
 
     @Gtk.Template.Callback()
     def set_stop_bits_from_selector(self, selector, *args):
+        if self.serial is None:
+            return
         self.serial.stop_bits = int(selector.get_selected_item().get_string())
 
     @Gtk.Template.Callback()
@@ -640,8 +1018,15 @@ class SerialConsoleSettingsPane(Gtk.Box):
 
     @Gtk.Template.Callback()
     def open_log_file(self, *args):
-        """Opens the log file in the default text editor."""
-        Gio.AppInfo.launch_default_for_uri(GLib.filename_to_uri(config["log-path"]))
+        """Opens the log file in the log viewer."""
+        path = get_session_log_path(
+            config["log-path"], self.get_native().session.log_index
+        )
+        if config["log-capture"]:
+            path = get_capture_path(path)
+        SerialConsoleLogViewer(
+            path, application=self.get_native().get_application()
+        ).present()
 
     @Gtk.Template.Callback()
     def reset_console(self, *args):
@@ -0,0 +1,29 @@
+"""
+Shared setup for the tests, which run straight from the source tree, with
+the settings schema from it, just like the benchmarks (see
+benchmarks/common.py):
+
+    python3 -m pytest tests
+
+Tests that need PyGObject are skipped if it is not installed.
+"""
+
+import os
+import sys
+
+sys.path.insert(
+    0,
+    os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"
+    ),
+)
+
+try:
+    import gi  # noqa: F401
+except ImportError:
+    pass
+else:
+    from common import load_package, use_source_schema
+
+    use_source_schema()
+    load_package()
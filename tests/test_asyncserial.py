@@ -0,0 +1,48 @@
+"""
+Tests for the asyncio-based serial session, driven through a pseudo-terminal.
+"""
+
+import asyncio
+import os
+import tty
+
+import pytest
+
+pytest.importorskip("gi")
+
+from serialconsole.asyncserial import AsyncSerialSession  # noqa: E402
+from serialconsole.portsettings import PortSettings  # noqa: E402
+
+
+@pytest.fixture
+def pty():
+    """Yields the path of a pseudo-terminal, and the file descriptor of its far end."""
+    master, slave = os.openpty()
+    tty.setraw(master)
+    yield os.ttyname(slave), master
+    os.close(slave)
+    os.close(master)
+
+
+async def run_session(pty, limit: int, data: bytes, func):
+    """Opens a session, sends data from the far end and runs func on the session."""
+    path, master = pty
+    # Small reads, so that the limit is reached before all data is read
+    session = AsyncSerialSession(PortSettings(path), read_chunk_size=8, limit=limit)
+    async with session:
+        os.write(master, data)
+        return await asyncio.wait_for(func(session), 5)
+
+
+def test_readuntil_limit_reached_exactly(pty):
+    with pytest.raises(asyncio.LimitOverrunError):
+        asyncio.run(
+            run_session(pty, 16, b"x" * 16, lambda session: session.readuntil(b"\n"))
+        )
+
+
+def test_readexactly_more_than_limit(pty):
+    data = asyncio.run(
+        run_session(pty, 16, b"x" * 64, lambda session: session.readexactly(64))
+    )
+    assert data == b"x" * 64
@@ -0,0 +1,25 @@
+"""
+Tests for the ring buffer's overflow policies.
+"""
+
+import pytest
+
+pytest.importorskip("gi")
+
+from serialconsole.buffer import OverflowPolicy, RingBuffer  # noqa: E402
+
+
+def test_spill_returns_overflow_without_dropping():
+    buffer = RingBuffer(4, OverflowPolicy.SPILL)
+    assert buffer.write(b"ab") == b""
+    assert buffer.write(b"cdef") == b"ef"
+    assert buffer.dropped == 0
+    assert buffer.read_all() == b"abcd"
+
+
+def test_drop_oldest_counts_dropped():
+    buffer = RingBuffer(4, OverflowPolicy.DROP_OLDEST)
+    buffer.write(b"ab")
+    assert buffer.write(b"cdef") == b""
+    assert buffer.dropped == 2
+    assert buffer.read_all() == b"cdef"
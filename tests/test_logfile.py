@@ -0,0 +1,81 @@
+"""
+Tests for the log writer's handling of a full queue, and of closing.
+"""
+
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("gi")
+
+from serialconsole.capture import RecordKind, iter_records  # noqa: E402
+from serialconsole.logfile import CaptureFile, LogOverflowPolicy, LogWriter  # noqa: E402
+
+
+class StalledCaptureFile(CaptureFile):
+    """A capture file whose writes wait while resume is cleared."""
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.resume = threading.Event()
+        self.resume.set()
+
+    def write_records(self, records: list):
+        self.resume.wait()
+        super().write_records(records)
+
+
+@pytest.fixture
+def stalled_writer(tmp_path):
+    file = StalledCaptureFile(str(tmp_path / "capture.sccap"))
+    writer = LogWriter(file, queue_size=16, overflow_policy=LogOverflowPolicy.BLOCK)
+    writer.open()
+    file.resume.clear()
+    # The first record is taken by the writer thread, which then stalls;
+    # the second one fills the queue
+    writer.write_record(RecordKind.RX, time.monotonic_ns(), b"x" * 16)
+    deadline = time.monotonic() + 5
+    while writer.queued:
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.001)
+    writer.write_record(RecordKind.RX, time.monotonic_ns(), b"x" * 16)
+    yield writer
+    file.resume.set()
+    writer.close()
+
+
+def test_write_record_never_blocks(stalled_writer):
+    """Records come from the I/O threads, so they are dropped rather than waited for."""
+    elapsed = []
+
+    def write():
+        start = time.monotonic()
+        stalled_writer.write_record(RecordKind.RX, time.monotonic_ns(), b"y" * 8)
+        elapsed.append(time.monotonic() - start)
+
+    thread = threading.Thread(target=write)
+    thread.start()
+    thread.join()
+    assert elapsed[0] < 0.5
+    assert stalled_writer.dropped == 8
+
+
+def test_close_does_not_wait_for_writer(stalled_writer):
+    start = time.monotonic()
+    assert not stalled_writer.close(0)
+    assert time.monotonic() - start < 0.5
+
+    # A new writer for the same file waits for the closed one to finish
+    writer = LogWriter(CaptureFile(stalled_writer.path))
+    writer.open(stalled_writer)
+    writer.write_record(RecordKind.RX, time.monotonic_ns(), b"new")
+    stalled_writer.log.resume.set()
+    assert writer.close(5)
+    with open(stalled_writer.path, "rb") as file:
+        payloads = [
+            bytes(payload)
+            for _offset, kind, _timestamp, payload in iter_records(file)
+            if kind == RecordKind.RX
+        ]
+    assert payloads == [b"x" * 16, b"x" * 16, b"new"]
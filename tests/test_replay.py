@@ -0,0 +1,45 @@
+"""
+Tests for replaying captures through the read path.
+"""
+
+import time
+
+import pytest
+
+pytest.importorskip("gi")
+
+from serialconsole.buffer import OverflowPolicy  # noqa: E402
+from serialconsole.capture import RecordKind  # noqa: E402
+from serialconsole.filters import ControlCharFilter  # noqa: E402
+from serialconsole.logfile import CaptureFile  # noqa: E402
+from serialconsole.replay import ReplayHandler  # noqa: E402
+
+from test_serial import run_main_loop  # noqa: E402
+
+
+def test_expanding_filter_does_not_drop_replayed_data(tmp_path):
+    path = str(tmp_path / "capture.sccap")
+    capture = CaptureFile(path)
+    capture.open()
+    start = time.monotonic_ns()
+    capture.write_records(
+        [(RecordKind.RX, start + i * 1000, b"\x01" * 1000) for i in range(10)]
+    )
+    capture.close()
+
+    # Every control character becomes a three-byte Control Picture, so the
+    # filtered data does not fit into the space the records were sized to.
+    handler = ReplayHandler(path)
+    handler.speed = 0
+    handler.read_buffer_size = 4096
+    handler.read_overflow_policy = OverflowPolicy.DROP_OLDEST
+    handler.filters.set_stages([ControlCharFilter()])
+    received = bytearray()
+    handler.connect("read_done", lambda handler, data: received.extend(data.get_data()))
+    handler.open()
+    try:
+        run_main_loop(lambda: len(received) >= 10000 * 3)
+    finally:
+        handler.close()
+    assert bytes(received) == "␁".encode() * 10000
+    assert handler.read_dropped_bytes == 0
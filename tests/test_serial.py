@@ -0,0 +1,104 @@
+"""
+Tests for the serial handler's read path, driven through a pseudo-terminal.
+"""
+
+import os
+import time
+import tty
+
+import pytest
+
+pytest.importorskip("gi")
+from gi.repository import GLib  # noqa: E402
+
+from serialconsole.buffer import OverflowPolicy  # noqa: E402
+from serialconsole.filters import ControlCharFilter  # noqa: E402
+from serialconsole.reactor import get_reactor  # noqa: E402
+from serialconsole.serial import SerialHandler  # noqa: E402
+
+
+def run_main_loop(until, timeout: float = 5):
+    """Iterates the main loop until until() returns True."""
+    context = GLib.MainContext.default()
+    deadline = time.monotonic() + timeout
+    while not until():
+        assert time.monotonic() < deadline, "timed out"
+        context.iteration(False)
+        time.sleep(0.001)
+
+
+@pytest.fixture
+def device():
+    """Yields a handler on a pseudo-terminal, and the file descriptor of its far end."""
+    master, slave = os.openpty()
+    tty.setraw(master)
+    os.set_blocking(master, False)
+    handler = SerialHandler()
+    handler.port = os.ttyname(slave)
+    yield handler, master
+    handler.close()
+    os.close(slave)
+    os.close(master)
+
+
+def write_all(fd: int, data: bytes, timeout: float = 5):
+    deadline = time.monotonic() + timeout
+    while data:
+        try:
+            data = data[os.write(fd, data) :]
+        except BlockingIOError:
+            assert time.monotonic() < deadline, "timed out"
+            time.sleep(0.001)
+
+
+def test_expanding_filter_does_not_block_reactor(device):
+    # Every control character becomes a three-byte Control Picture, so the
+    # filtered data is larger than the space the reads were sized to.
+    handler, master = device
+    handler.read_buffer_size = 4096
+    handler.read_overflow_policy = OverflowPolicy.BLOCK
+    handler.filters.set_stages([ControlCharFilter()])
+    received = bytearray()
+    handler.connect("read_done", lambda handler, data: received.extend(data.get_data()))
+    handler.open()
+
+    sent = b"\x01" * 3000
+    write_all(master, sent)
+    # Without the main loop running, the read buffer fills up, and the
+    # reactor has to hold on to the rest rather than wait for space.
+    time.sleep(0.2)
+    start = time.monotonic()
+    get_reactor().run_sync(lambda: None)
+    assert time.monotonic() - start < 0.5
+
+    run_main_loop(lambda: len(received) >= len(sent) * 3)
+    assert bytes(received) == "␁".encode() * len(sent)
+
+    start = time.monotonic()
+    handler.close()
+    assert time.monotonic() - start < 0.5
+
+
+def test_spilled_data_is_not_counted_as_dropped(device):
+    handler, master = device
+    handler.read_buffer_size = 16
+    handler.read_overflow_policy = OverflowPolicy.SPILL
+    received = bytearray()
+    spilled = bytearray()
+    handler.connect("read_done", lambda handler, data: received.extend(data.get_data()))
+    handler.connect(
+        "read_spilled", lambda handler, data: spilled.extend(data.get_data())
+    )
+    handler.open()
+
+    sent = bytes(range(256)) * 4
+    write_all(master, sent)
+    # Without the main loop running, most of the data does not fit into
+    # the read buffer and is spilled.
+    time.sleep(0.2)
+    run_main_loop(lambda: len(received) + len(spilled) >= len(sent))
+
+    assert len(received) + len(spilled) == len(sent)
+    assert spilled
+    assert handler.read_dropped_bytes == 0
+    assert handler.read_spilled_bytes == len(spilled)